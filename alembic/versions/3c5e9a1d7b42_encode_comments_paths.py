@@ -0,0 +1,42 @@
+"""Encode comments paths
+
+Revision ID: 3c5e9a1d7b42
+Revises: b0131a4d1cf3
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+from db_backend.path_worker import PathWorker
+
+# revision identifiers, used by Alembic.
+revision = '3c5e9a1d7b42'
+down_revision = 'b0131a4d1cf3'
+branch_labels = None
+depends_on = None
+
+comments = sa.table('comments',
+                    sa.column('id', sa.Integer),
+                    sa.column('path', sa.String))
+
+
+def _convert_paths(converter):
+    """Rewrite every comment path with converter function"""
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(comments.c.id, comments.c.path)).all()
+    updates = [{'comment_id': row.id, 'new_path': converter(row.path)}
+               for row in rows]
+    if updates:
+        bind.execute(comments.update()
+                     .where(comments.c.id == sa.bindparam('comment_id'))
+                     .values(path=sa.bindparam('new_path')),
+                     updates)
+
+
+def upgrade():
+    _convert_paths(PathWorker.encode)
+
+
+def downgrade():
+    _convert_paths(PathWorker.decode)
@@ -0,0 +1,23 @@
+"""Added comments url_id and id index
+
+Revision ID: 4f1c8a6e3b92
+Revises: 9e5f2a7b4d18
+Create Date: 2026-10-18 23:48:51.270694
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '4f1c8a6e3b92'
+down_revision = '9e5f2a7b4d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves selecting comments of URL added after the last seen one
+    op.create_index('ix_comments_url_id_id', 'comments', ['url_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_comments_url_id_id', table_name='comments')
@@ -0,0 +1,69 @@
+"""Added child_counters table
+
+Revision ID: 5a7c1e9f2b64
+Revises: 8d2f4b6a0e13
+Create Date: 2026-10-18 12:21:05.734112
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+from db_backend.path_worker import PathWorker
+
+# revision identifiers, used by Alembic.
+revision = '5a7c1e9f2b64'
+down_revision = '8d2f4b6a0e13'
+branch_labels = None
+depends_on = None
+
+comments = sa.table('comments',
+                    sa.column('id', sa.Integer),
+                    sa.column('path', sa.String),
+                    sa.column('url_id', sa.Integer),
+                    sa.column('parent_id', sa.Integer),
+                    sa.column('last', sa.BOOLEAN))
+
+
+def upgrade():
+    child_counters = op.create_table(
+        'child_counters',
+        sa.Column('url_id', sa.Integer(), nullable=False),
+        sa.Column('parent_id', sa.Integer(), nullable=False),
+        sa.Column('last_child', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['url_id'], ['urls.id'], ),
+        sa.PrimaryKeyConstraint('url_id', 'parent_id')
+    )
+    op.create_index('ix_comments_url_id_path', 'comments',
+                    ['url_id', 'path'], unique=False)
+
+    # Counters start from the biggest number used on each comments level,
+    # comments with these numbers are the last ones on their levels
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(comments.c.id, comments.c.path,
+                                  comments.c.url_id,
+                                  comments.c.parent_id)).all()
+    counters = {}
+    last_comments = {}
+    for row in rows:
+        key = (row.url_id, row.parent_id or 0)
+        number = PathWorker.decode_node(row.path.split('.')[-1])
+        if number > counters.get(key, 0):
+            counters[key] = number
+            last_comments[key] = row.id
+
+    if counters:
+        op.bulk_insert(child_counters,
+                       [{'url_id': url_id, 'parent_id': parent_id,
+                         'last_child': last_child}
+                        for (url_id, parent_id), last_child
+                        in counters.items()])
+    bind.execute(comments.update().values(last=False))
+    if last_comments:
+        bind.execute(comments.update()
+                     .where(comments.c.id.in_(last_comments.values()))
+                     .values(last=True))
+
+
+def downgrade():
+    op.drop_index('ix_comments_url_id_path', table_name='comments')
+    op.drop_table('child_counters')
@@ -0,0 +1,42 @@
+"""Added comments full-text index
+
+Revision ID: 6b3d9f1a2c7e
+Revises: a4c8e1f2d3b5
+Create Date: 2026-10-18 22:14:09.502731
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6b3d9f1a2c7e'
+down_revision = 'a4c8e1f2d3b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Index takes text from comments table, triggers keep it in sync
+    op.execute("CREATE VIRTUAL TABLE comments_fts USING fts5("
+               "comment, content='comments', content_rowid='id')")
+    op.execute("CREATE TRIGGER comments_fts_insert AFTER INSERT ON comments "
+               "BEGIN "
+               "INSERT INTO comments_fts(rowid, comment) "
+               "VALUES (new.id, new.comment); END")
+    op.execute("CREATE TRIGGER comments_fts_delete AFTER DELETE ON comments "
+               "BEGIN "
+               "INSERT INTO comments_fts(comments_fts, rowid, comment) "
+               "VALUES ('delete', old.id, old.comment); END")
+    op.execute("CREATE TRIGGER comments_fts_update "
+               "AFTER UPDATE OF comment ON comments BEGIN "
+               "INSERT INTO comments_fts(comments_fts, rowid, comment) "
+               "VALUES ('delete', old.id, old.comment); "
+               "INSERT INTO comments_fts(rowid, comment) "
+               "VALUES (new.id, new.comment); END")
+    op.execute("INSERT INTO comments_fts(comments_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute('DROP TRIGGER comments_fts_update')
+    op.execute('DROP TRIGGER comments_fts_delete')
+    op.execute('DROP TRIGGER comments_fts_insert')
+    op.execute('DROP TABLE comments_fts')
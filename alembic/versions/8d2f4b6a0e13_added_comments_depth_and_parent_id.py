@@ -0,0 +1,66 @@
+"""Added comments depth and parent_id
+
+Revision ID: 8d2f4b6a0e13
+Revises: 3c5e9a1d7b42
+Create Date: 2026-10-18 11:03:27.591840
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+from db_backend.path_worker import PathWorker
+
+# revision identifiers, used by Alembic.
+revision = '8d2f4b6a0e13'
+down_revision = '3c5e9a1d7b42'
+branch_labels = None
+depends_on = None
+
+comments = sa.table('comments',
+                    sa.column('id', sa.Integer),
+                    sa.column('path', sa.String),
+                    sa.column('url_id', sa.Integer),
+                    sa.column('parent_id', sa.Integer),
+                    sa.column('depth', sa.Integer))
+
+
+def upgrade():
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(),
+                                      nullable=True))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_comments_parent_id_comments',
+                                    'comments', ['parent_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_comments_parent_id'),
+                              ['parent_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_comments_depth'), ['depth'],
+                              unique=False)
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(comments.c.id, comments.c.path,
+                                  comments.c.url_id)).all()
+    ids = {(row.url_id, row.path): row.id for row in rows}
+    updates = []
+    for row in rows:
+        dot_index = row.path.rfind('.')
+        parent_id = (ids.get((row.url_id, row.path[:dot_index]))
+                     if dot_index != -1 else None)
+        updates.append({'comment_id': row.id,
+                        'new_parent_id': parent_id,
+                        'new_depth': PathWorker.depth(row.path)})
+    if updates:
+        bind.execute(comments.update()
+                     .where(comments.c.id == sa.bindparam('comment_id'))
+                     .values(parent_id=sa.bindparam('new_parent_id'),
+                             depth=sa.bindparam('new_depth')),
+                     updates)
+
+
+def downgrade():
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_comments_depth'))
+        batch_op.drop_index(batch_op.f('ix_comments_parent_id'))
+        batch_op.drop_constraint('fk_comments_parent_id_comments',
+                                 type_='foreignkey')
+        batch_op.drop_column('depth')
+        batch_op.drop_column('parent_id')
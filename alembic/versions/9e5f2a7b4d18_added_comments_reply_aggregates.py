@@ -0,0 +1,42 @@
+"""Added comments reply aggregates
+
+Revision ID: 9e5f2a7b4d18
+Revises: 6b3d9f1a2c7e
+Create Date: 2026-10-18 23:02:37.864120
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9e5f2a7b4d18'
+down_revision = '6b3d9f1a2c7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(),
+                                      nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('last_activity', sa.Float(),
+                                      nullable=True))
+
+    # Inheritors of comment are the range of paths starting with its path
+    # and separator
+    inheritors = ('FROM comments AS inheritor '
+                  'WHERE inheritor.url_id = comments.url_id '
+                  "AND inheritor.path >= comments.path || '.' "
+                  "AND inheritor.path < comments.path || '/'")
+    op.execute(f'UPDATE comments SET '
+               f'reply_count = (SELECT count(*) {inheritors}), '
+               f'last_activity = (SELECT max(inheritor.date) {inheritors})')
+
+
+def downgrade():
+    # Copying the table would drop full-text index triggers of comments,
+    # columns are dropped in place instead
+    with op.batch_alter_table('comments', recreate='never') as batch_op:
+        batch_op.drop_column('last_activity')
+        batch_op.drop_column('reply_count')
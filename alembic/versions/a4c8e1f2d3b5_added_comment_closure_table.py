@@ -0,0 +1,47 @@
+"""Added comment_closure table
+
+Revision ID: a4c8e1f2d3b5
+Revises: e2a9d7c4b8f1
+Create Date: 2026-10-18 21:05:43.118264
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a4c8e1f2d3b5'
+down_revision = 'e2a9d7c4b8f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'comment_closure',
+        sa.Column('ancestor', sa.Integer(), nullable=False),
+        sa.Column('descendant', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor'], ['comments.id'], ),
+        sa.ForeignKeyConstraint(['descendant'], ['comments.id'], ),
+        sa.PrimaryKeyConstraint('ancestor', 'descendant')
+    )
+    op.create_index('ix_comment_closure_descendant_depth', 'comment_closure',
+                    ['descendant', 'depth'])
+
+    # Every comment is its own ancestor, ancestors of parent are ancestors
+    # of its inheritors one level further
+    op.execute('WITH RECURSIVE closure(ancestor, descendant, depth) AS ('
+               'SELECT id, id, 0 FROM comments '
+               'UNION ALL '
+               'SELECT closure.ancestor, comments.id, closure.depth + 1 '
+               'FROM closure JOIN comments '
+               'ON comments.parent_id = closure.descendant) '
+               'INSERT INTO comment_closure (ancestor, descendant, depth) '
+               'SELECT ancestor, descendant, depth FROM closure')
+
+
+def downgrade():
+    op.drop_index('ix_comment_closure_descendant_depth',
+                  table_name='comment_closure')
+    op.drop_table('comment_closure')
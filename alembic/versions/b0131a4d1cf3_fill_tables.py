@@ -5,10 +5,9 @@ Revises: f7839842e7ee
 Create Date: 2022-01-25 00:00:33.716993
 
 """
-from sqlalchemy import orm
+import sqlalchemy as sa
 
 from alembic import op
-from db_backend.db_table import CommentsDB, URLsDB, UserDB
 
 # revision identifiers, used by Alembic.
 revision = 'b0131a4d1cf3'
@@ -16,46 +15,45 @@ down_revision = 'f7839842e7ee'
 branch_labels = None
 depends_on = None
 
+# Tables as they are at this revision, ORM models in db_backend follow
+# the latest schema and can't be used to fill the tables here
+users = sa.table('users',
+                 sa.column('id', sa.Integer),
+                 sa.column('user', sa.String))
+
+urls = sa.table('urls',
+                sa.column('id', sa.Integer),
+                sa.column('url', sa.String))
+
+comments = sa.table('comments',
+                    sa.column('id', sa.Integer),
+                    sa.column('path', sa.String),
+                    sa.column('user_id', sa.Integer),
+                    sa.column('url_id', sa.Integer),
+                    sa.column('comment', sa.String),
+                    sa.column('date', sa.Float),
+                    sa.column('last', sa.BOOLEAN))
+
 
 def upgrade():
-    bind = op.get_bind()
-    session = orm.Session(bind=bind)
-
-    user_first = UserDB(user='Anakin')
-    user_second = UserDB(user='Luke')
-
-    url_first = URLsDB(url='url_1')
-    url_second = URLsDB(url='url_2')
-
-    comment_1 = CommentsDB(path='1', user_id=1, url_id=1,
-                           comment='first comment',
-                           date=150.0,
-                           last=False)
-
-    comment_2 = CommentsDB(path='1.1', user_id=1, url_id=1,
-                           comment='1.1 comment',
-                           date=15.0,
-                           last=False)
-
-    comment_3 = CommentsDB(path='1.2', user_id=2, url_id=1,
-                           comment='1.2 comment',
-                           date=14.0,
-                           last=True)
-
-    comment_4 = CommentsDB(path='2', user_id=2, url_id=2,
-                           comment='second comment',
-                           date=150.0,
-                           last=True)
-
-    comment_5 = CommentsDB(path='1.1.1', user_id=2, url_id=1,
-                           comment='1.1.1 comment',
-                           date=150.0,
-                           last=True)
-
-    session.add_all([user_first, user_second, url_first, url_second,
-                     comment_1, comment_2, comment_3, comment_4, comment_5])
-    session.flush()
-    session.commit()
+    op.bulk_insert(users, [{'user': 'Anakin'},
+                           {'user': 'Luke'}])
+
+    op.bulk_insert(urls, [{'url': 'url_1'},
+                          {'url': 'url_2'}])
+
+    op.bulk_insert(comments, [
+        {'path': '1', 'user_id': 1, 'url_id': 1,
+         'comment': 'first comment', 'date': 150.0, 'last': False},
+        {'path': '1.1', 'user_id': 1, 'url_id': 1,
+         'comment': '1.1 comment', 'date': 15.0, 'last': False},
+        {'path': '1.2', 'user_id': 2, 'url_id': 1,
+         'comment': '1.2 comment', 'date': 14.0, 'last': True},
+        {'path': '2', 'user_id': 2, 'url_id': 2,
+         'comment': 'second comment', 'date': 150.0, 'last': True},
+        {'path': '1.1.1', 'user_id': 2, 'url_id': 1,
+         'comment': '1.1.1 comment', 'date': 150.0, 'last': True},
+    ])
 
 
 def downgrade():
@@ -0,0 +1,132 @@
+"""Unique users and urls
+
+Revision ID: c41e8b2d9f07
+Revises: 5a7c1e9f2b64
+Create Date: 2026-10-18 14:02:51.318464
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+from db_backend.path_worker import PathWorker
+
+# revision identifiers, used by Alembic.
+revision = 'c41e8b2d9f07'
+down_revision = '5a7c1e9f2b64'
+branch_labels = None
+depends_on = None
+
+users = sa.table('users',
+                 sa.column('id', sa.Integer),
+                 sa.column('user', sa.String))
+
+urls = sa.table('urls',
+                sa.column('id', sa.Integer),
+                sa.column('url', sa.String))
+
+comments = sa.table('comments',
+                    sa.column('id', sa.Integer),
+                    sa.column('path', sa.String),
+                    sa.column('user_id', sa.Integer),
+                    sa.column('url_id', sa.Integer),
+                    sa.column('last', sa.BOOLEAN))
+
+child_counters = sa.table('child_counters',
+                          sa.column('url_id', sa.Integer),
+                          sa.column('parent_id', sa.Integer),
+                          sa.column('last_child', sa.Integer))
+
+
+def _duplicates(bind, table, column):
+    """Map IDs of duplicated rows to ID of the first row with same value"""
+    rows = bind.execute(sa.select(table.c.id, column)
+                        .order_by(table.c.id)).all()
+    first_ids = {}
+    duplicates = {}
+    for row_id, value in rows:
+        if value in first_ids:
+            duplicates[row_id] = first_ids[value]
+        else:
+            first_ids[value] = row_id
+    return duplicates
+
+
+def _merge_users(bind):
+    """Move comments of duplicated users to the first user"""
+    for user_id, first_id in _duplicates(bind, users, users.c.user).items():
+        bind.execute(comments.update()
+                     .where(comments.c.user_id == user_id)
+                     .values(user_id=first_id))
+        bind.execute(users.delete().where(users.c.id == user_id))
+
+
+def _merge_urls(bind):
+    """
+    Move comments of duplicated URLs to the first URL, first level comments
+    of duplicate are numbered after first level comments of the first URL
+    """
+    roots = child_counters.c.parent_id == 0
+    for url_id, first_id in _duplicates(bind, urls, urls.c.url).items():
+        shift = bind.execute(sa.select(child_counters.c.last_child)
+                             .where(child_counters.c.url_id == first_id,
+                                    roots)).scalar() or 0
+        added = bind.execute(sa.select(child_counters.c.last_child)
+                             .where(child_counters.c.url_id == url_id,
+                                    roots)).scalar() or 0
+        rows = bind.execute(sa.select(comments.c.id, comments.c.path)
+                            .where(comments.c.url_id == url_id)).all()
+        updates = []
+        for row in rows:
+            nodes = row.path.split('.')
+            number = PathWorker.decode_node(nodes[0]) + shift
+            nodes[0] = PathWorker.encode_node(number)
+            updates.append({'comment_id': row.id,
+                            'new_path': '.'.join(nodes)})
+        if updates:
+            bind.execute(comments.update()
+                         .where(comments.c.id == sa.bindparam('comment_id'))
+                         .values(path=sa.bindparam('new_path'),
+                                 url_id=first_id),
+                         updates)
+        if shift and added:
+            # Last comment of the first URL is not last anymore
+            last_path = PathWorker.encode_node(shift)
+            bind.execute(comments.update()
+                         .where(comments.c.url_id == first_id,
+                                comments.c.path == last_path)
+                         .values(last=False))
+
+        bind.execute(child_counters.delete()
+                     .where(child_counters.c.url_id == url_id, roots))
+        bind.execute(child_counters.update()
+                     .where(child_counters.c.url_id == url_id)
+                     .values(url_id=first_id))
+        if added:
+            if shift:
+                bind.execute(child_counters.update()
+                             .where(child_counters.c.url_id == first_id,
+                                    roots)
+                             .values(last_child=shift + added))
+            else:
+                bind.execute(child_counters.insert()
+                             .values(url_id=first_id, parent_id=0,
+                                     last_child=added))
+        bind.execute(urls.delete().where(urls.c.id == url_id))
+
+
+def upgrade():
+    bind = op.get_bind()
+    _merge_users(bind)
+    _merge_urls(bind)
+
+    op.drop_index('ix_users_user', table_name='users')
+    op.create_index(op.f('ix_users_user'), 'users', ['user'], unique=True)
+    op.drop_index('ix_urls_url', table_name='urls')
+    op.create_index(op.f('ix_urls_url'), 'urls', ['url'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_urls_url'), table_name='urls')
+    op.create_index('ix_urls_url', 'urls', ['url'], unique=False)
+    op.drop_index(op.f('ix_users_user'), table_name='users')
+    op.create_index('ix_users_user', 'users', ['user'], unique=False)
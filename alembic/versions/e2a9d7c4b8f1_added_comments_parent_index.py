@@ -0,0 +1,25 @@
+"""Added comments parent index
+
+Revision ID: e2a9d7c4b8f1
+Revises: c41e8b2d9f07
+Create Date: 2026-10-18 16:40:12.508317
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9d7c4b8f1'
+down_revision = 'c41e8b2d9f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves selecting first inheritors of comments and first level
+    # comments of URL in tree order
+    op.create_index('ix_comments_url_id_parent_id_path', 'comments',
+                    ['url_id', 'parent_id', 'path'])
+
+
+def downgrade():
+    op.drop_index('ix_comments_url_id_parent_id_path', table_name='comments')
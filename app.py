@@ -1,46 +1,211 @@
-from flask import Flask, render_template, request
-from sqlalchemy import create_engine
+import os
+
+from flask import (Flask, Response, jsonify, render_template, request,
+                   stream_with_context)
 
 from db_backend.api_client import APIClient
+from db_backend.config import client_options
+from db_backend.engine import create_db_engine
+from db_backend.events import KEEPALIVE, KEEPALIVE_INTERVAL, format_event
+from db_backend.serializer import dumps
 
 app = Flask(__name__)
 
 
 class App:
     """Class for handling http requests"""
-    def __init__(self, engine):
+    def __init__(
+            self,
+            engine,
+            cache_backend=None,
+            read_engines=None,
+            read_your_writes=0.0,
+            metrics=None,
+            slow_query_threshold=None,
+            storage='path'
+    ):
         """
         :param engine: Object establishing connection to database
         :type engine: sqlalchemy.engine.Engine
+        :param cache_backend: Optional, if specified: storage of comment
+                              trees responses shared by application workers
+        :type cache_backend: db_backend.cache.CacheBackend
+        :param read_engines: Optional, if specified: objects establishing
+                             connections used by read commands in turn
+        :type read_engines: List[sqlalchemy.engine.Engine]
+        :param read_your_writes: Seconds during which reads following
+                                 add_comment in the same thread are served
+                                 by writing engine
+        :type read_your_writes: float
+        :param metrics: Optional, if specified: collector of commands
+                        metrics served on /metrics
+        :type metrics: db_backend.metrics.Metrics
+        :param slow_query_threshold: Optional, if specified: statements
+                                     executed longer than this count of
+                                     seconds are logged with their query
+                                     plan
+        :type slow_query_threshold: float
+        :param storage: Way inheritors of comment are found, 'path' or
+                        'closure'
+        :type storage: str
+        """
+        self.api_client = APIClient(engine, cache_backend, read_engines,
+                                    read_your_writes, metrics,
+                                    slow_query_threshold, storage)
+
+    @staticmethod
+    def _json_response(data: str) -> Response:
+        """
+        Create response with serialized JSON data
+        :param data: JSON string
+        :type data: str
+        """
+        return Response(data, mimetype='application/json')
+
+    def api_command(self):
+        """
+        Process command or array of commands sent in JSON request body
+        and return only its result
+        """
+        data = self.api_client.process_request(request.get_data(as_text=True))
+        return self._json_response(data)
+
+    def api_url_tree(self, url: str):
+        """
+        Return comments tree of URL, 'comment_id' query parameter selects
+        subtree of comment, 'first_level' parameter selects only first level
+        comments
+        :param url: URL address
+        :type url: str
+        """
+        if request.args.get('first_level', type=int):
+            command = {'command': 'ger_url_first_level_comments', 'url': url}
+        else:
+            command = {'command': 'get_comment_tree', 'url': url,
+                       'comment_id': request.args.get('comment_id', type=int)}
+        data = self.api_client.process_request(dumps(command))
+        return self._json_response(data)
+
+    def api_url_events(self, url: str):
         """
-        self._tables = ['users', 'urls', 'comments']
-        self.api_client = APIClient(engine)
+        Stream comments added to URL as server-sent events. Client
+        reconnected with Last-Event-ID header first receives comments it
+        missed
+        :param url: URL address
+        :type url: str
+        """
+        url_id = self.api_client.get_url_id(url)
+        if url_id is None:
+            return self._json_response(dumps({'Response': 'Not found'})), 404
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        # Subscription is made before missed comments are read, so nothing
+        # added in between is lost, comments both read and published are
+        # sent once
+        events = self.api_client.events
+        subscription = events.subscribe(url_id)
+
+        def stream():
+            sent_id = 0
+            try:
+                if last_event_id is not None:
+                    for missed in self.api_client.missed_events(
+                            url, last_event_id):
+                        yield ''.join(map(format_event, missed))
+                        sent_id = missed[-1]['comment_id']
+                while not subscription.closed:
+                    added = [event for event in
+                             subscription.get(KEEPALIVE_INTERVAL)
+                             if event['comment_id'] > sent_id]
+                    yield ''.join(map(format_event, added)) or KEEPALIVE
+            finally:
+                events.unsubscribe(subscription)
+
+        return Response(stream_with_context(stream()),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    def metrics_page(self):
+        """Return commands metrics in Prometheus text format"""
+        return Response(self.api_client.metrics.render(),
+                        mimetype='text/plain; version=0.0.4')
 
     def run(self):
-        """Process requests from web application"""
+        """
+        Process requests from web application debug view. Tables data is not
+        rendered here, page loads it by parts from table_page
+        """
         if request.method == 'GET':
-            tables = {table: self.api_client.get_table_data(table)
-                      for table in self._tables}
             return render_template('bootstrap_data.html',
                                    response='',
-                                   **tables)
+                                   commands=self.api_client.commands)
 
         elif request.method == 'POST':
             request_data = request.form['textfield']
             data = self.api_client.process_request(request_data)
-            tables = {table: self.api_client.get_table_data(table)
-                      for table in self._tables}
             return render_template('bootstrap_data.html',
                                    response=data,
-                                   **tables)
+                                   commands=self.api_client.commands)
         else:
-            return render_template('bootstrap_data.html')
+            return render_template('bootstrap_data.html',
+                                   commands=self.api_client.commands)
 
+    def table_page(self, table: str):
+        """
+        Return page of table rows in JSON, page is defined by 'limit' and
+        'after' query parameters
+        :param table: Table name from database
+        :type table: str
+        """
+        limit = request.args.get('limit', type=int)
+        after = request.args.get('after', type=int)
+        data = self.api_client.get_table_data(table, limit=limit,
+                                              after=after)
+        return jsonify(data)
 
-if __name__ == '__main__':
-    engine = create_engine('sqlite:///database/main.db')
-    # app.config["SQLALCHEMY_DATABASE_URI"] = 'sqlite:///main.db'
 
-    application = App(engine)
-    app.add_url_rule("/", view_func=application.run, methods=['GET', 'POST'])
+def register_routes(
+        flask_app: Flask,
+        application: App,
+        debug_view: bool = False
+) -> None:
+    """
+    Add application handlers to Flask routes
+    :param flask_app: Flask application
+    :type flask_app: flask.Flask
+    :param application: Requests handlers
+    :type application: App
+    :param debug_view: Flag to serve HTML page with commands form and tables
+    :type debug_view: bool
+    """
+    flask_app.add_url_rule("/api/command",
+                           view_func=application.api_command,
+                           methods=['POST'])
+    flask_app.add_url_rule("/api/url/<path:url>/tree",
+                           view_func=application.api_url_tree,
+                           methods=['GET'])
+    flask_app.add_url_rule("/api/url/<path:url>/events",
+                           view_func=application.api_url_events,
+                           methods=['GET'])
+    if application.api_client.metrics is not None:
+        flask_app.add_url_rule("/metrics",
+                               view_func=application.metrics_page,
+                               methods=['GET'])
+    if debug_view:
+        flask_app.add_url_rule("/", view_func=application.run,
+                               methods=['GET', 'POST'])
+        flask_app.add_url_rule("/tables/<table>",
+                               view_func=application.table_page,
+                               methods=['GET'])
+
+
+if __name__ == '__main__':
+    application = App(**client_options(create_db_engine))
+    # Comments added by other processes sharing database are streamed to
+    # events subscribers if EVENTS_POLL seconds between reads are set
+    events_poll = os.environ.get('EVENTS_POLL')
+    if events_poll:
+        application.api_client.follow_events(float(events_poll))
+    # HTML page is a debug view, it is served only if DEBUG_VIEW is set
+    register_routes(app, application,
+                    debug_view=bool(os.environ.get('DEBUG_VIEW')))
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,236 @@
+import asyncio
+import os
+from urllib.parse import parse_qs
+
+from db_backend.async_api_client import AsyncAPIClient
+from db_backend.config import client_options
+from db_backend.engine import create_async_db_engine
+from db_backend.events import KEEPALIVE, KEEPALIVE_INTERVAL, format_event
+from db_backend.serializer import dumps
+
+
+class ASGIApp:
+    """
+    ASGI application processing requests with AsyncAPIClient, so one
+    worker serves many requests at the same time. Run it with any ASGI
+    server, for example: uvicorn asgi:app
+    """
+    def __init__(
+            self,
+            engine,
+            cache_backend=None,
+            read_engines=None,
+            read_your_writes=0.0,
+            metrics=None,
+            slow_query_threshold=None,
+            storage='path',
+            events_poll=None
+    ):
+        """
+        :param engine: Object establishing asynchronous connection
+                       to database
+        :type engine: sqlalchemy.ext.asyncio.AsyncEngine
+        :param cache_backend: Optional, if specified: storage of comment
+                              trees responses shared by application workers
+        :type cache_backend: db_backend.cache.CacheBackend
+        :param read_engines: Optional, if specified: objects establishing
+                             asynchronous connections used by read commands
+                             in turn
+        :type read_engines: List[sqlalchemy.ext.asyncio.AsyncEngine]
+        :param read_your_writes: Seconds during which reads following
+                                 add_comment in the same request are served
+                                 by writing engine
+        :type read_your_writes: float
+        :param metrics: Optional, if specified: collector of commands
+                        metrics served on /metrics
+        :type metrics: db_backend.metrics.Metrics
+        :param slow_query_threshold: Optional, if specified: statements
+                                     executed longer than this count of
+                                     seconds are logged with their query
+                                     plan
+        :type slow_query_threshold: float
+        :param storage: Way inheritors of comment are found, 'path' or
+                        'closure'
+        :type storage: str
+        :param events_poll: Optional, if specified: seconds between reads of
+                            comments added by other processes sharing
+                            database for events subscribers
+        :type events_poll: float
+        """
+        self._engine = engine
+        self._read_engines = read_engines or []
+        self._events_poll = events_poll
+        self._follow_task = None
+        self.api_client = AsyncAPIClient(
+            engine, cache_backend, read_engines, read_your_writes, metrics,
+            slow_query_threshold, storage)
+
+    async def __call__(self, scope, receive, send):
+        """
+        Process ASGI connection
+            GET / - Available commands with their parameters
+            POST / - Process command sent in request body
+            GET /tables/<table>?limit=&after= - Page of table rows
+            GET /events?url= - Comments added to URL as server-sent events
+            GET /metrics - Commands metrics in Prometheus text format,
+                           if metrics are enabled
+        """
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path'].rstrip('/')
+        if scope['method'] == 'GET' and not path:
+            body = dumps(self.api_client.commands)
+        elif scope['method'] == 'POST' and not path:
+            request = await self._read_body(receive)
+            body = await self.api_client.process_request(request)
+        elif scope['method'] == 'GET' and path.startswith('/tables/'):
+            query = parse_qs(scope['query_string'].decode())
+            try:
+                limit = int(query['limit'][0]) if 'limit' in query else None
+                after = int(query['after'][0]) if 'after' in query else None
+            except ValueError:
+                await self._send(send, 400, dumps(
+                    {'Response': 'Wrong command!'}))
+                return
+            data = await self.api_client.get_table_data(
+                path[len('/tables/'):], limit=limit, after=after)
+            body = dumps(data)
+        elif scope['method'] == 'GET' and path == '/events':
+            await self._events(scope, receive, send)
+            return
+        elif (scope['method'] == 'GET' and path == '/metrics'
+              and self.api_client.metrics is not None):
+            await self._send(send, 200, self.api_client.metrics.render(),
+                             b'text/plain; version=0.0.4')
+            return
+        else:
+            await self._send(send, 404, dumps(
+                {'Response': 'Not found'}))
+            return
+        await self._send(send, 200, body)
+
+    async def _events(self, scope, receive, send):
+        """
+        Stream comments added to URL until client disconnects. Client
+        reconnected with Last-Event-ID header first receives comments it
+        missed
+        """
+        query = parse_qs(scope['query_string'].decode())
+        url = query['url'][0] if 'url' in query else None
+        url_id = await self.api_client.get_url_id(url) if url else None
+        if url_id is None:
+            await self._send(send, 404, dumps({'Response': 'Not found'}))
+            return
+        last_event_id = dict(scope['headers']).get(b'last-event-id', b'')
+        events = self.api_client.events
+        subscription = events.subscribe_async(url_id)
+        # Disconnect closes subscription, so waiting for events stops
+        disconnect = asyncio.ensure_future(
+            self._wait_disconnect(receive, lambda: events.unsubscribe(
+                subscription)))
+        try:
+            await send({'type': 'http.response.start',
+                        'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'),
+                                    (b'cache-control', b'no-cache')]})
+            # Comments both read and published are sent once
+            sent_id = 0
+            if last_event_id.isdigit():
+                async for missed in self.api_client.missed_events(
+                        url, int(last_event_id)):
+                    await self._send_chunk(send, ''.join(map(format_event,
+                                                             missed)))
+                    sent_id = missed[-1]['comment_id']
+            while True:
+                added = [event for event in
+                         await subscription.get(KEEPALIVE_INTERVAL)
+                         if event['comment_id'] > sent_id]
+                if subscription.closed:
+                    break
+                await self._send_chunk(
+                    send, ''.join(map(format_event, added)) or KEEPALIVE)
+        finally:
+            disconnect.cancel()
+            events.unsubscribe(subscription)
+
+    @staticmethod
+    async def _wait_disconnect(receive, on_disconnect):
+        """Call function when client disconnects"""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        on_disconnect()
+
+    @staticmethod
+    async def _send_chunk(send, body: str):
+        """
+        Send part of streamed response
+        :param body: Text of part
+        :type body: str
+        """
+        await send({'type': 'http.response.body', 'body': body.encode(),
+                    'more_body': True})
+
+    async def _lifespan(self, receive, send):
+        """
+        Start relaying comments of other processes to events subscribers on
+        server startup, dispose database connections on server shutdown
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self._events_poll:
+                    self._follow_task = asyncio.ensure_future(
+                        self.api_client.follow_events(self._events_poll))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._follow_task is not None:
+                    self._follow_task.cancel()
+                await self._engine.dispose()
+                for read_engine in self._read_engines:
+                    await read_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> str:
+        """
+        Read whole request body
+        :return: Decoded request body
+        :rtype: str
+        """
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        return body.decode()
+
+    @staticmethod
+    async def _send(
+            send,
+            status: int,
+            body: str,
+            content_type: bytes = b'application/json'
+    ):
+        """
+        Send response
+        :param status: HTTP status code
+        :type status: int
+        :param body: JSON string or other text
+        :type body: str
+        :param content_type: Response content type
+        :type content_type: bytes
+        """
+        await send({'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(b'content-type', content_type)]})
+        await send({'type': 'http.response.body', 'body': body.encode()})
+
+
+app = ASGIApp(**client_options(create_async_db_engine),
+              events_poll=float(os.environ.get('EVENTS_POLL', 0)) or None)
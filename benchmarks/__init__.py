@@ -0,0 +1 @@
+"""Benchmarks of comments service, run them from repository root"""
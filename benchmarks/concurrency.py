@@ -0,0 +1,160 @@
+"""
+Compare throughput of comment trees reads served by APIClient one by one,
+like one Flask worker does, and by AsyncAPIClient sharing one event loop.
+Async client wins only when requests wait for database. Local SQLite file
+answers at once and building the trees is bound by CPU, so async client is
+slower there: it pays for switching to driver and pool threads. --latency
+makes every statement wait in thread of database driver, like round trip
+to database server does. Results on one core with defaults:
+
+    --latency 0: sync 121 rps, async 88 rps
+    --latency 2: sync 49 rps, async 88 rps
+
+    python benchmarks/concurrency.py --urls 20 --comments 500 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate_comments  # noqa: E402
+from db_backend.api_client import APIClient  # noqa: E402
+from db_backend.async_api_client import AsyncAPIClient  # noqa: E402
+from db_backend.cache import MemoryCacheBackend  # noqa: E402
+from db_backend.db_client import DBClient  # noqa: E402
+from db_backend.db_table import Base  # noqa: E402
+from db_backend.engine import create_async_db_engine  # noqa: E402
+from db_backend.engine import create_db_engine  # noqa: E402
+
+
+def fill_database(path: str, urls: int, comments: int, seed: int) -> None:
+    """
+    Create database with generated comments forest
+    :param path: Path to database file
+    :type path: str
+    :param urls: Count of URLs
+    :type urls: int
+    :param comments: Average count of comments per URL
+    :type comments: int
+    :param seed: Random generator seed
+    :type seed: int
+    """
+    engine = create_db_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    DBClient(engine).add_comments_bulk(
+        generate_comments(urls * comments, seed, urls=urls))
+    engine.dispose()
+
+
+def add_latency(engine, latency: float) -> None:
+    """
+    Make every statement of engine connections wait in thread of database
+    driver, like round trip to database server does
+    :param engine: Synchronous engine or proxied engine of asynchronous one
+    :type engine: sqlalchemy.engine.Engine
+    :param latency: Seconds to wait
+    :type latency: float
+    """
+    if not latency:
+        return
+
+    def wait(statement):
+        time.sleep(latency)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        driver_connection = connection_record.driver_connection
+        if isinstance(driver_connection, sqlite3.Connection):
+            driver_connection.set_trace_callback(wait)
+        else:
+            await_only(driver_connection.set_trace_callback(wait))
+
+
+def run_sync(path: str, requests: list, latency: float) -> float:
+    """
+    Process requests one by one
+    :return: Seconds spent
+    :rtype: float
+    """
+    engine = create_db_engine(f'sqlite:///{path}')
+    add_latency(engine, latency)
+    api_client = APIClient(engine, MemoryCacheBackend(maxsize=0))
+    start = time.perf_counter()
+    for request in requests:
+        api_client.process_request(request)
+    spent = time.perf_counter() - start
+    engine.dispose()
+    return spent
+
+
+async def run_async(
+        path: str, requests: list, concurrency: int, latency: float
+) -> float:
+    """
+    Process requests concurrently in one event loop
+    :return: Seconds spent
+    :rtype: float
+    """
+    engine = create_async_db_engine(f'sqlite+aiosqlite:///{path}',
+                                    pool_size=concurrency)
+    add_latency(engine.sync_engine, latency)
+    api_client = AsyncAPIClient(engine, MemoryCacheBackend(maxsize=0))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(request):
+        async with semaphore:
+            await api_client.process_request(request)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(process(request) for request in requests))
+    spent = time.perf_counter() - start
+    await engine.dispose()
+    return spent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--urls', type=int, default=20)
+    parser.add_argument('--comments', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='milliseconds every statement waits')
+    args = parser.parse_args()
+
+    # APIClient reads commands description from working directory
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    rand = random.Random(args.seed)
+    requests = [json.dumps({'command': 'get_comment_tree',
+                            'url': f'url_{rand.randrange(args.urls)}'})
+                for _ in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.db')
+        fill_database(path, args.urls, args.comments, args.seed)
+        latency = args.latency / 1000
+        sync_time = run_sync(path, requests, latency)
+        async_time = asyncio.run(run_async(path, requests, args.concurrency,
+                                           latency))
+
+    print(json.dumps({'requests': args.requests,
+                      'concurrency': args.concurrency,
+                      'latency_ms': args.latency,
+                      'sync_rps': round(args.requests / sync_time, 1),
+                      'async_rps': round(args.requests / async_time, 1)},
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Seeded generator of synthetic comment forests. Comments are spread over
+URLs with Zipf distributed thread sizes, so few URLs get most comments.
+Inside thread comment starts new root, continues the latest reply chain or
+answers one of existing comments chosen in proportion to its replies
+count, that produces both deep chains and wide fan-out.
+"""
+import itertools
+import random
+from typing import Dict, Iterator, List, Union
+
+
+def zipf_weights(count: int, skew: float) -> List[float]:
+    """
+    Get cumulative Zipf weights of ranks from 1 to count
+    :param count: Count of ranks
+    :type count: int
+    :param skew: Distribution exponent, bigger skew gives more weight
+                 to the first ranks
+    :type skew: float
+    :return: Cumulative weights
+    :rtype: List[float]
+    """
+    return list(itertools.accumulate(1 / rank ** skew
+                                     for rank in range(1, count + 1)))
+
+
+def generate_comments(
+        count: int,
+        seed: int = 0,
+        urls: Union[None, int] = None,
+        users: Union[None, int] = None,
+        thread_skew: float = 1.1,
+        root_share: float = 0.05,
+        deep_threads: float = 0.1,
+        max_depth: int = 100,
+        start_date: float = 1.6e9
+) -> Iterator[Dict]:
+    """
+    Generate comments in the format of DBClient.add_comments_bulk. Comments
+    keys are their indexes, parents always go before their inheritors
+    :param count: Count of comments
+    :type count: int
+    :param seed: Random generator seed, the same seed gives the same forest
+    :type seed: int
+    :param urls: Count of URLs, one per 200 comments by default
+    :type urls: Union[None, int]
+    :param users: Count of users, one per 20 comments by default
+    :type users: Union[None, int]
+    :param thread_skew: Zipf exponent of URLs threads sizes and of users
+                        activity
+    :type thread_skew: float
+    :param root_share: Probability of comment to be first level comment
+    :type root_share: float
+    :param deep_threads: Share of URLs where comments mostly answer the
+                         latest comment, making long reply chains
+    :type deep_threads: float
+    :param max_depth: Maximum comment depth
+    :type max_depth: int
+    :param start_date: Timestamp of the first comment, every next comment
+                       is one second later
+    :type start_date: float
+    :return: Iterator over comments data
+    :rtype: Iterator[Dict]
+    """
+    rand = random.Random(seed)
+    urls = urls or max(1, count // 200)
+    users = users or max(1, count // 20)
+    url_indexes = rand.choices(range(urls),
+                               cum_weights=zipf_weights(urls, thread_skew),
+                               k=count)
+    user_indexes = rand.choices(range(users),
+                                cum_weights=zipf_weights(users, thread_skew),
+                                k=count)
+    chain_shares = [0.9 if rand.random() < deep_threads else 0.2
+                    for _ in range(urls)]
+
+    depths = []
+    # Per URL: the latest comment key and list of answer targets where
+    # every comment is repeated once per its reply
+    latest = [None] * urls
+    targets = [[] for _ in range(urls)]
+    for key, (url, user) in enumerate(zip(url_indexes, user_indexes)):
+        data = {'key': key,
+                'user': f'user_{user}',
+                'comment': f'comment {key}',
+                'date': start_date + key}
+        choice = rand.random()
+        if not targets[url] or choice < root_share:
+            parent = None
+        elif (choice < root_share + chain_shares[url]
+              and depths[latest[url]] < max_depth):
+            parent = latest[url]
+        else:
+            parent = rand.choice(targets[url])
+            if depths[parent] >= max_depth:
+                parent = None
+
+        if parent is None:
+            data['url'] = f'url_{url}'
+            depths.append(1)
+        else:
+            data['parent_key'] = parent
+            depths.append(depths[parent] + 1)
+            targets[url].append(parent)
+        targets[url].append(key)
+        latest[url] = key
+        yield data
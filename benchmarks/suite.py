@@ -0,0 +1,285 @@
+"""
+Time API commands on synthetic comment forests of several sizes and write
+results in JSON, so runs on different commits can be compared.
+
+    python -m benchmarks.suite --sizes 10000 100000 1000000 \\
+        --data-dir /tmp/forests --output results.json
+    python -m benchmarks.suite --sizes 10000 --compare results.json
+    python -m benchmarks.suite --sizes 100000 --storages path closure
+
+Generated databases are kept in data directory and reused by next runs
+with the same size and seed, every run works on their copy.
+
+Closure storage is not a database without materialized paths: paths still
+order comments of responses and are written by both storages. It reads
+inheritors, ancestors chains and reply counters through comment_closure
+table instead of paths, so its results show these reads and the cost of
+filling the table on write.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Union
+
+import sqlalchemy
+from sqlalchemy import text
+
+from db_backend.api_client import APIClient
+from db_backend.cache import MemoryCacheBackend
+from db_backend.db_client import STORAGES, DBClient
+from db_backend.db_table import Base
+from db_backend.engine import create_db_engine
+
+from .generator import generate_comments
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_database(
+        path: str, size: int, seed: int, storage: str = 'path'
+) -> float:
+    """
+    Create database with generated comments forest
+    :param path: Path to database file
+    :type path: str
+    :param size: Count of comments
+    :type size: int
+    :param seed: Generator seed
+    :type seed: int
+    :param storage: Comments storage of DBClient, closure table is filled
+                    only for 'closure'
+    :type storage: str
+    :return: Seconds spent by add_comments_bulk
+    :rtype: float
+    """
+    engine = create_db_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    start = time.perf_counter()
+    DBClient(engine, storage=storage).add_comments_bulk(
+        generate_comments(size, seed))
+    spent = time.perf_counter() - start
+    engine.dispose()
+    return spent
+
+
+def measure(func: Callable, repeat: int) -> Dict:
+    """
+    Call function several times
+    :param func: Function without parameters
+    :type func: Callable
+    :param repeat: Count of calls
+    :type repeat: int
+    :return: Minimum, median and mean time of call in seconds
+    :rtype: Dict
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'repeat': repeat,
+            'min': min(times),
+            'median': statistics.median(times),
+            'mean': statistics.mean(times)}
+
+
+def command_cases(engine) -> Dict[str, Dict]:
+    """
+    Create requests for the largest thread, for typical thread and for
+    the most active user of database
+    :param engine: Object establishing connection to database
+    :type engine: sqlalchemy.engine.Engine
+    :return: Requests by case names
+    :rtype: Dict[str, Dict]
+    """
+    with engine.connect() as connection:
+        urls = connection.execute(text(
+            'SELECT urls.url FROM urls JOIN comments '
+            'ON comments.url_id = urls.id '
+            'GROUP BY urls.id ORDER BY count(*) DESC')).scalars().all()
+        root_id = connection.execute(text(
+            'SELECT comments.id FROM comments JOIN urls '
+            'ON comments.url_id = urls.id WHERE urls.url = :url '
+            'AND comments.depth = 1 ORDER BY comments.id LIMIT 1'),
+            {'url': urls[0]}).scalar()
+        user = connection.execute(text(
+            'SELECT users.user FROM users JOIN comments '
+            'ON comments.user_id = users.id '
+            'GROUP BY users.id ORDER BY count(*) DESC LIMIT 1')).scalar()
+    large_url, typical_url = urls[0], urls[len(urls) // 2]
+
+    return {
+        'tree_large_url': {'command': 'get_comment_tree', 'url': large_url},
+        'tree_typical_url': {'command': 'get_comment_tree',
+                             'url': typical_url},
+        'tree_comment': {'command': 'get_comment_tree', 'url': large_url,
+                         'comment_id': root_id},
+        'tree_page': {'command': 'get_comment_tree', 'url': large_url,
+                      'max_depth': 3, 'limit_per_level': 10},
+        'first_level': {'command': 'ger_url_first_level_comments',
+                        'url': large_url},
+        'user_history': {'command': 'get_user_history', 'user': user},
+        'report_url_csv': {'command': 'get_report', 'url': large_url},
+        'report_user_ndjson': {'command': 'get_report', 'user': user,
+                               'report_format': 'ndjson'},
+        'add_reply': {'command': 'add_comment', 'parent_id': root_id,
+                      'url': large_url, 'user': user,
+                      'comment': 'benchmark reply'},
+        'add_root': {'command': 'add_comment', 'url': large_url,
+                     'user': user, 'comment': 'benchmark comment'},
+    }
+
+
+def run_size(
+        path: str,
+        size: int,
+        repeat: int,
+        report_dir: str,
+        storage: str = 'path'
+) -> List:
+    """
+    Time API commands and tree building steps on one database
+    :param path: Path to database file
+    :type path: str
+    :param size: Count of comments in database
+    :type size: int
+    :param repeat: Count of calls of every case
+    :type repeat: int
+    :param report_dir: Directory for reports files
+    :type report_dir: str
+    :param storage: Comments storage of DBClient
+    :type storage: str
+    :return: Results of cases
+    :rtype: List
+    """
+    engine = create_db_engine(f'sqlite:///{path}')
+    # Cache is disabled, every request reaches database
+    api_client = APIClient(engine, MemoryCacheBackend(maxsize=0),
+                           storage=storage)
+    api_client._report_dir = report_dir
+    cases = command_cases(engine)
+
+    results = []
+    # Writes go last, so reads of every run see the same forest
+    for case, request in cases.items():
+        body = json.dumps(request)
+        timing = measure(lambda: api_client.process_request(body), repeat)
+        results.append({'size': size, 'storage': storage, 'case': case,
+                        'command': request['command'], **timing})
+
+    rows = api_client._db_client.get_url_inheritors(
+        cases['tree_large_url']['url'], False)
+    steps = {
+        'create_sorted_dict': lambda: api_client._pworker.create_sorted_dict(
+            rows, api_client._keys),
+        'save_csv': lambda: api_client._save_csv(rows),
+    }
+    for case, func in steps.items():
+        timing = measure(func, repeat)
+        results.append({'size': size, 'storage': storage, 'case': case,
+                        'command': None, 'rows': len(rows), **timing})
+    engine.dispose()
+    return results
+
+
+def current_commit() -> Union[None, str]:
+    """
+    Get hash of checked out commit
+    :return: Commit hash or None outside of git repository
+    :rtype: Union[None, str]
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict, current: Dict) -> None:
+    """
+    Print median times of current run related to previous one
+    :param previous: Results of previous run
+    :type previous: Dict
+    :param current: Results of current run
+    :type current: Dict
+    """
+    # Results written before storages were benchmarked are path ones
+    before = {(result['size'], result.get('storage', 'path'),
+               result['case']): result['median']
+              for result in previous['results']}
+    for result in current['results']:
+        key = (result['size'], result['storage'], result['case'])
+        if key not in before:
+            continue
+        ratio = result['median'] / before[key]
+        print(f'{result["size"]:>8} {result["storage"]:<8} '
+              f'{result["case"]:<20} '
+              f'{before[key]:10.5f}s -> {result["median"]:10.5f}s '
+              f'x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--storages', nargs='+', default=['path'],
+                        choices=STORAGES,
+                        help='Comments storages of DBClient to compare')
+    parser.add_argument('--data-dir', default=None,
+                        help='Directory to keep generated databases')
+    parser.add_argument('--output', default=None,
+                        help='Results file, printed if not specified')
+    parser.add_argument('--compare', default=None,
+                        help='Results file of previous run to compare with')
+    args = parser.parse_args()
+
+    # APIClient reads commands description from working directory
+    os.chdir(ROOT_DIR)
+    report = {'commit': current_commit(),
+              'python': platform.python_version(),
+              'sqlalchemy': sqlalchemy.__version__,
+              'seed': args.seed,
+              'repeat': args.repeat,
+              'build': {},
+              'results': []}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_dir = args.data_dir or work_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for size, storage in itertools.product(args.sizes, args.storages):
+            name = f'forest_{size}_{args.seed}'
+            if storage != 'path':
+                name += f'_{storage}'
+            data_path = os.path.join(data_dir, f'{name}.db')
+            if not os.path.exists(data_path):
+                report['build'][name] = build_database(data_path, size,
+                                                       args.seed, storage)
+            path = os.path.join(work_dir, 'benchmark.db')
+            shutil.copy(data_path, path)
+            report['results'].extend(
+                run_size(path, size, args.repeat, work_dir, storage))
+            os.remove(path)
+
+    if args.output:
+        with open(args.output, 'w') as fo:
+            json.dump(report, fo, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as fi:
+            compare(json.load(fi), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,21 @@
 import csv
 import datetime
+import gzip
 import json
 import os
-from typing import Any, Callable, Dict, List, Union
+import tempfile
+from contextlib import nullcontext
+from functools import partial
+from itertools import groupby
+from typing import (IO, Any, Callable, Dict, Iterable, Iterator, List,
+                    NamedTuple, Tuple, Union)
 
+from .cache import CacheBackend, ResultCache
 from .db_client import DBClient
+from .events import EventHub
+from .metrics import Metrics, command_scope
 from .path_worker import PathWorker
+from .serializer import dumps
 
 
 class RequestData:
@@ -40,12 +50,76 @@ def parser_decorator(func: Callable) -> Callable:
     return wrapper
 
 
+class DBCall(NamedTuple):
+    """
+    DBClient method call prepared from request parameters and function
+    creating response from its result, None to return result as it is
+    """
+    method: str
+    args: Tuple
+    kwargs: Dict
+    build: Union[None, Callable]
+
+
+def call_decorator(func: Callable) -> Callable:
+    """
+    Decorator to handle wrong parameters while preparing DBClient call
+    :param func: Method creating DBClient call from request parameters
+    :type func: Callable
+    :return: Decorated function
+    :rtype: Callable
+    """
+    def wrapper(self, *args, **kwargs):
+        """Return 'wrong command' response if parameters are wrong"""
+        try:
+            result = func(self, *args, **kwargs)
+        except (AttributeError, TypeError, ValueError):
+            return self._wrong_response_message
+        return result
+
+    return wrapper
+
+
 class APIClient:
     """Class to process requests"""
-    def __init__(self, engine):
+    db_client_class = DBClient
+
+    def __init__(
+            self,
+            engine,
+            cache_backend: Union[None, CacheBackend] = None,
+            read_engines=None,
+            read_your_writes: float = 0.0,
+            metrics: Union[None, Metrics] = None,
+            slow_query_threshold: Union[None, float] = None,
+            storage: str = 'path'
+    ):
         """
         :param engine: Object establishing connection to database
         :type engine: sqlalchemy.engine.Engine
+        :param cache_backend: Optional, if specified: storage of comment
+                              trees responses, use shared storage when
+                              several processes work with one database
+        :type cache_backend: Union[None, CacheBackend]
+        :param read_engines: Optional, if specified: objects establishing
+                             connections used by read commands in turn,
+                             for example database replicas
+        :type read_engines: Sequence[sqlalchemy.engine.Engine]
+        :param read_your_writes: Seconds during which read commands sent
+                                 after add_comment in the same thread or
+                                 task are served by writing engine
+        :type read_your_writes: float
+        :param metrics: Optional, if specified: collector of commands
+                        latency, SQL statements and responses sizes
+        :type metrics: Union[None, Metrics]
+        :param slow_query_threshold: Optional, if specified: statements
+                                     executed longer than this count of
+                                     seconds are logged with their query
+                                     plan and command
+        :type slow_query_threshold: Union[None, float]
+        :param storage: Way inheritors of comment are found, 'path' or
+                        'closure', see DBClient
+        :type storage: str
         """
         curr_path = os.getcwd()
         commands_file = os.path.join(curr_path, 'commands', 'commands.json')
@@ -53,21 +127,60 @@ class APIClient:
             self._commands = json.load(fi)
 
         self._report_dir = os.path.join(curr_path, 'build')
-        self._db_client = DBClient(engine)
+        self._db_client = self.db_client_class(
+            engine, read_engines=read_engines,
+            read_your_writes=read_your_writes,
+            slow_query_threshold=slow_query_threshold, storage=storage)
         self._keys = self._db_client.keys
+        self._activity_keys = ['reply_count', 'last_activity']
         self._pworker = PathWorker()
         self._wrong_response_message = {'Response': 'Wrong command!'}
+        self._tables = ['users', 'urls', 'comments']
+        self._page_size = 50
+        self._max_page_size = 1000
+        self._cached_commands = ['ger_url_first_level_comments',
+                                 'get_comment_tree']
+        self._read_commands = ['ger_url_first_level_comments',
+                               'get_comment_tree', 'get_comment_context',
+                               'get_updates', 'get_user_history',
+                               'search_comments']
+        self._max_batch_size = 100
+        self._cache = ResultCache(cache_backend)
+        self._db_client.subscribe(self._invalidate_cache)
+        self.events = EventHub()
+        self._db_client.subscribe(self.events.publish)
+        self._metrics = metrics
+        if metrics is not None:
+            for db_engine in [engine, *(read_engines or [])]:
+                # Asynchronous engines emit events of their proxied engine
+                metrics.instrument(getattr(db_engine, 'sync_engine',
+                                           db_engine))
 
     @parser_decorator
-    def _parse_request(self, request: str) -> RequestData:
+    def _parse_request(
+            self, request: str
+    ) -> Union[RequestData, List[RequestData]]:
         """
         Parse request data
-        :param request: JSON string
+        :param request: JSON string with command object or array of them
         :type request: str
+        :return: Class with parsed data or list of them for array
+        :rtype: Union[RequestData, List[RequestData]]
+        """
+        request_data = json.loads(request)
+        if isinstance(request_data, list):
+            return [self._parse_command(command) for command in request_data]
+        return self._parse_command(request_data)
+
+    @parser_decorator
+    def _parse_command(self, request_dict: Dict) -> RequestData:
+        """
+        Parse one command data
+        :param request_dict: Command name and parameters
+        :type request_dict: Dict
         :return: Class with parsed data
         :rtype: RequestData
         """
-        request_dict = json.loads(request)
         command = request_dict['command']
 
         request_attr = {}
@@ -79,8 +192,79 @@ class APIClient:
 
     def _check_dir(self):
         """Check if report directory is exists otherwise create it"""
-        if not os.path.exists(self._report_dir):
-            os.mkdir(self._report_dir)
+        os.makedirs(self._report_dir, exist_ok=True)
+
+    def _create_report_file(self, extension: str, compress: bool) -> str:
+        """
+        Create empty report file with unique name, so concurrent reports
+        never overwrite each other
+        :param extension: Report file extension
+        :type extension: str
+        :param compress: Flag to compress report with gzip
+        :type compress: bool
+        :return: Path to created file
+        :rtype: str
+        """
+        self._check_dir()
+        suffix = f'.{extension}.gz' if compress else f'.{extension}'
+        fd, data_path = tempfile.mkstemp(prefix='report_', suffix=suffix,
+                                         dir=self._report_dir)
+        os.close(fd)
+        return data_path
+
+    @staticmethod
+    def _open_report(data_path: str, compress: bool) -> IO:
+        """
+        Open report file for writing text
+        :param data_path: Path to report file
+        :type data_path: str
+        :param compress: Flag to compress report with gzip
+        :type compress: bool
+        :return: File object
+        :rtype: IO
+        """
+        if compress:
+            return gzip.open(data_path, 'wt', newline='')
+        return open(data_path, 'w', newline='')
+
+    @staticmethod
+    def _report_values(comment: Iterable) -> List:
+        """
+        Prepare comment row to be written to report
+        :param comment: Comment data, zero index is related to path
+        :type comment: Iterable
+        :return: Comment values with readable date
+        :rtype: List
+        """
+        values = list(comment[1:])
+        values[-1] = str(datetime.datetime.fromtimestamp(values[-1]))
+        return values
+
+    def _start_csv(self, fi: IO) -> Callable:
+        """
+        Write .csv report header
+        :param fi: Report file object
+        :type fi: IO
+        :return: Function writing comment row to report
+        :rtype: Callable
+        """
+        report = csv.writer(fi)
+        report.writerow(self._keys)
+        return lambda comment: report.writerow(self._report_values(comment))
+
+    def _start_ndjson(self, fi: IO) -> Callable:
+        """
+        Prepare newline delimited .ndjson report, it has no header
+        :param fi: Report file object
+        :type fi: IO
+        :return: Function writing comment row to report
+        :rtype: Callable
+        """
+        def write(comment):
+            values = self._report_values(comment)
+            fi.write(dumps(dict(zip(self._keys, values))) + '\n')
+
+        return write
 
     def _save_json(self, data_dict: Dict) -> str:
         """
@@ -96,65 +280,421 @@ class APIClient:
             json.dump(data_dict, f)
         return data_path
 
-    def _save_csv(self, data: Dict) -> str:
+    def _save_csv(self, comments: Iterable, compress: bool = False) -> str:
         """
-        Save query result to .csv file
-        :param data: Dictionary with values for single line in .csv file
-        :type data: Dict
+        Write comments to .csv file one by one
+        :param comments: Comments rows, zero index is related to path
+        :type comments: Iterable
+        :param compress: Flag to compress report with gzip
+        :type compress: bool
         :return: Path to saved .csv file
         :rtype: str
         """
-        self._check_dir()
-        data_path = os.path.join(self._report_dir, 'report.csv')
-        with open(data_path, 'w', newline='') as fi:
-            report = csv.writer(fi)
-            report.writerow(self._db_client.keys)
-            for ind in data:
-                data_list = [data[ind][key] for key in self._db_client.keys]
-                data_list[-1] = datetime.datetime.fromtimestamp(data_list[-1])
-                report.writerow(data_list)
+        data_path = self._create_report_file('csv', compress)
+        with self._open_report(data_path, compress) as fi:
+            write = self._start_csv(fi)
+            for comment in comments:
+                write(comment)
+        return data_path
+
+    def _save_ndjson(self, comments: Iterable, compress: bool = False) -> str:
+        """
+        Write comments to newline delimited .ndjson file one by one
+        :param comments: Comments rows, zero index is related to path
+        :type comments: Iterable
+        :param compress: Flag to compress report with gzip
+        :type compress: bool
+        :return: Path to saved .ndjson file
+        :rtype: str
+        """
+        data_path = self._create_report_file('ndjson', compress)
+        with self._open_report(data_path, compress) as fi:
+            write = self._start_ndjson(fi)
+            for comment in comments:
+                write(comment)
         return data_path
 
+    def _invalidate_cache(self, comments: List[Dict]) -> None:
+        """
+        Increase versions of comments tree parts changed by written comments
+        :param comments: Written comments with 'url_id' and 'path' keys
+        :type comments: List[Dict]
+        """
+        self._cache.invalidate(comments)
+
+    def _scope_comment_id(self, data: RequestData) -> Union[None, int]:
+        """
+        Get ID of comment whose inheritors are requested
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Comment ID, None if comments of URL are requested
+        :rtype: Union[None, int]
+        :raises ValueError: If cursor is wrong
+        """
+        if data.attrs.get('cursor') is None:
+            return data.attrs.get('comment_id')
+        try:
+            comment_id, _ = self._parse_cursor(data.attrs['cursor'])
+        except AttributeError as error:
+            raise ValueError('Cursor must be a string') from error
+        return comment_id
+
+    def _cache_scope(self, data: RequestData) -> Union[None, Dict]:
+        """
+        Find the part of comments tree requested comments are taken from
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Dictionary with URL ID, subtree path and first level flag
+                 or None if requested comments are not exist
+        :rtype: Union[None, Dict]
+        """
+        try:
+            comment_id = self._scope_comment_id(data)
+        except ValueError:
+            return None
+        if data.command == 'get_comment_tree' and comment_id:
+            scope = self._db_client.get_comment_scope(comment_id)
+            if scope is None:
+                return None
+            url_id, path = scope
+            return {'url_id': url_id, 'path': path}
+
+        url_id = self._db_client.get_url_id(data.attrs['url'])
+        if url_id is None:
+            return None
+        first_level = data.command == 'ger_url_first_level_comments'
+        return {'url_id': url_id, 'first_level': first_level}
+
+    @staticmethod
+    def _request_key(data: RequestData) -> str:
+        """
+        Create key identifying parsed request
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Command name with its parameters
+        :rtype: str
+        """
+        return f'{data.command}:{json.dumps(data.attrs, sort_keys=True)}'
+
     def process_request(self, request: str) -> str:
         """
-        Process request
+        Process request. Request is one command or array of commands, array
+        is responded with array of results in the same order
         :param request: JSON string with request data
         :type request: str
         :return: JSON string with response data
         :rtype: str
         """
         data = self._parse_request(request)
-        if data.command == 'add_comment':
-            result = self._db_client.add_comment(**data.attrs)
-        elif data.command == 'ger_url_first_level_comments':
-            result = self.get_url_comments(**data.attrs)
-        elif data.command == 'get_comment_tree':
-            result = self.get_comment_tree(**data.attrs)
-        elif data.command == 'get_user_history':
-            result = self.get_user_history(**data.attrs)
-        elif data.command == 'get_report':
-            data_dict = self.prepare_data_to_report(**data.attrs)
-            report_path = self._save_csv(data_dict)
-            result = report_path
+        if isinstance(data, list):
+            return self._process_batch(data)
+        return self._process_measured(data)
+
+    def _process_batch(self, batch: List[RequestData]) -> str:
+        """
+        Process array of commands in their order. Successive reads are run
+        in one database snapshot and identical reads among them are run once,
+        writes and reports are run separately
+        :param batch: Parsed commands
+        :type batch: List[RequestData]
+        :return: JSON array with commands responses
+        :rtype: str
+        """
+        if len(batch) > self._max_batch_size:
+            return dumps(self._wrong_response_message)
+
+        results = []
+        for is_read, group in groupby(
+                batch, lambda data: data.command in self._read_commands):
+            if not is_read:
+                results.extend(self._process_measured(data)
+                               for data in group)
+                continue
+            group = list(group)
+            # Versions are read before snapshot begins, so result of snapshot
+            # is not cached under version of later write it does not see
+            cache_keys = self._cache_keys(group)
+            # Replica may not have the write which changed version yet
+            reads = (self._db_client.primary_reads()
+                     if any(cache_keys.values()) else nullcontext())
+            responses = {}
+            with reads, self._db_client.snapshot():
+                for data in group:
+                    key = self._request_key(data)
+                    if key not in responses:
+                        responses[key] = self._process_measured(data,
+                                                                cache_keys)
+                    results.append(responses[key])
+        return '[' + ','.join(results) + ']'
+
+    def _metrics_command(self, data: RequestData) -> str:
+        """
+        Get command name used in metrics, unknown names are merged, so
+        requests can not create unlimited count of metrics
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Command name
+        :rtype: str
+        """
+        return data.command if data.command in self._commands else 'wrong'
+
+    def _cache_keys(
+            self, batch: List[RequestData]
+    ) -> Dict[str, Union[None, str]]:
+        """
+        Get versioned cache keys of parsed requests
+        :param batch: Parsed requests
+        :type batch: List[RequestData]
+        :return: Dictionary with cache keys by request keys, None for
+                 requests whose responses are not cached
+        :rtype: Dict[str, Union[None, str]]
+        """
+        cache_keys = {}
+        for data in batch:
+            key = self._request_key(data)
+            if key not in cache_keys:
+                with command_scope(self._metrics_command(data)):
+                    cache_keys[key] = self._cache_key(data)
+        return cache_keys
+
+    def _cache_key(self, data: RequestData) -> Union[None, str]:
+        """
+        Get cache key of parsed request with current versions of the part
+        of comments tree its response is taken from
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Cache key or None if response is not cached
+        :rtype: Union[None, str]
+        """
+        if data.command not in self._cached_commands:
+            return None
+        scope = self._cache_scope(data)
+        if scope is None:
+            return None
+        return self._cache.versioned_key(self._request_key(data), **scope)
+
+    def _process_measured(
+            self, data: RequestData,
+            cache_keys: Union[None, Dict[str, Union[None, str]]] = None
+    ) -> str:
+        """
+        Execute parsed request marked with its command name and collect
+        its metrics if they are enabled
+        :param data: Parsed request data
+        :type data: RequestData
+        :param cache_keys: Cache keys of batch requests read before its
+                           snapshot, None to read key of this request
+        :type cache_keys: Union[None, Dict[str, Union[None, str]]]
+        :return: JSON string with response data
+        :rtype: str
+        """
+        command = self._metrics_command(data)
+        with command_scope(command):
+            if self._metrics is None:
+                return self._process_cached(data, cache_keys)
+            with self._metrics.track(command) as stats:
+                response = self._process_cached(data, cache_keys)
+                stats.response_size = len(response)
+        return response
+
+    def _process_cached(
+            self, data: RequestData,
+            cache_keys: Union[None, Dict[str, Union[None, str]]] = None
+    ) -> str:
+        """
+        Execute parsed request, comment trees responses are served from
+        cache until new comment is added to their part of the tree. Cached
+        responses are read from writing engine
+        :param data: Parsed request data
+        :type data: RequestData
+        :param cache_keys: Cache keys of batch requests read before its
+                           snapshot, None to read key of this request
+        :type cache_keys: Union[None, Dict[str, Union[None, str]]]
+        :return: JSON string with response data
+        :rtype: str
+        """
+        if cache_keys is None:
+            key = self._cache_key(data)
         else:
-            result = self._wrong_response_message
+            key = cache_keys[self._request_key(data)]
+        if key is None:
+            return self._process(data)
+
+        response = self._cache.get(key)
+        if response is None:
+            # Replica may not have the write which changed version yet,
+            # its result would be cached as the current one
+            with self._db_client.primary_reads():
+                response = self._process(data)
+            self._cache.set(key, response)
+        return response
 
-        return json.dumps(result)
+    def _command_call(self, data: RequestData) -> Union[DBCall, Dict]:
+        """
+        Prepare DBClient call of parsed request
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: DBClient call or response if command or its parameters
+                 are wrong
+        :rtype: Union[DBCall, Dict]
+        """
+        calls = {'add_comment': self._add_comment_call,
+                 'bulk_add_comments': self._bulk_call,
+                 'ger_url_first_level_comments': self._url_comments_call,
+                 'get_comment_tree': self._comment_tree_call,
+                 'get_comment_context': self._context_call,
+                 'get_updates': self._updates_call,
+                 'get_user_history': self._user_history_call,
+                 'search_comments': self._search_call}
+        if data.command not in calls:
+            return self._wrong_response_message
+        return calls[data.command](**data.attrs)
+
+    def _respond(self, call: DBCall, result: Any, serialize: bool) -> Any:
+        """
+        Create response from result of DBClient call
+        :param call: Performed DBClient call
+        :type call: DBCall
+        :param result: Result of DBClient method
+        :type result: Any
+        :param serialize: Flag to return JSON string
+        :type serialize: bool
+        :return: Response
+        :rtype: Any
+        """
+        response = result if call.build is None else call.build(result)
+        return dumps(response) if serialize else response
+
+    def _run(self, call: Union[DBCall, Dict], serialize: bool = False) -> Any:
+        """
+        Perform DBClient call and create response from its result
+        :param call: DBClient call or response if parameters are wrong
+        :type call: Union[DBCall, Dict]
+        :param serialize: Flag to return JSON string
+        :type serialize: bool
+        :return: Response
+        :rtype: Any
+        """
+        if not isinstance(call, DBCall):
+            return dumps(call) if serialize else call
+        method = getattr(self._db_client, call.method)
+        return self._respond(call, method(*call.args, **call.kwargs),
+                             serialize)
+
+    def _process(self, data: RequestData) -> str:
+        """
+        Execute parsed request
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: JSON string with response data
+        :rtype: str
+        """
+        if data.command == 'get_report':
+            return dumps(self.get_report(**data.attrs))
+        return self._run(self._command_call(data), serialize=True)
+
+    @property
+    def commands(self) -> Dict:
+        """Available commands with their parameters"""
+        return self._commands
+
+    @property
+    def metrics(self) -> Union[None, Metrics]:
+        """Commands metrics collector, None if metrics are disabled"""
+        return self._metrics
 
-    def get_table_data(self, table: str) -> List[Dict]:
+    def cache_info(self) -> Dict:
         """
-        Get all information from table
+        Get comment trees cache statistics
+        :return: Dictionary with hits, misses, current and maximum size
+                 and count of stored versions
+        :rtype: Dict
+        """
+        return self._cache.info()
+
+    @call_decorator
+    def _table_call(
+            self,
+            table: str,
+            limit: Union[None, int] = None,
+            after: Union[None, int] = None
+    ) -> DBCall:
+        """
+        Check and convert parameters of table page
+        :return: Call of DBClient.get_table_data
+        :rtype: DBCall
+        """
+        if table not in self._tables:
+            raise ValueError(f'Unknown table {table}')
+        limit = self._page_size if limit is None else int(limit)
+        if limit < 1:
+            raise ValueError(f'limit must be positive, got {limit}')
+        limit = min(limit, self._max_page_size)
+        return DBCall('get_table_data', (table,),
+                      {'limit': limit, 'after': int(after or 0)},
+                      partial(self._table_dict, limit=limit))
+
+    @staticmethod
+    def _table_dict(rows: List[Dict], limit: int) -> Dict:
+        """
+        Create json for table page
+        :param rows: Result of DBClient.get_table_data
+        :type rows: List[Dict]
+        :param limit: Maximum count of rows in page
+        :type limit: int
+        :return: Dictionary with table rows and ID to request next page
+                 from, next page ID is None if there are no more rows
+        :rtype: Dict
+        """
+        next_page = rows[-1]['id'] if len(rows) == limit else None
+        return {'rows': rows, 'next': next_page}
+
+    def get_table_data(
+            self,
+            table: str,
+            limit: Union[None, int] = None,
+            after: Union[None, int] = None
+    ) -> Dict:
+        """
+        Get page of table rows
         :param table: Table name from database
         :type table: str
-        :return: List of tables rows
-        :rtype: List[Dict]
+        :param limit: Maximum count of rows in page
+        :type limit: Union[None, int]
+        :param after: ID of the last row from previous page
+        :type after: Union[None, int]
+        :return: Dictionary with table rows and ID to request next page
+                 from, next page ID is None if there are no more rows
+        :rtype: Dict
         """
-        table_data = self._db_client.get_table_data(table)
-        return table_data
+        return self._run(self._table_call(table, limit, after))
+
+    @staticmethod
+    def _add_comment_call(**kwargs: Any) -> DBCall:
+        """
+        Prepare adding of one comment
+        :param kwargs: Parameters of DBClient.add_comment
+        :type kwargs: Any
+        :return: Call of DBClient.add_comment
+        :rtype: DBCall
+        """
+        return DBCall('add_comment', (), kwargs, None)
+
+    def _url_comments_call(self, url: str, **kwargs: Any) -> DBCall:
+        """
+        Prepare reading of URL first level comments with their activity
+        :return: Call of DBClient.get_url_inheritors
+        :rtype: DBCall
+        """
+        return DBCall('get_url_inheritors', (url,),
+                      {'with_activity': True, **kwargs},
+                      partial(self._pworker.create_sorted_dict,
+                              keys=self._keys + self._activity_keys))
 
     def get_url_comments(self, url: str, **kwargs: Any) -> Dict:
         """
-        Create json for requested url inheritors
+        Create json for requested url first level comments with count of
+        their inheritors and date of the latest of them
         :param url: URL Address
         :type url: str
         :param kwargs: Additional parameters to filter query
@@ -162,24 +702,110 @@ class APIClient:
         :return: Dictionary with comments
         :rtype: Dict
         """
-        result = self._db_client.get_url_inheritors(url, **kwargs)
-        comments_dict = self._pworker.create_sorted_dict(result, self._keys)
+        return self._run(self._url_comments_call(url, **kwargs))
+
+    @staticmethod
+    def _parse_cursor(cursor: str) -> Tuple[Union[None, int], str]:
+        """
+        Parse continuation cursor of collapsed comment
+        :param cursor: Cursor from tree response
+        :type cursor: str
+        :return: Comment ID, None for first level of URL, and path of the
+                 last shown inheritor
+        :rtype: Tuple[Union[None, int], str]
+        """
+        comment_id, after = cursor.split(':', 1)
+        return int(comment_id) or None, after
+
+    @call_decorator
+    def _comment_tree_call(
+            self,
+            url: str,
+            comment_id: Union[None, str] = None,
+            max_depth: Union[None, int] = None,
+            limit_per_level: Union[None, int] = None,
+            cursor: Union[None, str] = None,
+            first_level: bool = False,
+            **kwargs: Any
+    ) -> DBCall:
+        """
+        Check and convert parameters of comments tree, the whole tree is
+        read if neither comment nor its part is requested
+        :return: Call of DBClient.get_url_inheritors or
+                 DBClient.get_tree_page
+        :rtype: DBCall
+        """
+        paged = any(value is not None
+                    for value in (max_depth, limit_per_level, cursor))
+        if not comment_id and not paged:
+            return DBCall('get_url_inheritors', (url, first_level), kwargs,
+                          partial(self._pworker.create_sorted_dict,
+                                  keys=self._keys))
+
+        params = {'comment_id': comment_id, 'after': None}
+        if cursor is not None:
+            params['comment_id'], params['after'] = self._parse_cursor(cursor)
+        for name, value in (('max_depth', max_depth),
+                            ('limit_per_level', limit_per_level)):
+            if value is not None and int(value) < 1:
+                raise ValueError(f'{name} must be positive, got {value}')
+            params[name] = None if value is None else int(value)
+        return DBCall('get_tree_page', (url,), params,
+                      partial(self._tree_page_dict, paged=paged))
+
+    def _tree_page_dict(self, page: Dict, paged: bool) -> Dict:
+        """
+        Create json for comments tree page
+        :param page: Result of DBClient.get_tree_page
+        :type page: Dict
+        :param paged: Flag to add continuation cursors of collapsed comments
+        :type paged: bool
+        :return: Dictionary with comments, or dictionary with comments
+                 and cursor of the first level if it is paged
+        :rtype: Dict
+        """
+        if 'rows' not in page:
+            return page
+        rows = self._pworker.cut_paths(page['rows'], page['depth'])
+        if not paged:
+            return self._pworker.create_sorted_dict(
+                [row[:-1] for row in rows], self._keys)
 
-        return comments_dict
+        rows = [[*row[:-1], None if row[-1] is None else f'{row[1]}:{row[-1]}']
+                for row in rows]
+        comments = self._pworker.create_sorted_dict(rows,
+                                                    self._keys + ['cursor'])
+        cursor = None
+        if page['more'] is not None:
+            cursor = f'{page["comment_id"] or 0}:{page["more"]}'
+        return {'comments': comments, 'cursor': cursor}
 
     def get_comment_tree(
             self,
             url: str,
             comment_id: Union[None, str] = None,
+            max_depth: Union[None, int] = None,
+            limit_per_level: Union[None, int] = None,
+            cursor: Union[None, str] = None,
             first_level: bool = False,
             **kwargs: Any
     ) -> Dict:
         """
-        Create json for requested url or comment inheritors
+        Create json for requested url or comment inheritors. If depth,
+        limit per level or cursor is specified, only part of the tree is
+        returned with cursors to continue loading collapsed comments
         :param url: URL address
         :type url: str
         :param comment_id: Comment ID form comments table
         :type comment_id: int
+        :param max_depth: Count of returned levels
+        :type max_depth: Union[None, int]
+        :param limit_per_level: Maximum count of returned inheritors of
+                                every comment
+        :type limit_per_level: Union[None, int]
+        :param cursor: Cursor of collapsed comment from previous response,
+                       its next inheritors are returned
+        :type cursor: Union[None, str]
         :param first_level: Flag to get only first level comments
         :type first_level: bool
         :param kwargs: Additional parameters to filter query
@@ -187,14 +813,206 @@ class APIClient:
         :return: Dictionary with comments
         :rtype: Dict
         """
-        if comment_id:
-            tree = self._db_client.get_comment_inheritors(comment_id)
-            tree = self._pworker.cut_paths(tree)
-        else:
-            tree = self._db_client.get_url_inheritors(url, first_level,
-                                                      **kwargs)
-        comments_dict = self._pworker.create_sorted_dict(tree, self._keys)
-        return comments_dict
+        return self._run(self._comment_tree_call(
+            url, comment_id, max_depth, limit_per_level, cursor,
+            first_level, **kwargs))
+
+    @call_decorator
+    def _context_call(
+            self, comment_id: int, siblings: Union[None, int] = None
+    ) -> DBCall:
+        """
+        Check and convert parameters of comment context
+        :return: Call of DBClient.get_comment_context
+        :rtype: DBCall
+        """
+        siblings = 0 if siblings is None else int(siblings)
+        if siblings < 0:
+            raise ValueError(f'siblings must not be negative, got {siblings}')
+        return DBCall('get_comment_context', (),
+                      {'comment_id': int(comment_id),
+                       'siblings': min(siblings, self._max_page_size)},
+                      self._context_dict)
+
+    def _context_dict(self, rows: Union[List, Dict]) -> Dict:
+        """
+        Create json for comment context
+        :param rows: Result of DBClient.get_comment_context
+        :type rows: Union[List, Dict]
+        :return: Dictionary with comments
+        :rtype: Dict
+        """
+        if not isinstance(rows, list):
+            return rows
+        return self._pworker.create_sorted_dict(rows, self._keys)
+
+    def get_comment_context(
+            self,
+            comment_id: int,
+            siblings: Union[None, int] = None
+    ) -> Dict:
+        """
+        Create json for comment with chain of its ancestors from first level
+        comment, every level can be shown with its nearest siblings
+        :param comment_id: Comment ID from comments table
+        :type comment_id: int
+        :param siblings: Count of siblings shown before and after comment
+                         and every its ancestor
+        :type siblings: Union[None, int]
+        :return: Dictionary with comments
+        :rtype: Dict
+        """
+        return self._run(self._context_call(comment_id, siblings))
+
+    @call_decorator
+    def _updates_call(
+            self,
+            url: Union[None, str] = None,
+            comment_id: Union[None, int] = None,
+            cursor: Union[None, int] = None,
+            limit: Union[None, int] = None
+    ) -> DBCall:
+        """
+        Check and convert parameters of updates page
+        :return: Call of DBClient.get_updates
+        :rtype: DBCall
+        """
+        limit = self._page_size if limit is None else int(limit)
+        if limit < 1:
+            raise ValueError(f'limit must be positive, got {limit}')
+        limit = min(limit, self._max_page_size)
+        return DBCall('get_updates', (url,),
+                      {'comment_id': (None if comment_id is None
+                                      else int(comment_id)),
+                       'after': None if cursor is None else int(cursor),
+                       'limit': limit},
+                      partial(self._updates_dict, limit=limit))
+
+    def _updates_dict(self, page: Dict, limit: int) -> Dict:
+        """
+        Create json for updates page
+        :param page: Result of DBClient.get_updates
+        :type page: Dict
+        :param limit: Maximum count of comments in page
+        :type limit: int
+        :return: Dictionary with new comments in order they were added,
+                 cursor to request next updates with and flag of comments
+                 left after this page
+        :rtype: Dict
+        """
+        if 'rows' not in page:
+            return page
+        keys = self._keys + ['parent_id']
+        comments = [{'path': row[0], **dict(zip(keys, row[1:]))}
+                    for row in page['rows']]
+        return {'comments': comments, 'cursor': page['cursor'],
+                'more': len(comments) == limit}
+
+    def get_updates(
+            self,
+            url: Union[None, str] = None,
+            comment_id: Union[None, int] = None,
+            cursor: Union[None, int] = None,
+            limit: Union[None, int] = None
+    ) -> Dict:
+        """
+        Create json for comments of URL or inheritors of comment added
+        after cursor. Comments come with their paths and parents IDs, so
+        clients can merge them into already loaded tree. Request without
+        cursor returns only cursor to start polling from
+        :param url: URL address
+        :type url: Union[None, str]
+        :param comment_id: Comment ID form comments table
+        :type comment_id: Union[None, int]
+        :param cursor: Cursor from previous response
+        :type cursor: Union[None, int]
+        :param limit: Maximum count of comments in response
+        :type limit: Union[None, int]
+        :return: Dictionary with comments, cursor and flag of more comments
+        :rtype: Dict
+        """
+        return self._run(self._updates_call(url, comment_id, cursor, limit))
+
+    @call_decorator
+    def _bulk_call(self, comments: List[Dict], **kwargs: Any) -> DBCall:
+        """
+        Check data of every comment before anything is written
+        :param comments: Comments data, see DBClient.add_comments_bulk
+        :type comments: List[Dict]
+        :param kwargs: Additional parameters of DBClient.add_comments_bulk
+        :type kwargs: Any
+        :return: Call of DBClient.add_comments_bulk
+        :rtype: DBCall
+        """
+        if not isinstance(comments, list):
+            raise TypeError('Comments must be a list')
+        DBClient.check_bulk_comments(comments)
+        return DBCall('add_comments_bulk', (comments,), kwargs, None)
+
+    def add_comments_bulk(
+            self, comments: List[Dict], **kwargs: Any
+    ) -> Union[List[int], Dict]:
+        """
+        Add many comments after data of every comment is checked
+        :param comments: Comments data, see DBClient.add_comments_bulk
+        :type comments: List[Dict]
+        :param kwargs: Additional parameters of DBClient.add_comments_bulk
+        :type kwargs: Any
+        :return: Created comments IDs or dictionary with error
+        :rtype: Union[List[int], Dict]
+        """
+        return self._run(self._bulk_call(comments, **kwargs))
+
+    def get_url_id(self, url: str) -> Union[None, int]:
+        """
+        Get ID of URL to subscribe to its events
+        :param url: URL address
+        :type url: str
+        :return: URL ID or None if URL has no comments
+        :rtype: Union[None, int]
+        """
+        return self._db_client.get_url_id(url)
+
+    def missed_events(
+            self, url: str, last_event_id: int
+    ) -> Iterator[List[Dict]]:
+        """
+        Get events of URL comments added after the last event received by
+        reconnected client, page after page, so the whole history is never
+        kept in memory
+        :param url: URL address
+        :type url: str
+        :param last_event_id: ID of the last received event
+        :type last_event_id: int
+        :return: Not empty pages of events in order comments were added
+        :rtype: Iterator[List[Dict]]
+        """
+        more = True
+        while more:
+            page = self.get_updates(url, cursor=last_event_id,
+                                    limit=self._max_page_size)
+            if not page.get('comments'):
+                return
+            yield page['comments']
+            last_event_id, more = page['cursor'], page['more']
+
+    def follow_events(self, interval: float) -> None:
+        """
+        Start relaying comments written by other processes sharing database
+        to events subscribers of this process
+        :param interval: Seconds between database reads
+        :type interval: float
+        """
+        self.events.follow(self._db_client.get_new_comments, interval)
+
+    def _user_history_call(self, user: str, **kwargs: Any) -> DBCall:
+        """
+        Prepare reading of user comments history
+        :return: Call of DBClient.get_user_comments
+        :rtype: DBCall
+        """
+        return DBCall('get_user_comments', (user,), kwargs,
+                      partial(self._pworker.create_dict, keys=self._keys))
 
     def get_user_history(self, user: str, **kwargs: Any) -> Dict:
         """
@@ -206,16 +1024,91 @@ class APIClient:
         :return: Dictionary with comments
         :rtype: Dict
         """
-        result = self._db_client.get_user_comments(user, **kwargs)
-        comments_dict = self._pworker.create_dict(result, self._keys)
-        return comments_dict
+        return self._run(self._user_history_call(user, **kwargs))
 
-    def prepare_data_to_report(
+    @call_decorator
+    def _search_call(
+            self,
+            text: str,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            limit: Union[None, int] = None,
+            cursor: Union[None, str] = None,
+            **kwargs: Any
+    ) -> DBCall:
+        """
+        Check and convert parameters of search page
+        :return: Call of DBClient.search_comments
+        :rtype: DBCall
+        """
+        if not text.split():
+            raise ValueError('Search text is empty')
+        limit = self._page_size if limit is None else int(limit)
+        if limit < 1:
+            raise ValueError(f'limit must be positive, got {limit}')
+        limit = min(limit, self._max_page_size)
+        after = None if cursor is None else int(cursor)
+        return DBCall('search_comments', (text, url, user),
+                      {'limit': limit, 'after': after, **kwargs},
+                      partial(self._search_dict, limit=limit))
+
+    def _search_dict(self, rows: Union[List, Dict], limit: int) -> Dict:
+        """
+        Create json for search page
+        :param rows: Result of DBClient.search_comments
+        :type rows: Union[List, Dict]
+        :param limit: Maximum count of comments in page
+        :type limit: int
+        :return: Dictionary with comments in relevance order and cursor of
+                 the next page, None if there are no more comments. Cursor
+                 is ID of the last comment, comments added between pages
+                 change relevance of others, so they may be skipped or
+                 repeated
+        :rtype: Dict
+        """
+        if not isinstance(rows, list):
+            return rows
+        cursor = None
+        if len(rows) == limit:
+            cursor = str(rows[-1][1])
+        return {'comments': self._pworker.create_dict(rows, self._keys),
+                'cursor': cursor}
+
+    def search_comments(
             self,
+            text: str,
             url: Union[None, str] = None,
             user: Union[None, str] = None,
+            limit: Union[None, int] = None,
+            cursor: Union[None, str] = None,
             **kwargs: Any
     ) -> Dict:
+        """
+        Create json for comments containing every word of text
+        :param text: Searched words separated by spaces
+        :type text: str
+        :param url: Optional, if specified: search only comments of URL
+        :type url: Union[None, str]
+        :param user: Optional, if specified: search only comments of user
+        :type user: Union[None, str]
+        :param limit: Maximum count of comments in page
+        :type limit: Union[None, int]
+        :param cursor: Cursor from previous page response
+        :type cursor: Union[None, str]
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Dictionary with comments and cursor of the next page
+        :rtype: Dict
+        """
+        return self._run(self._search_call(text, url, user, limit, cursor,
+                                           **kwargs))
+
+    def prepare_data_to_report(
+            self,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            **kwargs: Any
+    ) -> Iterator:
         """
         Get user or url comments history
         :param user: Username
@@ -224,16 +1117,38 @@ class APIClient:
         :type url: str
         :param kwargs: Additional parameters to filter query
         :type kwargs: Any
-        :return: Dictionary with comments
-        :rtype: Dict
+        :return: Iterator over comments rows fetched from database
+                 while iterating
+        :rtype: Iterator
         """
-        if user:
-            result_dict = self.get_user_history(user, **kwargs)
-        elif url:
-            result = self._db_client.get_url_inheritors(url, first_level=False,
-                                                        **kwargs)
-            result_dict = self._pworker.create_dict(result, self._keys)
-        else:
-            result_dict = {}
+        return self._db_client.iter_report_rows(url=url, user=user, **kwargs)
 
-        return result_dict
+    def get_report(
+            self,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            report_format: Union[None, str] = None,
+            compress: Union[None, bool] = None,
+            **kwargs: Any
+    ) -> Union[str, Dict]:
+        """
+        Stream user or url comments history to report file
+        :param user: Username
+        :type user: str
+        :param url: URL address
+        :type url: str
+        :param report_format: Report format, 'csv' (default) or 'ndjson'
+        :type report_format: Union[None, str]
+        :param compress: Flag to compress report with gzip
+        :type compress: Union[None, bool]
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Path to report file
+        :rtype: Union[str, Dict]
+        """
+        savers = {'csv': self._save_csv, 'ndjson': self._save_ndjson}
+        saver = savers.get(report_format or 'csv')
+        if saver is None:
+            return self._wrong_response_message
+        comments = self.prepare_data_to_report(url, user, **kwargs)
+        return saver(comments, compress=bool(compress))
@@ -0,0 +1,452 @@
+import asyncio
+import logging
+from contextlib import nullcontext
+from itertools import groupby
+from typing import Any, AsyncIterator, Callable, Dict, List, Union
+
+from .api_client import APIClient, DBCall, RequestData
+from .async_db_client import AsyncDBClient
+from .metrics import command_scope
+from .serializer import dumps
+
+logger = logging.getLogger(__name__)
+
+# Responses built from more rows are created in thread pool, smaller ones
+# are created faster than thread is switched
+_OFFLOAD_ROWS = 100
+# Count of report rows written to file at once
+_REPORT_BATCH = 1000
+
+
+def _rows_count(result: Any) -> int:
+    """
+    Count rows in DBClient method result
+    :param result: List of rows or dictionary with them in 'rows' key
+    :type result: Any
+    :return: Count of rows, 0 for other results
+    :rtype: int
+    """
+    if isinstance(result, dict):
+        result = result.get('rows')
+    return len(result) if isinstance(result, list) else 0
+
+
+class AsyncAPIClient(APIClient):
+    """
+    Class to process requests from event loop. Supports the same commands,
+    cache and report formats as APIClient, but its request methods are
+    coroutines, so slow requests do not block each other. Large responses,
+    cache backends waiting for I/O and report files are handled in thread
+    pool, so event loop only waits for them
+    """
+    db_client_class = AsyncDBClient
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """Parameters are the same as APIClient ones"""
+        self._invalidation = None
+        super().__init__(*args, **kwargs)
+
+    async def _cache_call(
+            self, func: Callable, *args: Any, **kwargs: Any
+    ) -> Any:
+        """
+        Call cache method, in thread pool if cache backend waits for I/O
+        :param func: ResultCache method
+        :type func: Callable
+        :param args: Method positional arguments
+        :type args: Any
+        :param kwargs: Method keyword arguments
+        :type kwargs: Any
+        :return: Method result
+        :rtype: Any
+        """
+        if self._cache.blocking:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def _invalidate_cache(self, comments: List[Dict]) -> None:
+        """
+        Increase versions of comments tree parts changed by written comments.
+        Backend waiting for I/O is called in thread pool after previous
+        invalidations, cache of this client is read after all of them
+        :param comments: Written comments with 'url_id' and 'path' keys
+        :type comments: List[Dict]
+        """
+        if not self._cache.blocking:
+            self._cache.invalidate(comments)
+            return
+        self._invalidation = asyncio.ensure_future(
+            self._invalidate_after(self._invalidation, comments))
+
+    async def _invalidate_after(
+            self, previous: Union[None, asyncio.Future], comments: List[Dict]
+    ) -> None:
+        """
+        Invalidate cache in thread pool after previous invalidation
+        :param previous: Previous invalidation, None if there was no one
+        :type previous: Union[None, asyncio.Future]
+        :param comments: Written comments with 'url_id' and 'path' keys
+        :type comments: List[Dict]
+        """
+        if previous is not None:
+            await previous
+        try:
+            await asyncio.to_thread(self._cache.invalidate, comments)
+        except Exception:
+            logger.exception('Cache invalidation failed')
+
+    async def _cache_scope(self, data: RequestData) -> Union[None, Dict]:
+        """
+        Find the part of comments tree requested comments are taken from
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Dictionary with URL ID, subtree path and first level flag
+                 or None if requested comments are not exist
+        :rtype: Union[None, Dict]
+        """
+        try:
+            comment_id = self._scope_comment_id(data)
+        except ValueError:
+            return None
+        if data.command == 'get_comment_tree' and comment_id:
+            scope = await self._db_client.get_comment_scope(comment_id)
+            if scope is None:
+                return None
+            url_id, path = scope
+            return {'url_id': url_id, 'path': path}
+
+        url_id = await self._db_client.get_url_id(data.attrs['url'])
+        if url_id is None:
+            return None
+        first_level = data.command == 'ger_url_first_level_comments'
+        return {'url_id': url_id, 'first_level': first_level}
+
+    async def process_request(self, request: str) -> str:
+        """
+        Process request. Request is one command or array of commands, array
+        is responded with array of results in the same order
+        :param request: JSON string with request data
+        :type request: str
+        :return: JSON string with response data
+        :rtype: str
+        """
+        data = self._parse_request(request)
+        if isinstance(data, list):
+            return await self._process_batch(data)
+        return await self._process_measured(data)
+
+    async def _process_batch(self, batch: List[RequestData]) -> str:
+        """
+        Process array of commands in their order. Successive reads are run
+        in one database snapshot and identical reads among them are run once,
+        writes and reports are run separately
+        :param batch: Parsed commands
+        :type batch: List[RequestData]
+        :return: JSON array with commands responses
+        :rtype: str
+        """
+        if len(batch) > self._max_batch_size:
+            return dumps(self._wrong_response_message)
+
+        results = []
+        for is_read, group in groupby(
+                batch, lambda data: data.command in self._read_commands):
+            if not is_read:
+                for data in group:
+                    results.append(await self._process_measured(data))
+                continue
+            group = list(group)
+            # Versions are read before snapshot begins, so result of snapshot
+            # is not cached under version of later write it does not see
+            cache_keys = await self._cache_keys(group)
+            # Replica may not have the write which changed version yet
+            reads = (self._db_client.primary_reads()
+                     if any(cache_keys.values()) else nullcontext())
+            responses = {}
+            with reads:
+                async with self._db_client.snapshot():
+                    for data in group:
+                        key = self._request_key(data)
+                        if key not in responses:
+                            responses[key] = await self._process_measured(
+                                data, cache_keys)
+                        results.append(responses[key])
+        return '[' + ','.join(results) + ']'
+
+    async def _cache_keys(
+            self, batch: List[RequestData]
+    ) -> Dict[str, Union[None, str]]:
+        """
+        Get versioned cache keys of parsed requests
+        :param batch: Parsed requests
+        :type batch: List[RequestData]
+        :return: Dictionary with cache keys by request keys, None for
+                 requests whose responses are not cached
+        :rtype: Dict[str, Union[None, str]]
+        """
+        cache_keys = {}
+        for data in batch:
+            key = self._request_key(data)
+            if key not in cache_keys:
+                with command_scope(self._metrics_command(data)):
+                    cache_keys[key] = await self._cache_key(data)
+        return cache_keys
+
+    async def _cache_key(self, data: RequestData) -> Union[None, str]:
+        """
+        Get cache key of parsed request with current versions of the part
+        of comments tree its response is taken from, after invalidations
+        started by this client
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: Cache key or None if response is not cached
+        :rtype: Union[None, str]
+        """
+        if data.command not in self._cached_commands:
+            return None
+        scope = await self._cache_scope(data)
+        if scope is None:
+            return None
+        if self._invalidation is not None:
+            await self._invalidation
+        return await self._cache_call(self._cache.versioned_key,
+                                      self._request_key(data), **scope)
+
+    async def _process_measured(
+            self, data: RequestData,
+            cache_keys: Union[None, Dict[str, Union[None, str]]] = None
+    ) -> str:
+        """
+        Execute parsed request marked with its command name and collect
+        its metrics if they are enabled
+        :param data: Parsed request data
+        :type data: RequestData
+        :param cache_keys: Cache keys of batch requests read before its
+                           snapshot, None to read key of this request
+        :type cache_keys: Union[None, Dict[str, Union[None, str]]]
+        :return: JSON string with response data
+        :rtype: str
+        """
+        command = self._metrics_command(data)
+        with command_scope(command):
+            if self._metrics is None:
+                return await self._process_cached(data, cache_keys)
+            with self._metrics.track(command) as stats:
+                response = await self._process_cached(data, cache_keys)
+                stats.response_size = len(response)
+        return response
+
+    async def _process_cached(
+            self, data: RequestData,
+            cache_keys: Union[None, Dict[str, Union[None, str]]] = None
+    ) -> str:
+        """
+        Execute parsed request, comment trees responses are served from
+        cache until new comment is added to their part of the tree. Cached
+        responses are read from writing engine
+        :param data: Parsed request data
+        :type data: RequestData
+        :param cache_keys: Cache keys of batch requests read before its
+                           snapshot, None to read key of this request
+        :type cache_keys: Union[None, Dict[str, Union[None, str]]]
+        :return: JSON string with response data
+        :rtype: str
+        """
+        if cache_keys is None:
+            key = await self._cache_key(data)
+        else:
+            key = cache_keys[self._request_key(data)]
+        if key is None:
+            return await self._process(data)
+
+        response = await self._cache_call(self._cache.get, key)
+        if response is None:
+            # Replica may not have the write which changed version yet,
+            # its result would be cached as the current one
+            with self._db_client.primary_reads():
+                response = await self._process(data)
+            await self._cache_call(self._cache.set, key, response)
+        return response
+
+    async def _run(
+            self, call: Union[DBCall, Dict], serialize: bool = False
+    ) -> Any:
+        """
+        Perform DBClient call and create response from its result, large
+        response is created in thread pool
+        :param call: DBClient call or response if parameters are wrong
+        :type call: Union[DBCall, Dict]
+        :param serialize: Flag to return JSON string
+        :type serialize: bool
+        :return: Response
+        :rtype: Any
+        """
+        if not isinstance(call, DBCall):
+            return dumps(call) if serialize else call
+        method = getattr(self._db_client, call.method)
+        result = await method(*call.args, **call.kwargs)
+        if _rows_count(result) > _OFFLOAD_ROWS:
+            return await asyncio.to_thread(self._respond, call, result,
+                                           serialize)
+        return self._respond(call, result, serialize)
+
+    async def _process(self, data: RequestData) -> str:
+        """
+        Execute parsed request
+        :param data: Parsed request data
+        :type data: RequestData
+        :return: JSON string with response data
+        :rtype: str
+        """
+        if data.command == 'get_report':
+            return dumps(await self.get_report(**data.attrs))
+        return await self._run(self._command_call(data), serialize=True)
+
+    async def get_table_data(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.get_table_data"""
+        return await self._run(self._table_call(*args, **kwargs))
+
+    async def get_url_comments(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.get_url_comments"""
+        return await self._run(self._url_comments_call(*args, **kwargs))
+
+    async def get_comment_tree(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.get_comment_tree"""
+        return await self._run(self._comment_tree_call(*args, **kwargs))
+
+    async def get_comment_context(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.get_comment_context"""
+        return await self._run(self._context_call(*args, **kwargs))
+
+    async def get_updates(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.get_updates"""
+        return await self._run(self._updates_call(*args, **kwargs))
+
+    async def add_comments_bulk(
+            self, *args: Any, **kwargs: Any
+    ) -> Union[List[int], Dict]:
+        """Coroutine of APIClient.add_comments_bulk"""
+        return await self._run(self._bulk_call(*args, **kwargs))
+
+    async def get_url_id(self, url: str) -> Union[None, int]:
+        """Coroutine of APIClient.get_url_id"""
+        return await self._db_client.get_url_id(url)
+
+    async def missed_events(
+            self, url: str, last_event_id: int
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Get events of URL comments added after the last event received by
+        reconnected client, page after page
+        :param url: URL address
+        :type url: str
+        :param last_event_id: ID of the last received event
+        :type last_event_id: int
+        :return: Not empty pages of events in order comments were added
+        :rtype: AsyncIterator[List[Dict]]
+        """
+        more = True
+        while more:
+            page = await self.get_updates(url, cursor=last_event_id,
+                                          limit=self._max_page_size)
+            if not page.get('comments'):
+                return
+            yield page['comments']
+            last_event_id, more = page['cursor'], page['more']
+
+    async def follow_events(self, interval: float) -> None:
+        """
+        Relay comments written by other processes sharing database to
+        events subscribers of this process until task is cancelled
+        :param interval: Seconds between database reads
+        :type interval: float
+        """
+        await self.events.follow_async(self._db_client.get_new_comments,
+                                       interval)
+
+    async def get_user_history(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.get_user_history"""
+        return await self._run(self._user_history_call(*args, **kwargs))
+
+    async def search_comments(self, *args: Any, **kwargs: Any) -> Dict:
+        """Coroutine of APIClient.search_comments"""
+        return await self._run(self._search_call(*args, **kwargs))
+
+    def prepare_data_to_report(
+            self,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            **kwargs: Any
+    ) -> AsyncIterator:
+        """
+        Get user or url comments history
+        :param user: Username
+        :type user: str
+        :param url: URL address
+        :type url: str
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Asynchronous iterator over comments rows fetched from
+                 database while iterating
+        :rtype: AsyncIterator
+        """
+        return self._db_client.iter_report_rows(url=url, user=user, **kwargs)
+
+    async def get_report(
+            self,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            report_format: Union[None, str] = None,
+            compress: Union[None, bool] = None,
+            **kwargs: Any
+    ) -> Union[str, Dict]:
+        """
+        Stream user or url comments history to report file. Rows are
+        written to file by batches in thread pool
+        :param user: Username
+        :type user: str
+        :param url: URL address
+        :type url: str
+        :param report_format: Report format, 'csv' (default) or 'ndjson'
+        :type report_format: Union[None, str]
+        :param compress: Flag to compress report with gzip
+        :type compress: Union[None, bool]
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Path to report file
+        :rtype: Union[str, Dict]
+        """
+        report_format = report_format or 'csv'
+        starters = {'csv': self._start_csv, 'ndjson': self._start_ndjson}
+        if report_format not in starters:
+            return self._wrong_response_message
+        compress = bool(compress)
+
+        comments = self.prepare_data_to_report(url, user, **kwargs)
+        data_path = await asyncio.to_thread(self._create_report_file,
+                                            report_format, compress)
+        fi = await asyncio.to_thread(self._open_report, data_path, compress)
+        try:
+            write = await asyncio.to_thread(starters[report_format], fi)
+            batch = []
+            async for comment in comments:
+                batch.append(comment)
+                if len(batch) == _REPORT_BATCH:
+                    await asyncio.to_thread(self._write_rows, write, batch)
+                    batch = []
+            await asyncio.to_thread(self._write_rows, write, batch)
+        finally:
+            await asyncio.to_thread(fi.close)
+        return data_path
+
+    @staticmethod
+    def _write_rows(write: Callable, comments: List) -> None:
+        """
+        Write comments rows to report
+        :param write: Function writing comment row to report
+        :type write: Callable
+        :param comments: Comments rows, zero index is related to path
+        :type comments: List
+        """
+        for comment in comments:
+            write(comment)
@@ -0,0 +1,214 @@
+import functools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import (Any, AsyncIterator, Callable, ContextManager, Dict,
+                    Sequence, Union)
+
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from .db_client import DBClient, begin_snapshot
+from .metrics import record_rows
+
+# Client and Session of snapshot opened in current task
+_snapshot_session = ContextVar('async_snapshot_session',
+                               default=(None, None))
+
+
+def run_sync_decorator(method: Callable) -> Callable:
+    """
+    Decorator to perform DBClient method under asynchronous ORM Session.
+    Method is executed by AsyncSession.run_sync, so database driver calls
+    do not block event loop
+    :param method: DBClient method decorated with session_decorator or
+                   read_session_decorator
+    :type method: Callable
+    :return: Coroutine function with the same parameters
+    :rtype: Callable
+    """
+    sync_method = method.__wrapped__
+    engine_name = method.engine_name
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        """
+        Perform initial method under AsyncSession and return empty dict
+        if transaction cant get result. Session of opened snapshot is used
+        if there is one
+        """
+        def run(session):
+            return sync_method(self._db_client, session, *args, **kwargs)
+
+        client, snapshot = _snapshot_session.get()
+        if client is self:
+            try:
+                result = await snapshot.run_sync(run)
+            except NoResultFound:
+                return {'Response': 'No results'}
+            record_rows(result)
+            return result
+
+        async with AsyncSession(getattr(self, engine_name)) as session:
+            try:
+                result = await session.run_sync(run)
+            except NoResultFound:
+                return {'Response': 'No results'}
+        record_rows(result)
+        return result
+
+    return wrapper
+
+
+class AsyncDBClient:
+    """
+    Class to perform database transaction operations from event loop,
+    transactions logic is shared with DBClient
+    """
+    def __init__(
+            self,
+            engine: AsyncEngine,
+            id_cache_size: int = 10000,
+            read_engines: Union[None, Sequence[AsyncEngine]] = None,
+            read_your_writes: float = 0.0,
+            slow_query_threshold: Union[None, float] = None,
+            storage: str = 'path'
+    ):
+        """
+        Initialize class
+        :param engine: Object establishing asynchronous connection
+                       to database, all writes are sent to it
+        :type engine: sqlalchemy.ext.asyncio.AsyncEngine
+        :param id_cache_size: Count of users and URLs IDs kept in memory
+        :type id_cache_size: int
+        :param read_engines: Optional, if specified: objects establishing
+                             connections used for reading in turn
+        :type read_engines: Union[None,
+                                  Sequence[sqlalchemy.ext.asyncio.AsyncEngine]]
+        :param read_your_writes: Seconds during which reads of task, that
+                                 has written data, are sent to writing engine
+        :type read_your_writes: float
+        :param slow_query_threshold: Optional, if specified: statements
+                                     executed longer than this count of
+                                     seconds are logged with their query
+                                     plan
+        :type slow_query_threshold: Union[None, float]
+        :param storage: Way inheritors of comment are found, 'path' or
+                        'closure', see DBClient
+        :type storage: str
+        """
+        self._engine = engine
+        read_engines = list(read_engines or [])
+        self._db_client = DBClient(
+            engine.sync_engine, id_cache_size,
+            [read_engine.sync_engine for read_engine in read_engines],
+            read_your_writes, slow_query_threshold, storage)
+        # Engines are chosen by DBClient, asynchronous engines are found
+        # by their synchronous proxies
+        primary_read_engine = AsyncEngine(
+            self._db_client._primary_read_engine)
+        self._async_engines = {read_engine.sync_engine: read_engine
+                               for read_engine in [primary_read_engine,
+                                                   *read_engines]}
+        self.slow_query_log = self._db_client.slow_query_log
+        self.keys = self._db_client.keys
+
+    @property
+    def _read_engine(self) -> AsyncEngine:
+        """
+        Engine for next reading, chosen in the same way as by DBClient
+        :return: Object establishing asynchronous connection to database
+        :rtype: sqlalchemy.ext.asyncio.AsyncEngine
+        """
+        return self._async_engines[self._db_client._read_engine]
+
+    @asynccontextmanager
+    async def snapshot(self) -> AsyncIterator[AsyncSession]:
+        """
+        Open one Session and read transaction used by methods of this client
+        awaited in this block in current task, so they see the same
+        database state. Block is meant for reads, it is rolled back at the end
+        :return: Snapshot Session
+        :rtype: AsyncIterator[AsyncSession]
+        """
+        async with AsyncSession(self._read_engine) as session:
+            await session.run_sync(begin_snapshot)
+            token = _snapshot_session.set((self, session))
+            try:
+                yield session
+            finally:
+                _snapshot_session.reset(token)
+                await session.rollback()
+
+    def primary_reads(self) -> ContextManager[None]:
+        """
+        Send reads awaited in this block in current task to writing engine,
+        see DBClient.primary_reads
+        :return: Context manager of block
+        :rtype: ContextManager[None]
+        """
+        return self._db_client.primary_reads()
+
+    def subscribe(self, listener: Callable) -> None:
+        """
+        Register function to be called after every commit with comments
+        written to database
+        :param listener: Function taking list of comments table rows
+        :type listener: Callable
+        """
+        self._db_client.subscribe(listener)
+
+    def id_cache_info(self) -> Dict:
+        """
+        Get users and URLs IDs cache statistics
+        :return: Dictionary with hits, misses, current and maximum size
+        :rtype: Dict
+        """
+        return self._db_client.id_cache_info()
+
+    get_table_data = run_sync_decorator(DBClient.get_table_data)
+    add_comment = run_sync_decorator(DBClient.add_comment)
+    add_comments_bulk = run_sync_decorator(DBClient.add_comments_bulk)
+    get_url_id = run_sync_decorator(DBClient.get_url_id)
+    get_comment_scope = run_sync_decorator(DBClient.get_comment_scope)
+    get_comment_context = run_sync_decorator(DBClient.get_comment_context)
+    get_comment_inheritors = run_sync_decorator(
+        DBClient.get_comment_inheritors)
+    get_tree_page = run_sync_decorator(DBClient.get_tree_page)
+    get_updates = run_sync_decorator(DBClient.get_updates)
+    get_new_comments = run_sync_decorator(DBClient.get_new_comments)
+    get_url_inheritors = run_sync_decorator(DBClient.get_url_inheritors)
+    get_user_comments = run_sync_decorator(DBClient.get_user_comments)
+    search_comments = run_sync_decorator(DBClient.search_comments)
+
+    async def iter_report_rows(
+            self,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            batch_size: int = 1000,
+            **kwargs: Any
+    ) -> AsyncIterator:
+        """
+        Iterate over user or URL comments history. Rows are streamed from
+        database by batches while iterating
+        :param url: URL address
+        :type url: Union[None, str]
+        :param user: Username, has priority over URL
+        :type user: Union[None, str]
+        :param batch_size: Count of rows fetched from database at once
+        :type batch_size: int
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Asynchronous iterator over comments rows, nothing if user
+                 or URL are not found
+        :rtype: AsyncIterator
+        """
+        async with AsyncSession(self._read_engine) as session:
+            query = await session.run_sync(
+                lambda sync_session: self._db_client._report_query(
+                    sync_session, url, user, **kwargs))
+            if query is None:
+                return
+            result = await session.stream(
+                query.statement.execution_options(yield_per=batch_size))
+            async for row in result:
+                yield row
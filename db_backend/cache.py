@@ -0,0 +1,491 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Union
+
+from .path_worker import PathWorker
+
+# Default count of stored versions per stored response, writes change
+# versions of every ancestor of written comment
+_VERSIONS_PER_RESPONSE = 4
+
+
+class LRUCache:
+    """Bounded in-memory mapping which evicts least recently used items"""
+    def __init__(
+            self,
+            maxsize: int = 1024,
+            ttl: Union[None, float] = None,
+            on_evict: Union[None, Callable] = None
+    ):
+        """
+        :param maxsize: Maximum count of stored items
+        :type maxsize: int
+        :param ttl: Optional, if specified: seconds while item is valid
+        :type ttl: Union[None, float]
+        :param on_evict: Optional, if specified: function called with key of
+                         item removed from cache because of size or age
+        :type on_evict: Union[None, Callable]
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get item from cache and mark it as recently used
+        :param key: Item key
+        :type key: Hashable
+        :param default: Value to return if key is not in cache
+        :type default: Any
+        :return: Cached value or default
+        :rtype: Any
+        """
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            value, expires = self._data[key]
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                evicted = True
+            else:
+                self.hits += 1
+                evicted = False
+        if evicted:
+            if self._on_evict is not None:
+                self._on_evict(key)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Put item to cache, evicting least recently used one if cache is full
+        :param key: Item key
+        :type key: Hashable
+        :param value: Item value
+        :type value: Any
+        """
+        expires = time.monotonic() + self._ttl if self._ttl else None
+        evicted = None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            if len(self._data) > self._maxsize:
+                evicted, _ = self._data.popitem(last=False)
+        if evicted is not None and self._on_evict is not None:
+            self._on_evict(evicted)
+
+    def pop(self, key: Hashable) -> Any:
+        """
+        Remove item from cache
+        :param key: Item key
+        :type key: Hashable
+        :return: Removed value or None if key is not in cache
+        :rtype: Any
+        """
+        with self._lock:
+            value, _ = self._data.pop(key, (None, None))
+            return value
+
+    def clear(self) -> None:
+        """Remove all items from cache"""
+        with self._lock:
+            self._data.clear()
+
+    def info(self) -> Dict:
+        """
+        Get cache statistics
+        :return: Dictionary with hits, misses, current and maximum size
+        :rtype: Dict
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data), 'maxsize': self._maxsize}
+
+
+class CacheBackend(ABC):
+    """
+    Storage of serialized responses and versions of comments tree parts.
+    Responses are stored under keys containing versions, so they become
+    unreachable when any of these versions is increased. Both responses
+    and versions are evicted when storage is full. Every version value is
+    given once, so evicted version gets new value and responses stored
+    under the old one are never returned
+    """
+    # Backend waiting for I/O, asynchronous clients call it in thread pool
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> Union[None, str]:
+        """
+        Get stored response
+        :param key: Response key
+        :type key: str
+        :return: Serialized response or None if it is not stored
+        :rtype: Union[None, str]
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """
+        Store response
+        :param key: Response key
+        :type key: str
+        :param value: Serialized response
+        :type value: str
+        """
+
+    @abstractmethod
+    def get_versions(self, names: List[str]) -> List[int]:
+        """
+        Get current versions, unknown versions get new values
+        :param names: Versions names
+        :type names: List[str]
+        :return: Versions values in the same order
+        :rtype: List[int]
+        """
+
+    @abstractmethod
+    def incr_versions(self, names: List[str]) -> None:
+        """
+        Increase versions to values never given before
+        :param names: Versions names
+        :type names: List[str]
+        """
+
+    @abstractmethod
+    def info(self) -> Dict:
+        """
+        Get cache statistics
+        :return: Dictionary with hits, misses, current and maximum size
+                 and count of stored versions
+        :rtype: Dict
+        """
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Cache backend storing responses in memory of current process"""
+    def __init__(
+            self,
+            maxsize: int = 1024,
+            ttl: Union[None, float] = None,
+            versions_maxsize: Union[None, int] = None
+    ):
+        """
+        :param maxsize: Maximum count of stored responses
+        :type maxsize: int
+        :param ttl: Optional, if specified: seconds while response is valid
+        :type ttl: Union[None, float]
+        :param versions_maxsize: Maximum count of stored versions, four
+                                 times responses count by default
+        :type versions_maxsize: Union[None, int]
+        """
+        if versions_maxsize is None:
+            versions_maxsize = _VERSIONS_PER_RESPONSE * maxsize
+        self._responses = LRUCache(maxsize, ttl)
+        self._versions = LRUCache(versions_maxsize)
+        self._values = count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Union[None, str]:
+        return self._responses.get(key)
+
+    def set(self, key: str, value: str) -> None:
+        self._responses.set(key, value)
+
+    def get_versions(self, names: List[str]) -> List[int]:
+        versions = []
+        with self._lock:
+            for name in names:
+                version = self._versions.get(name)
+                if version is None:
+                    version = next(self._values)
+                    self._versions.set(name, version)
+                versions.append(version)
+        return versions
+
+    def incr_versions(self, names: List[str]) -> None:
+        with self._lock:
+            for name in names:
+                self._versions.set(name, next(self._values))
+
+    def info(self) -> Dict:
+        return {**self._responses.info(), 'versions': len(self._versions)}
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache backend storing responses in SQLite file, so it is shared by
+    all processes using the same file. The oldest stored responses are
+    evicted when cache is full
+    """
+    blocking = True
+
+    def __init__(
+            self,
+            path: str,
+            maxsize: int = 1024,
+            ttl: Union[None, float] = None,
+            timeout: float = 5.0,
+            versions_maxsize: Union[None, int] = None
+    ):
+        """
+        :param path: Path to cache database file
+        :type path: str
+        :param maxsize: Maximum count of stored responses
+        :type maxsize: int
+        :param ttl: Optional, if specified: seconds while response is valid
+        :type ttl: Union[None, float]
+        :param timeout: Seconds to wait while file is locked by other process
+        :type timeout: float
+        :param versions_maxsize: Maximum count of stored versions, four
+                                 times responses count by default
+        :type versions_maxsize: Union[None, int]
+        """
+        if versions_maxsize is None:
+            versions_maxsize = _VERSIONS_PER_RESPONSE * maxsize
+        self._path = path
+        self._maxsize = maxsize
+        self._versions_maxsize = versions_maxsize
+        self._ttl = ttl
+        self._timeout = timeout
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                               'stored REAL NOT NULL, expires REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS '
+                               'ix_responses_stored ON responses (stored)')
+            # Version is row ID, AUTOINCREMENT never gives ID of deleted
+            # row again, so evicted version is never repeated
+            connection.execute('CREATE TABLE IF NOT EXISTS version_ids '
+                               '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               'name TEXT NOT NULL UNIQUE)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get connection of current thread, sqlite3 connections can not be
+        shared by threads
+        :return: Connection to cache database
+        :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=self._timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Union[None, str]:
+        row = self._connection().execute(
+            'SELECT value FROM responses WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        expires = now + self._ttl if self._ttl else None
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO responses '
+                               '(key, value, stored, expires) '
+                               'VALUES (?, ?, ?, ?)',
+                               (key, value, now, expires))
+            connection.execute('DELETE FROM responses WHERE expires <= ? '
+                               'OR stored < (SELECT stored FROM responses '
+                               'ORDER BY stored DESC LIMIT 1 OFFSET ?)',
+                               (now, self._maxsize - 1))
+
+    def _select_versions(self, names: List[str]) -> Dict[str, int]:
+        """
+        Get stored versions
+        :param names: Versions names
+        :type names: List[str]
+        :return: Versions values by their names
+        :rtype: Dict[str, int]
+        """
+        placeholders = ', '.join('?' * len(names))
+        rows = self._connection().execute(
+            f'SELECT name, id FROM version_ids '
+            f'WHERE name IN ({placeholders})', names).fetchall()
+        return dict(rows)
+
+    def _store_versions(
+            self, names: List[str], replace: bool
+    ) -> Dict[str, int]:
+        """
+        Give new values to versions and evict the oldest other ones
+        :param names: Versions names
+        :type names: List[str]
+        :param replace: Flag to change values of stored versions
+        :type replace: bool
+        :return: Versions values by their names
+        :rtype: Dict[str, int]
+        """
+        conflict = 'REPLACE' if replace else 'IGNORE'
+        with self._connection() as connection:
+            connection.executemany(f'INSERT OR {conflict} INTO version_ids '
+                                   f'(name) VALUES (?)',
+                                   [(name,) for name in names])
+            connection.execute('DELETE FROM version_ids WHERE id <= '
+                               '(SELECT id FROM version_ids '
+                               'ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                               (max(self._versions_maxsize, len(names)),))
+            return self._select_versions(names)
+
+    def get_versions(self, names: List[str]) -> List[int]:
+        versions = self._select_versions(names)
+        unknown = [name for name in names if name not in versions]
+        if unknown:
+            versions.update(self._store_versions(unknown, replace=False))
+        return [versions[name] for name in names]
+
+    def incr_versions(self, names: List[str]) -> None:
+        self._store_versions(names, replace=True)
+
+    def info(self) -> Dict:
+        size, = self._connection().execute(
+            'SELECT count(*) FROM responses').fetchone()
+        versions, = self._connection().execute(
+            'SELECT count(*) FROM version_ids').fetchone()
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': size, 'maxsize': self._maxsize, 'versions': versions}
+
+
+class ResultCache:
+    """
+    Cache of serialized API responses bound to the part of comments tree
+    they were built from. Every part has version counter which is
+    increased when new comment is written to it, response key contains
+    versions of its part, so processes sharing backend never get response
+    built before the last write
+    """
+    def __init__(self, backend: Union[None, CacheBackend] = None):
+        """
+        :param backend: Optional, if specified: responses storage,
+                        in-memory storage of current process by default
+        :type backend: Union[None, CacheBackend]
+        """
+        self._backend = backend or MemoryCacheBackend()
+
+    @property
+    def blocking(self) -> bool:
+        """Flag of backend waiting for I/O"""
+        return self._backend.blocking
+
+    @staticmethod
+    def _version_names(
+            url_id: int,
+            path: Union[None, str] = None,
+            first_level: bool = False
+    ) -> List[str]:
+        """
+        Get names of version counters of the part of comments tree
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param path: Path of subtree root, None for whole URL tree
+        :type path: Union[None, str]
+        :param first_level: Flag if the part has only first level comments
+        :type first_level: bool
+        :return: Version counters names
+        :rtype: List[str]
+        """
+        if path is not None:
+            return [f'tree:{url_id}:{path}']
+        if first_level:
+            return [f'roots:{url_id}']
+        return [f'url:{url_id}']
+
+    def versioned_key(
+            self,
+            key: str,
+            url_id: int,
+            path: Union[None, str] = None,
+            first_level: bool = False
+    ) -> str:
+        """
+        Add current versions of comments tree part to request key. Versions
+        have to be taken before response is built
+        :param key: Request key
+        :type key: str
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param path: Path of subtree root, None for whole URL tree
+        :type path: Union[None, str]
+        :param first_level: Flag if response has only first level comments
+        :type first_level: bool
+        :return: Key to get and store response
+        :rtype: str
+        """
+        names = self._version_names(url_id, path, first_level)
+        versions = self._backend.get_versions(names)
+        return f'{key}@' + ','.join(map(str, versions))
+
+    def get(self, key: str) -> Union[None, str]:
+        """
+        Get cached response
+        :param key: Key returned by versioned_key
+        :type key: str
+        :return: Serialized response or None if it is not cached
+        :rtype: Union[None, str]
+        """
+        return self._backend.get(key)
+
+    def set(self, key: str, response: str) -> None:
+        """
+        Store response
+        :param key: Key returned by versioned_key
+        :type key: str
+        :param response: Serialized response
+        :type response: str
+        """
+        self._backend.set(key, response)
+
+    def invalidate(self, comments: Iterable[Dict]) -> None:
+        """
+        Increase versions of all tree parts containing added comments
+        :param comments: Added comments with 'url_id' and 'path' keys
+        :type comments: Iterable[Dict]
+        """
+        names = {}
+        for comment in comments:
+            url_id, path = comment['url_id'], comment['path']
+            names.update(dict.fromkeys(self._version_names(url_id)))
+            # First level comments show count of their inheritors, so they
+            # are changed by comment on any level
+            names.update(dict.fromkeys(
+                self._version_names(url_id, first_level=True)))
+            for ancestor in PathWorker.ancestor_paths(path):
+                names.update(dict.fromkeys(
+                    self._version_names(url_id, ancestor)))
+        if names:
+            self._backend.incr_versions(list(names))
+
+    def info(self) -> Dict:
+        """
+        Get cache statistics
+        :return: Dictionary with hits, misses, current and maximum size
+                 and count of stored versions
+        :rtype: Dict
+        """
+        return self._backend.info()
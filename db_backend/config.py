@@ -0,0 +1,46 @@
+import os
+from typing import Any, Callable, Dict
+
+from .cache import SQLiteCacheBackend
+from .metrics import Metrics
+
+
+def client_options(create_engine: Callable[..., Any]) -> Dict:
+    """
+    Read API client parameters from environment variables, so all
+    application runners are configured in the same way
+        REPLICA_URLS - Database replicas URLs separated by commas, read
+                       commands are spread over them, otherwise over
+                       read-only pool of main database
+        READ_YOUR_WRITES - Seconds during which reads following add_comment
+                           in the same request are sent to main database,
+                           5 by default
+        METRICS - Commands metrics are collected if it is set
+        SLOW_QUERY_MS - Statements slower than this count of milliseconds
+                        are logged
+        CACHE_PATH - Cache file shared by several workers, so they see
+                     each other writes
+        COMMENTS_STORAGE - 'closure' finds inheritors by comment_closure
+                           table, 'path' by default
+    :param create_engine: create_db_engine or create_async_db_engine
+    :type create_engine: Callable[..., Any]
+    :return: APIClient keyword arguments
+    :rtype: Dict
+    """
+    replica_urls = os.environ.get('REPLICA_URLS')
+    if replica_urls:
+        read_engines = [create_engine(url, read_only=True)
+                        for url in replica_urls.split(',')]
+    else:
+        read_engines = [create_engine(read_only=True)]
+    slow_query_ms = os.environ.get('SLOW_QUERY_MS')
+    cache_path = os.environ.get('CACHE_PATH')
+    return {'engine': create_engine(),
+            'cache_backend': (SQLiteCacheBackend(cache_path) if cache_path
+                              else None),
+            'read_engines': read_engines,
+            'read_your_writes': float(os.environ.get('READ_YOUR_WRITES', 5)),
+            'metrics': Metrics() if os.environ.get('METRICS') else None,
+            'slow_query_threshold': (float(slow_query_ms) / 1000
+                                     if slow_query_ms else None),
+            'storage': os.environ.get('COMMENTS_STORAGE', 'path')}
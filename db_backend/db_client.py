@@ -1,53 +1,187 @@
 import datetime
-from typing import Any, Callable, Dict, List
+import functools
+import math
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import cycle, islice
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Sequence,
+                    Tuple, Union)
 
-from sqlalchemy import select
+from sqlalchemy import (ColumnElement, Integer, Update, bindparam, delete,
+                        exists, func, literal, select, tuple_, update)
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Query, Session
+from sqlalchemy.orm import Query, Session, aliased
 
-from .db_table import Base, CommentsDB, URLsDB, UserDB
+from .cache import LRUCache
+from .db_table import (Base, ChildCountersDB, CommentClosureDB, CommentsDB,
+                       URLsDB, UserDB)
+from .engine import reading_engine
+from .metrics import record_rows
 from .path_worker import PathWorker
 from .query_helper import QueryHelper
+from .query_log import SlowQueryLog
 
+# Client and Session of snapshot opened in current thread or task
+_snapshot_session = ContextVar('snapshot_session', default=(None, None))
+# Client and time until which reads of current thread or task are sent
+# to writing engine, so they see data written in this thread or task
+_primary_reads = ContextVar('primary_reads', default=(None, 0.0))
 
-def session_decorator(func: Callable) -> Callable:
+
+def begin_snapshot(session: Session) -> None:
     """
-    Decorator to perform database session and close it after transaction
+    Start read transaction, so all following queries see the same database
+    state. SQLite driver starts transaction only before data modification
+    :param session: Manages persistence operations for ORM-mapped objects
+    :type session: sqlalchemy.orm.Session
+    """
+    connection = session.connection()
+    if (connection.dialect.name == 'sqlite'
+            and not connection.connection.driver_connection.in_transaction):
+        connection.exec_driver_sql('BEGIN')
+
+
+def _engine_session_decorator(func: Callable, engine_name: str) -> Callable:
+    """
+    Decorator to perform database session on client engine with specified
+    attribute name and close it after transaction
     :param func: Function with database transactions
     :type func: Callable
+    :param engine_name: Client attribute with engine used by Session
+    :type engine_name: str
     :return: Function which decorate initial function with ORM Session
     :rtype: Callable
     """
+    @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
         """
         Perform initial function under ORM Session and return empty dict
-        if transaction cant get result
+        if transaction cant get result. Session of opened snapshot is used
+        if there is one
         """
-        with Session(self._engine) as session:
+        client, snapshot = _snapshot_session.get()
+        if client is self:
+            try:
+                result = func(self, snapshot, *args, **kwargs)
+            except NoResultFound:
+                return {'Response': 'No results'}
+            record_rows(result)
+            return result
+
+        with Session(getattr(self, engine_name)) as session:
             try:
                 result = func(self, session, *args, **kwargs)
             except NoResultFound:
                 return {'Response': 'No results'}
+        record_rows(result)
         return result
 
+    wrapper.engine_name = engine_name
     return wrapper
 
 
+def session_decorator(func: Callable) -> Callable:
+    """
+    Decorator to perform database session and close it after transaction
+    :param func: Function with database transactions
+    :type func: Callable
+    :return: Function which decorate initial function with ORM Session
+    :rtype: Callable
+    """
+    @functools.wraps(func)
+    def write(self, *args, **kwargs):
+        """Perform initial function and remember that data is written"""
+        result = func(self, *args, **kwargs)
+        self._mark_written()
+        return result
+
+    return _engine_session_decorator(write, '_engine')
+
+
+def read_session_decorator(func: Callable) -> Callable:
+    """
+    Decorator to perform database session on connections pool for reading
+    :param func: Function with database reading
+    :type func: Callable
+    :return: Function which decorate initial function with ORM Session
+    :rtype: Callable
+    """
+    return _engine_session_decorator(func, '_read_engine')
+
+
+# Ways to find inheritors of comment
+STORAGES = ('path', 'closure')
+# Count of levels whose siblings are selected by one statement, SQLite
+# allows 500 SELECTs in compound statement and every level takes two
+_SIBLING_LEVELS = 200
+# Count of parents whose first inheritors are selected by one statement
+_PAGE_PARENTS = 500
+
+
 class DBClient:
     """Class to perform database transaction operations"""
-    def __init__(self, engine: Engine):
+    def __init__(
+            self,
+            engine: Engine,
+            id_cache_size: int = 10000,
+            read_engines: Union[None, Sequence[Engine]] = None,
+            read_your_writes: float = 0.0,
+            slow_query_threshold: Union[None, float] = None,
+            storage: str = 'path'
+    ):
         """
         Initialize class
-        :param engine: Object establishing connection to database
+        :param engine: Object establishing connection to database, all
+                       writes are sent to it
         :type engine: sqlalchemy.engine.Engine
+        :param id_cache_size: Count of users and URLs IDs kept in memory
+        :type id_cache_size: int
+        :param read_engines: Optional, if specified: objects establishing
+                             connections used for reading, for example
+                             read-only pool or database replicas. Reads are
+                             sent to them in turn
+        :type read_engines: Union[None, Sequence[sqlalchemy.engine.Engine]]
+        :param read_your_writes: Seconds during which reads of thread or
+                                 task, that has written data, are sent to
+                                 writing engine, so replicas lag does not
+                                 hide just written comments. 0 disables it
+        :type read_your_writes: float
+        :param slow_query_threshold: Optional, if specified: statements
+                                     executed longer than this count of
+                                     seconds are logged with their query
+                                     plan
+        :type slow_query_threshold: Union[None, float]
+        :param storage: Way comments hierarchy is read: 'path' - inheritors,
+                        ancestors and reply counters are found by
+                        materialized paths, 'closure' - by comment_closure
+                        table. Paths order comments in both ways. Closure
+                        table is maintained by closure clients and, once
+                        it is filled, by path clients
+        :type storage: str
         """
+        if storage not in STORAGES:
+            raise ValueError(f'Unknown comments storage: {storage}')
+        self._storage = storage
         self._engine = engine
+        self._read_engines = list(read_engines or [])
+        self._read_engines_cycle = cycle(self._read_engines)
+        self._read_your_writes = read_your_writes
+        self.slow_query_log = None
+        if slow_query_threshold is not None:
+            self.slow_query_log = SlowQueryLog(slow_query_threshold)
+            for db_engine in {engine, *(read_engines or [])}:
+                self.slow_query_log.instrument(db_engine)
+        self._id_cache = LRUCache(id_cache_size)
         self._pworker = PathWorker()
         self._qhelper = QueryHelper(self._pworker.filters)
         self._tables = {'users': UserDB, 'urls': URLsDB,
                         'comments': CommentsDB}
         self.keys = self._qhelper.keys
+        self._listeners = []
 
     @staticmethod
     def _select(session: Session, table: Base, **kwargs: Any) -> Query:
@@ -65,92 +199,588 @@ class DBClient:
         return session.query(table).filter_by(**kwargs)
 
     @staticmethod
-    def _add_to_bd(session: Session, table: Base, **kwargs: Any) -> None:
+    def _cache_key(table: Base, **kwargs: Any) -> Tuple:
         """
-        Add table raw instance to database
-        :param session: Manages persistence operations for ORM-mapped objects
-        :type session: sqlalchemy.orm.Session
+        Create key of element in IDs cache
         :param table: Database table
         :type table: sqlalchemy.orm.declarative_base
-        :param kwargs: Parameters for ORM class creation
+        :param kwargs: Filter parameters
         :type kwargs: Any
+        :return: Cache key
+        :rtype: Tuple
         """
-        sample = table(**kwargs)
-        session.add(sample)
-        session.commit()
+        return table.__tablename__, tuple(sorted(kwargs.items()))
 
     def _get_id(self, session: Session, table: Base, **kwargs: Any) -> int:
         """
         Get element ID from database table if element exists otherwise create
-        new element in table
+        new element in table. Element is inserted by
+        INSERT ... ON CONFLICT DO NOTHING RETURNING id and selected only if
+        it already exists, IDs of existing elements are cached
         :param session: Manages persistence operations for ORM-mapped objects
         :type session: sqlalchemy.orm.Session
         :param table: Database table
         :type table: sqlalchemy.orm.declarative_base
         :param kwargs: Filter parameters
         :type kwargs: Any
-        :return:
+        :return: Element ID
+        :rtype: int
         """
-        try:
-            sample_id = self._select(session, table, **kwargs).one()
-        except NoResultFound:
-            self._add_to_bd(session, table, **kwargs)
-            sample_id = self._select(session, table, **kwargs).one()
-        return sample_id.id
+        key = self._cache_key(table, **kwargs)
+        sample_id = self._id_cache.get(key)
+        if sample_id is not None:
+            return sample_id
+
+        statement = insert(table).values(**kwargs).on_conflict_do_nothing()
+        sample_id = session.execute(
+            statement.returning(table.id)
+        ).scalar_one_or_none()
+        if sample_id is None:
+            # Only committed elements are cached, new element ID is lost
+            # if transaction is rolled back
+            sample_id = self._select(session, table, **kwargs).one().id
+            self._id_cache.set(key, sample_id)
+        return sample_id
+
+    @staticmethod
+    def _next_child_number(
+            session: Session, url_id: int, parent_id: int = 0
+    ) -> int:
+        """
+        Allocate number for the next child of comments node. Counter is
+        incremented by single upsert statement, so concurrent writers are
+        serialized by database and never get the same number
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param parent_id: Parent comment ID, zero for first level comments
+        :type parent_id: int
+        :return: Number of the new child
+        :rtype: int
+        """
+        statement = insert(ChildCountersDB).values(url_id=url_id,
+                                                   parent_id=parent_id,
+                                                   last_child=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ChildCountersDB.url_id,
+                            ChildCountersDB.parent_id],
+            set_={'last_child': ChildCountersDB.last_child + 1}
+        )
+        statement = statement.returning(ChildCountersDB.last_child)
+        return session.execute(statement).scalar_one()
+
+    def _close_previous_sibling(
+            self,
+            session: Session,
+            url_id: int,
+            number: int,
+            parent_path: Union[None, str] = None
+    ) -> None:
+        """
+        Reset 'last' flag of the comment preceding the new one on its level
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param number: Number of the new comment on its level
+        :type number: int
+        :param parent_path: Parent path, None for first level comments
+        :type parent_path: Union[None, str]
+        """
+        if number == 1:
+            return
+        previous_path = self._pworker.make_path(number - 1, parent_path)
+        session.execute(update(CommentsDB)
+                        .where(CommentsDB.url_id == url_id,
+                               CommentsDB.path == previous_path)
+                        .values(last=False))
 
-    def _create_child_path(self, session: Session, parent_path: str) -> str:
+    @staticmethod
+    def _reserve_child_numbers(
+            session: Session, amounts: Dict[Tuple[int, int], int]
+    ) -> Dict[Tuple[int, int], int]:
+        """
+        Allocate several child numbers for many comments nodes at once by
+        single upsert statement
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param amounts: Count of numbers to allocate for each
+                        (url_id, parent_id) node
+        :type amounts: Dict[Tuple[int, int], int]
+        :return: First allocated number for each node
+        :rtype: Dict[Tuple[int, int], int]
+        """
+        statement = insert(ChildCountersDB).values(
+            [{'url_id': url_id, 'parent_id': parent_id, 'last_child': amount}
+             for (url_id, parent_id), amount in amounts.items()]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[ChildCountersDB.url_id,
+                            ChildCountersDB.parent_id],
+            set_={'last_child': (ChildCountersDB.last_child
+                                 + statement.excluded.last_child)}
+        )
+        statement = statement.returning(ChildCountersDB.url_id,
+                                        ChildCountersDB.parent_id,
+                                        ChildCountersDB.last_child)
+        first_numbers = {}
+        for row in session.execute(statement):
+            node = (row.url_id, row.parent_id)
+            first_numbers[node] = row.last_child - amounts[node] + 1
+        return first_numbers
+
+    def _create_child_path(self, session: Session, parent: CommentsDB) -> str:
         """
         Create next child path for existing comments node
         :param session: Manages persistence operations for ORM-mapped objects
         :type session: sqlalchemy.orm.Session
-        :param parent_path: Comments node path
-        :type parent_path: str
+        :param parent: Parent comment
+        :type parent: CommentsDB
         :return: Path to new comment
         :rtype: str
         """
-        query = session.query(CommentsDB)
-        query = self._qhelper.one_level_child_path(query, parent_path)
-        query = self._qhelper.modify_data(query, last=True)
-        last_child = self._qhelper.check_query(query)
-        if last_child:
-            path = self._pworker.next_child_path(last_child.path, first=False)
-            last_child.last = False
-        else:
-            path = self._pworker.next_child_path(parent_path)
-        return path
+        number = self._next_child_number(session, parent.url_id, parent.id)
+        self._close_previous_sibling(session, parent.url_id, number,
+                                     parent.path)
+        return self._pworker.make_path(number, parent.path)
 
-    def _create_first_level_path(self, session: Session) -> str:
+    def _create_first_level_path(self, session: Session, url_id: int) -> str:
         """
         Create path to next first level comment
         :param session: Manages persistence operations for ORM-mapped objects
         :type session: sqlalchemy.orm.Session
+        :param url_id: URL ID from urls table
+        :type url_id: int
         :return: Path to next first level comment
         :rtype: str
         """
-        query = session.query(CommentsDB)
-        query = self._qhelper.first_level_path(query)
-        query = self._qhelper.modify_data(query, last=True)
-        last_comment = self._qhelper.check_query(query)
-        if last_comment:
-            path = self._pworker.next_path(last_comment.path, first=False)
-            last_comment.last = False
-        else:
-            path = self._pworker.next_path()
-        return path
+        number = self._next_child_number(session, url_id)
+        self._close_previous_sibling(session, url_id, number)
+        return self._pworker.make_path(number)
 
-    @session_decorator
-    def get_table_data(self, session: Session, table: str) -> List[Dict]:
+    def _get_ids(
+            self, session: Session, table: Base, field: str, values: Iterable
+    ) -> Dict[Any, int]:
+        """
+        Get IDs of several elements from IDs cache or database table by one
+        query and create elements which are not exist yet
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param table: Database table
+        :type table: sqlalchemy.orm.declarative_base
+        :param field: Table column to search values in
+        :type field: str
+        :param values: Values to find
+        :type values: Iterable
+        :return: Mapping from value to element ID
+        :rtype: Dict[Any, int]
+        """
+        column = getattr(table, field)
+        ids = {}
+        for value in set(values):
+            key = self._cache_key(table, **{field: value})
+            ids[value] = self._id_cache.get(key)
+        uncached = [value for value, value_id in ids.items()
+                    if value_id is None]
+        if not uncached:
+            return ids
+
+        stored = dict(session.execute(select(column, table.id)
+                                      .where(column.in_(uncached))).all())
+        for value, value_id in stored.items():
+            self._id_cache.set(self._cache_key(table, **{field: value}),
+                               value_id)
+        missing = [value for value in uncached if value not in stored]
+        if missing:
+            session.execute(insert(table).on_conflict_do_nothing(),
+                            [{field: value} for value in missing])
+            stored.update(session.execute(select(column, table.id)
+                                          .where(column.in_(missing))).all())
+        ids.update(stored)
+        return ids
+
+    def _add_comments_chunk(
+            self, session: Session, chunk: List[Dict], added: Dict
+    ) -> List:
+        """
+        Add part of comments from bulk request. Paths of comments answering
+        stored comments are allocated by one counters upsert, paths of
+        comments answering comments from the same chunk are numbered in
+        memory
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param chunk: Comments data
+        :type chunk: List[Dict]
+        :param added: Comments added in previous chunks by their keys
+        :type added: Dict
+        :return: Created comments rows
+        :rtype: List
+        """
+        user_ids = self._get_ids(session, UserDB, 'user',
+                                 (data.get('user') for data in chunk))
+        url_ids = self._get_ids(session, URLsDB, 'url',
+                                (data.get('url') for data in chunk
+                                 if not data.get('parent_id')
+                                 and data.get('parent_key') is None))
+        parent_ids = {data['parent_id'] for data in chunk
+                      if data.get('parent_id')}
+        query = select(CommentsDB.id, CommentsDB.path, CommentsDB.url_id,
+                       CommentsDB.depth).where(CommentsDB.id.in_(parent_ids))
+        parents = {row.id: row._asdict() for row in session.execute(query)}
+        if len(parents) != len(parent_ids):
+            raise NoResultFound('Parent comment is not found')
+
+        # Every row is bound to its comments node: (url_id, parent_id) for
+        # stored parents or index of parent row from this chunk
+        current_time = datetime.datetime.now().timestamp()
+        rows = []
+        nodes = []
+        row_parents = []
+        chunk_keys = {}
+        for data in chunk:
+            parent_key = data.get('parent_key')
+            if parent_key is not None and parent_key in chunk_keys:
+                node = chunk_keys[parent_key]
+                parent = rows[node]
+                parent_id = None
+            else:
+                if parent_key is not None:
+                    if parent_key not in added:
+                        raise NoResultFound('Parent comment is not found')
+                    parent = added[parent_key]
+                elif data.get('parent_id'):
+                    parent = parents[data['parent_id']]
+                else:
+                    parent = None
+                parent_id = parent['id'] if parent else None
+                url_id = (parent['url_id'] if parent
+                          else url_ids[data.get('url')])
+                node = (url_id, parent_id or 0)
+
+            if data.get('key') is not None:
+                chunk_keys[data['key']] = len(rows)
+            nodes.append(node)
+            row_parents.append(parent)
+            rows.append({'parent_id': parent_id,
+                         'depth': parent['depth'] + 1 if parent else 1,
+                         'user_id': user_ids[data.get('user')],
+                         'url_id': (parent['url_id'] if parent
+                                    else url_ids[data.get('url')]),
+                         'comment': data.get('comment'),
+                         'date': data.get('date') or current_time,
+                         'last': False,
+                         'reply_count': 0,
+                         'last_activity': None})
+
+        stored_nodes = Counter(node for node in nodes
+                               if isinstance(node, tuple))
+        first_numbers = (self._reserve_child_numbers(session, stored_nodes)
+                         if stored_nodes else {})
+        numbers = {node: first_numbers.get(node, 1) for node in nodes}
+        # Parents always go before their inheritors, so parent path is set
+        # when its inheritor is reached
+        previous_paths = []
+        last_rows = {}
+        for row, node, parent in zip(rows, nodes, row_parents):
+            parent_path = parent['path'] if parent else None
+            if numbers[node] == first_numbers.get(node) and numbers[node] > 1:
+                previous_paths.append(
+                    (row['url_id'],
+                     self._pworker.make_path(numbers[node] - 1, parent_path))
+                )
+            row['path'] = self._pworker.make_path(numbers[node], parent_path)
+            numbers[node] += 1
+            last_rows[node] = row
+        for row in last_rows.values():
+            row['last'] = True
+        # Closure storage counts inheritors by closure table after insert
+        stored_activity = ([] if self._storage == 'closure'
+                           else self._count_activity(rows))
+
+        if previous_paths:
+            session.execute(update(CommentsDB)
+                            .where(tuple_(CommentsDB.url_id,
+                                          CommentsDB.path)
+                                   .in_(previous_paths))
+                            .values(last=False))
+        statement = insert(CommentsDB).returning(
+            CommentsDB.id, sort_by_parameter_order=True
+        )
+        # NULL parent_id is rendered, otherwise rows with and without
+        # parent are split into separate small INSERT batches
+        comment_ids = list(session.scalars(
+            statement, rows, execution_options={'render_nulls': True}))
+        for row, comment_id in zip(rows, comment_ids):
+            row['id'] = comment_id
+
+        # Link comments answering comments from this chunk to their parents
+        # and start child counters of these parents
+        children = []
+        for row, node in zip(rows, nodes):
+            if isinstance(node, int):
+                row['parent_id'] = comment_ids[node]
+                children.append({'id': row['id'],
+                                 'parent_id': row['parent_id']})
+        if children:
+            session.execute(update(CommentsDB), children)
+            counters = [{'url_id': rows[node]['url_id'],
+                         'parent_id': comment_ids[node],
+                         'last_child': numbers[node] - 1}
+                        for node in numbers if isinstance(node, int)]
+            session.execute(insert(ChildCountersDB), counters)
+        if stored_activity:
+            session.connection().execute(
+                self._activity_statement(CommentsDB.path
+                                         == bindparam('b_path')),
+                stored_activity)
+        if self._maintains_closure(session):
+            self._add_closure(session, rows)
+        if self._storage == 'closure':
+            self._add_closure_activity(session, comment_ids)
+
+        for row, data in zip(rows, chunk):
+            row['user'] = data.get('user')
+        for key, index in chunk_keys.items():
+            added[key] = {'id': comment_ids[index],
+                          'path': rows[index]['path'],
+                          'url_id': rows[index]['url_id'],
+                          'depth': rows[index]['depth']}
+        return rows
+
+    def _count_activity(self, rows: List[Dict]) -> List[Dict]:
+        """
+        Count inheritors added by rows for every their ancestor. Counters of
+        ancestors from rows are set in rows, counters of stored ancestors
+        are returned to be added in database
+        :param rows: Comments rows with paths
+        :type rows: List[Dict]
+        :return: Parameters of activity statement for stored ancestors
+        :rtype: List[Dict]
+        """
+        activity = {}
+        for row in rows:
+            for path in self._pworker.ancestor_paths(row['path']):
+                count, date = activity.get((row['url_id'], path),
+                                           (0, row['date']))
+                activity[(row['url_id'], path)] = (count + 1,
+                                                   max(date, row['date']))
+
+        chunk_rows = {(row['url_id'], row['path']): row for row in rows}
+        stored = []
+        for (url_id, path), (count, date) in activity.items():
+            row = chunk_rows.get((url_id, path))
+            if row is not None:
+                row['reply_count'] = count
+                row['last_activity'] = date
+            else:
+                stored.append({'b_url_id': url_id, 'b_path': path,
+                               'b_count': count, 'b_date': date})
+        return stored
+
+    @staticmethod
+    def _activity_statement(path_filter: ColumnElement) -> Update:
+        """
+        Create statement adding inheritors to reply counters of comments and
+        moving their last activity date forward
+        :param path_filter: Condition selecting updated comments of URL
+                            by their paths
+        :type path_filter: sqlalchemy.sql.ColumnElement
+        :return: Update statement with 'b_url_id', 'b_count' and 'b_date'
+                 parameters
+        :rtype: sqlalchemy.Update
+        """
+        date = bindparam('b_date')
+        return (update(CommentsDB.__table__)
+                .where(CommentsDB.url_id == bindparam('b_url_id'),
+                       path_filter)
+                .values(reply_count=(CommentsDB.reply_count
+                                     + bindparam('b_count')),
+                        last_activity=func.max(
+                            func.coalesce(CommentsDB.last_activity, date),
+                            date)))
+
+    def _add_closure_activity(
+            self, session: Session, comment_ids: List[int]
+    ) -> None:
+        """
+        Add comments to reply counters of all their ancestors found by
+        closure table and move their last activity date forward
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param comment_ids: IDs of comments added to closure table
+        :type comment_ids: List[int]
+        """
+        activity = self._qhelper.ancestors_activity(comment_ids)
+        session.execute(
+            update(CommentsDB.__table__)
+            .where(CommentsDB.id == activity.c.ancestor)
+            .values(reply_count=CommentsDB.reply_count + activity.c.count,
+                    last_activity=func.max(
+                        func.coalesce(CommentsDB.last_activity,
+                                      activity.c.date),
+                        activity.c.date)))
+
+    def _maintains_closure(self, session: Session) -> bool:
+        """
+        Check if written comments have to be added to closure table. Path
+        storage adds them too once the table is filled, so closure storage
+        clients sharing database never see it stale
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :return: Flag to add comments to closure table
+        :rtype: bool
+        """
+        if self._storage == 'closure':
+            return True
+        return session.scalar(
+            select(CommentClosureDB.ancestor).limit(1)) is not None
+
+    @staticmethod
+    def _add_closure(session: Session, rows: List[Dict]) -> None:
+        """
+        Add comments to closure table. Ancestors of comment are copied from
+        ancestors of its parent, so parents have to go before their
+        inheritors
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param rows: Comments rows with IDs and parents IDs
+        :type rows: List[Dict]
+        """
+        connection = session.connection()
+        connection.execute(insert(CommentClosureDB),
+                           [{'ancestor': row['id'], 'descendant': row['id'],
+                             'depth': 0} for row in rows])
+        replies = [{'id': row['id'], 'parent_id': row['parent_id']}
+                   for row in rows if row['parent_id']]
+        if replies:
+            ancestors = select(
+                CommentClosureDB.ancestor,
+                bindparam('id', type_=Integer),
+                CommentClosureDB.depth + 1
+            ).where(CommentClosureDB.descendant == bindparam('parent_id'))
+            statement = insert(CommentClosureDB).from_select(
+                ['ancestor', 'descendant', 'depth'], ancestors)
+            # Rows are inserted one after another, so inheritors see
+            # ancestors of parents added by previous rows
+            connection.execute(statement, replies)
+
+    @property
+    def _read_engine(self) -> Engine:
+        """
+        Engine for next reading. Read engines are taken in turn, writing
+        engine is used if there are no read engines or after this thread
+        or task has written data
+        :return: Object establishing connection to database
+        :rtype: sqlalchemy.engine.Engine
+        """
+        client, until = _primary_reads.get()
+        if (client is self and time.monotonic() < until
+                or not self._read_engines):
+            return self._primary_read_engine
+        return next(self._read_engines_cycle)
+
+    @functools.cached_property
+    def _primary_read_engine(self) -> Engine:
+        """
+        Writing engine whose transactions are started for reading, so
+        reads do not wait for writes
+        :return: Object establishing connection to database
+        :rtype: sqlalchemy.engine.Engine
+        """
+        return reading_engine(self._engine)
+
+    def _mark_written(self) -> None:
+        """Send following reads of this thread or task to writing engine"""
+        if self._read_your_writes > 0:
+            _primary_reads.set(
+                (self, time.monotonic() + self._read_your_writes))
+
+    @contextmanager
+    def primary_reads(self) -> Iterator[None]:
+        """
+        Send reads of this block in current thread or task to writing
+        engine, so their result is not older than the last commit
+        """
+        token = _primary_reads.set((self, math.inf))
+        try:
+            yield
+        finally:
+            _primary_reads.reset(token)
+
+    @contextmanager
+    def snapshot(self) -> Iterator[Session]:
+        """
+        Open one Session and read transaction used by methods of this client
+        called in this block in current thread, so they see the same
+        database state. Block is meant for reads, it is rolled back at the end
+        :return: Snapshot Session
+        :rtype: Iterator[Session]
+        """
+        with Session(self._read_engine) as session:
+            begin_snapshot(session)
+            token = _snapshot_session.set((self, session))
+            try:
+                yield session
+            finally:
+                _snapshot_session.reset(token)
+                session.rollback()
+
+    def subscribe(self, listener: Callable) -> None:
+        """
+        Register function to be called after every commit with comments
+        written to database
+        :param listener: Function taking list of comments table rows with
+                         username in 'user' key
+        :type listener: Callable
         """
-        Get all information from table
+        self._listeners.append(listener)
+
+    def _notify(self, comments: List[Dict]) -> None:
+        """
+        Pass committed comments to registered listeners
+        :param comments: Comments table rows
+        :type comments: List[Dict]
+        """
+        for listener in self._listeners:
+            listener(comments)
+
+    def id_cache_info(self) -> Dict:
+        """
+        Get statistics of users and URLs IDs cache
+        :return: Dictionary with hits, misses, current and maximum size
+        :rtype: Dict
+        """
+        return self._id_cache.info()
+
+    @read_session_decorator
+    def get_table_data(
+            self,
+            session: Session,
+            table: str,
+            limit: Union[None, int] = None,
+            after: int = 0
+    ) -> List[Dict]:
+        """
+        Get page of table rows ordered by ID. Pages are selected by keyset
+        over primary key, so every page costs the same regardless of offset
         :param session: Manages persistence operations for ORM-mapped objects
         :type session: sqlalchemy.orm.Session
         :param table: Table name from database
         :type table: str
+        :param limit: Maximum count of rows, all rows if not specified
+        :type limit: Union[None, int]
+        :param after: ID of the last row from previous page
+        :type after: int
         :return: List of tables rows
         :rtype: List[Dict]
         """
-        results = session.execute(select(self._tables[table]))
-        return [result[0].get_dict() for result in results]
+        table = self._tables[table]
+        query = (select(*table.__table__.columns)
+                 .where(table.id > after)
+                 .order_by(table.id)
+                 .limit(limit))
+        return [dict(row._mapping) for row in session.execute(query)]
 
     @session_decorator
     def add_comment(
@@ -183,23 +813,305 @@ class DBClient:
         user_id = self._get_id(session, UserDB, user=user)
         if parent_id:
             parent = self._select(session, CommentsDB, id=parent_id).one()
-            path = self._create_child_path(session, parent.path)
+            path = self._create_child_path(session, parent)
             url_id = parent.url_id
+            depth = parent.depth + 1
         else:
-            path = self._create_first_level_path(session)
             url_id = self._get_id(session, URLsDB, url=url)
+            path = self._create_first_level_path(session, url_id)
+            parent_id = None
+            depth = 1
         current_time = datetime.datetime.now().timestamp()
-        kwargs = {'path': path,
-                  'user_id': user_id,
-                  'url_id': url_id,
-                  'comment': comment,
-                  'date': current_time,
-                  'last': last}
+        row = {'path': path,
+               'parent_id': parent_id,
+               'depth': depth,
+               'user_id': user_id,
+               'url_id': url_id,
+               'comment': comment,
+               'date': current_time,
+               'last': last}
+        sample = CommentsDB(**row)
+        session.add(sample)
+        session.flush()
+        row['id'] = sample.id
+        if self._maintains_closure(session):
+            self._add_closure(session, [row])
+        ancestors = self._pworker.ancestor_paths(path)
+        if self._storage == 'closure':
+            if ancestors:
+                self._add_closure_activity(session, [row['id']])
+        elif ancestors:
+            # All ancestors are updated by one statement over their paths
+            session.connection().execute(
+                self._activity_statement(CommentsDB.path.in_(ancestors)),
+                {'b_url_id': url_id, 'b_count': 1, 'b_date': current_time})
+        session.commit()
+        self._notify([{**row, 'user': user}])
+        return row['id']
 
-        comment_id = self._get_id(session, CommentsDB, **kwargs)
-        return comment_id
+    @session_decorator
+    def add_comments_bulk(
+            self,
+            session: Session,
+            comments: Iterable[Dict],
+            chunk_size: int = 1000
+    ) -> Union[List[int], Dict]:
+        """
+        Add many comments to comments table. Users and URLs are resolved by
+        one query per chunk, paths are allocated in memory and comments are
+        inserted by executemany, every chunk is checked and committed
+        separately
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param comments: Comments data, dictionaries with 'url', 'user',
+                         'comment' and optional keys:
+            :parent_id: (int) ID of parent comment stored in database
+            :key: (Any) Comment identifier to reference it in parent_key
+            :parent_key: (Any) Key of parent comment going before in
+                         the same comments iterable
+            :date: (float) Comment timestamp, current time by default
+        :type comments: Iterable[Dict]
+        :param chunk_size: Count of comments added in one transaction
+        :type chunk_size: int
+        :return: Created comments IDs or, if comment data is wrong or its
+                 parent is not found, dictionary with error in 'Response'
+                 key and IDs of comments committed by previous chunks in
+                 'comment_ids' key
+        :rtype: Union[List[int], Dict]
+        """
+        comment_ids = []
+        added = {}
+        keys = set()
+        comments = iter(comments)
+        chunk = list(islice(comments, chunk_size))
+        try:
+            while chunk:
+                self.check_bulk_comments(chunk, keys, len(comment_ids))
+                rows = self._add_comments_chunk(session, chunk, added)
+                session.commit()
+                self._notify(rows)
+                comment_ids.extend(row['id'] for row in rows)
+                chunk = list(islice(comments, chunk_size))
+        except (NoResultFound, TypeError, ValueError) as error:
+            session.rollback()
+            return {'Response': str(error), 'comment_ids': comment_ids}
+        return comment_ids
+
+    @staticmethod
+    def check_bulk_comments(
+            comments: List[Dict],
+            keys: Union[None, set] = None,
+            start: int = 0
+    ) -> None:
+        """
+        Check comments data of add_comments_bulk before it is written
+        :param comments: Comments data
+        :type comments: List[Dict]
+        :param keys: Optional, if specified: keys of comments going before,
+                     keys of checked comments are added to it
+        :type keys: Union[None, set]
+        :param start: Index of the first checked comment among all comments
+        :type start: int
+        :raises ValueError: If comment data is wrong
+        """
+        keys = set() if keys is None else keys
+        for index, data in enumerate(comments, start):
+            if not isinstance(data, dict):
+                raise ValueError(f'Comment {index} is not an object')
+            for name in ('user', 'comment'):
+                if not isinstance(data.get(name), str):
+                    raise ValueError(f'Comment {index} has no {name}')
+            parent_key = data.get('parent_key')
+            if parent_key is not None:
+                if parent_key not in keys:
+                    raise ValueError(f'Parent of comment {index} does not '
+                                     f'go before it')
+            elif data.get('parent_id'):
+                if not isinstance(data['parent_id'], int):
+                    raise ValueError(f'Comment {index} has wrong parent_id')
+            elif not isinstance(data.get('url'), str):
+                raise ValueError(f'Comment {index} has no url')
+            if data.get('key') is not None:
+                keys.add(data['key'])
 
     @session_decorator
+    def rebuild_closure(self, session: Session) -> int:
+        """
+        Fill closure table from comments parents, needed before switching to
+        closure storage when comments were written with path storage
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :return: Count of closure table rows
+        :rtype: int
+        """
+        session.execute(delete(CommentClosureDB))
+        closure = (select(CommentsDB.id.label('ancestor'),
+                          CommentsDB.id.label('descendant'),
+                          literal(0).label('depth'))
+                   .cte('closure', recursive=True))
+        closure = closure.union_all(
+            select(closure.c.ancestor, CommentsDB.id, closure.c.depth + 1)
+            .where(CommentsDB.parent_id == closure.c.descendant))
+        session.execute(insert(CommentClosureDB).from_select(
+            ['ancestor', 'descendant', 'depth'], select(closure)))
+        count = session.query(CommentClosureDB).count()
+        session.commit()
+        return count
+
+    def _url_query(
+            self,
+            session: Session,
+            url: str,
+            first_level: bool = True,
+            **kwargs: Any
+    ) -> Query:
+        """
+        Create query for comments from specified URL sorted in tree order
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url: URL address
+        :type url: str
+        :param first_level: Flag to get only first level comments
+        :type first_level: bool
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Query
+        :rtype: sqlalchemy.orm.Query
+        """
+        url_id = self._select(session, URLsDB, url=url).one().id
+        query = self._qhelper.get_base_query(session)
+        query = query.filter(CommentsDB.url_id == url_id)
+        query = self._qhelper.modify_data(query, **kwargs)
+        if first_level:
+            query = self._qhelper.first_level_path(query)
+        # Encoded paths are sorted in the same order as comments tree
+        query = query.order_by(CommentsDB.path)
+        return query
+
+    def _user_query(self, session: Session, user: str, **kwargs: Any) -> Query:
+        """
+        Create query for all user comments
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param user: Username
+        :type user: str
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Query
+        :rtype: sqlalchemy.orm.Query
+        """
+        user_id = self._select(session, UserDB, user=user).one().id
+        query = self._qhelper.get_base_query(session)
+        query = query.filter(CommentsDB.user_id == user_id)
+        query = self._qhelper.modify_data(query, **kwargs)
+        return query
+
+    @read_session_decorator
+    def get_url_id(self, session: Session, url: str) -> Union[None, int]:
+        """
+        Get URL ID without creating new URL
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url: URL address
+        :type url: str
+        :return: URL ID or None if URL is not exists
+        :rtype: Union[None, int]
+        """
+        key = self._cache_key(URLsDB, url=url)
+        url_id = self._id_cache.get(key)
+        if url_id is None:
+            url_id = session.scalars(select(URLsDB.id)
+                                     .where(URLsDB.url == url)).one_or_none()
+            if url_id is not None:
+                self._id_cache.set(key, url_id)
+        return url_id
+
+    @read_session_decorator
+    def get_comment_scope(
+            self, session: Session, comment_id: int
+    ) -> Union[None, Tuple[int, str]]:
+        """
+        Get URL ID and materialized path of comment, they never change
+        after comment is created, so they are kept in IDs cache
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param comment_id: Comment ID from comments table
+        :type comment_id: int
+        :return: URL ID and path or None if comment is not exists
+        :rtype: Union[None, Tuple[int, str]]
+        """
+        return self._comment_scope(session, comment_id)
+
+    def _comment_scope(
+            self, session: Session, comment_id: int
+    ) -> Union[None, Tuple[int, str]]:
+        """
+        Get URL ID and materialized path of comment from IDs cache or
+        from database
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param comment_id: Comment ID from comments table
+        :type comment_id: int
+        :return: URL ID and path or None if comment is not exists
+        :rtype: Union[None, Tuple[int, str]]
+        """
+        key = self._cache_key(CommentsDB, id=comment_id)
+        scope = self._id_cache.get(key)
+        if scope is None:
+            row = session.execute(select(CommentsDB.url_id, CommentsDB.path)
+                                  .where(CommentsDB.id == comment_id)
+                                  ).one_or_none()
+            if row is None:
+                return None
+            scope = tuple(row)
+            self._id_cache.set(key, scope)
+        return scope
+
+    @read_session_decorator
+    def get_comment_context(
+            self, session: Session, comment_id: int, siblings: int = 0
+    ) -> List:
+        """
+        Get comment with chain of its ancestors. Ancestors are found by
+        paths taken from comment path or by closure table depending on
+        client storage, so the whole chain is selected by one query
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param comment_id: Comment ID from comments table
+        :type comment_id: int
+        :param siblings: Count of siblings selected before and after
+                         comment and every its ancestor
+        :type siblings: int
+        :return: Comments rows sorted by path
+        :rtype: List
+        """
+        scope = self._comment_scope(session, comment_id)
+        if scope is None:
+            raise NoResultFound('Comment is not found')
+        url_id, path = scope
+        query = self._qhelper.get_base_query(session)
+        if self._storage == 'closure':
+            query = self._qhelper.ancestors(query, comment_id)
+        else:
+            query = query.filter(CommentsDB.url_id == url_id,
+                                 CommentsDB.path.in_(
+                                     [*self._pworker.ancestor_paths(path),
+                                      path]))
+        rows = query.order_by(CommentsDB.path).all()
+        if not siblings:
+            return rows
+
+        # Parent of every chain comment is the previous one
+        nodes = [(None if index == 0 else rows[index - 1].id, row.path)
+                 for index, row in enumerate(rows)]
+        for start in range(0, len(nodes), _SIBLING_LEVELS):
+            statement = self._qhelper.siblings(
+                url_id, nodes[start:start + _SIBLING_LEVELS], siblings)
+            rows.extend(session.execute(statement))
+        rows.sort(key=lambda row: row.path)
+        return rows
+
+    @read_session_decorator
     def get_comment_inheritors(
             self, session: Session, comment_id: int
     ) -> List:
@@ -211,17 +1123,298 @@ class DBClient:
         :type comment_id: int
         :return: List of inheritors
         """
-        parent = self._select(session, CommentsDB, id=comment_id).one().id
+        parent = self._select(session, CommentsDB, id=comment_id).one()
         query = self._qhelper.get_base_query(session)
-        query = self._qhelper.child_path(query, parent.path)
+        query = self._inheritors_query(query, parent)
+        query = query.order_by(CommentsDB.path)
         return query.all()
 
-    @session_decorator
+    def _inheritors_query(
+            self,
+            query: Query,
+            parent: CommentsDB,
+            max_depth: Union[None, int] = None
+    ) -> Query:
+        """
+        Filter inheritors of comment by path range or by closure table
+        depending on client storage
+        :param query: Query to database
+        :type query: sqlalchemy.orm.Query
+        :param parent: Comment whose inheritors are selected
+        :type parent: CommentsDB
+        :param max_depth: Optional, if specified: count of selected levels
+                          below parent
+        :type max_depth: Union[None, int]
+        :return: Query
+        :rtype: sqlalchemy.orm.Query
+        """
+        if self._storage == 'closure':
+            return self._qhelper.descendants(query, parent.id, max_depth)
+        query = query.filter(CommentsDB.url_id == parent.url_id)
+        query = self._qhelper.child_path(query, parent.path)
+        if max_depth:
+            query = query.filter(CommentsDB.depth <= parent.depth + max_depth)
+        return query
+
+    @staticmethod
+    def _with_children(session: Session, comment_ids: List[int]) -> set:
+        """
+        Find comments having inheritors
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param comment_ids: Comments IDs from comments table
+        :type comment_ids: List[int]
+        :return: IDs of comments having inheritors
+        :rtype: set
+        """
+        if not comment_ids:
+            return set()
+        child = aliased(CommentsDB)
+        query = (select(CommentsDB.id)
+                 .where(CommentsDB.id.in_(comment_ids))
+                 .where(exists().where(child.parent_id == CommentsDB.id)))
+        return set(session.scalars(query))
+
+    def _tree_by_range(
+            self,
+            session: Session,
+            url_id: int,
+            parent: Union[None, CommentsDB],
+            max_depth: Union[None, int],
+            after: Union[None, str]
+    ) -> List:
+        """
+        Get inheritors of comment or URL down to specified depth by one
+        range query over path index
+        :return: Comments rows with their continuation, it is '' for
+                 comments whose inheritors are not selected and None
+                 for others
+        :rtype: List
+        """
+        query = self._qhelper.get_base_query(session)
+        base_depth = 0
+        if parent is not None:
+            query = self._inheritors_query(query, parent, max_depth)
+            base_depth = parent.depth
+        else:
+            query = query.filter(CommentsDB.url_id == url_id)
+            if max_depth:
+                query = query.filter(CommentsDB.depth <= max_depth)
+        if after:
+            # Skip the comment and all its inheritors
+            query = query.filter(CommentsDB.path
+                                 >= after + self._pworker.filters['range_end'])
+        rows = query.order_by(CommentsDB.path).all()
+
+        collapsed = set()
+        if max_depth:
+            last_level = [row[1] for row in rows
+                          if self._pworker.depth(row[0])
+                          == base_depth + max_depth]
+            collapsed = self._with_children(session, last_level)
+        return [(*row, '' if row[1] in collapsed else None) for row in rows]
+
+    def _tree_by_levels(
+            self,
+            session: Session,
+            url_id: int,
+            parent: Union[None, CommentsDB],
+            max_depth: Union[None, int],
+            limit: int,
+            after: Union[None, str]
+    ) -> Tuple[List, Union[None, str]]:
+        """
+        Get inheritors of comment or URL level by level, only first
+        comments of every parent are selected on every level
+        :return: Comments rows with their continuation and continuation of
+                 the first level. Continuation is path of the last selected
+                 inheritor, '' if no inheritors are selected and None if
+                 all inheritors are selected
+        :rtype: Tuple[List, Union[None, str]]
+        """
+        more = {}
+        rows = []
+        parent_ids = [None if parent is None else parent.id]
+        level = 1
+        while parent_ids and (max_depth is None or level <= max_depth):
+            level_rows = []
+            for start in range(0, len(parent_ids), _PAGE_PARENTS):
+                statement = self._qhelper.first_children(
+                    url_id, parent_ids[start:start + _PAGE_PARENTS],
+                    limit + 1, after if level == 1 else None)
+                level_rows.extend(session.execute(statement))
+            level_rows.sort(key=lambda row: row.path)
+            parent_ids = []
+            # Siblings go one after another in path order, so the comment
+            # over the limit follows the last selected sibling
+            last_path = None
+            siblings = 0
+            for index, row in enumerate(level_rows):
+                if index and row.parent_id == level_rows[index - 1].parent_id:
+                    siblings += 1
+                else:
+                    siblings = 1
+                if siblings > limit:
+                    more[row.parent_id] = last_path
+                    continue
+                rows.append(tuple(row)[:5])
+                parent_ids.append(row.id)
+                last_path = row.path
+            level += 1
+
+        collapsed = self._with_children(session, parent_ids)
+        more.update((comment_id, '') for comment_id in collapsed)
+        rows.sort(key=lambda row: row[0])
+        rows = [(*row, more.get(row[1])) for row in rows]
+        return rows, more.get(None if parent is None else parent.id)
+
+    @read_session_decorator
+    def get_tree_page(
+            self,
+            session: Session,
+            url: Union[None, str] = None,
+            comment_id: Union[None, int] = None,
+            max_depth: Union[None, int] = None,
+            limit_per_level: Union[None, int] = None,
+            after: Union[None, str] = None
+    ) -> Dict:
+        """
+        Get part of URL comments tree or comment inheritors tree limited
+        by depth and count of comments shown per parent. Limits are
+        applied in database, so cost of query depends on size of the part
+        instead of size of the whole tree
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url: URL address, used if comment ID is not specified
+        :type url: Union[None, str]
+        :param comment_id: Comment ID from comments table
+        :type comment_id: Union[None, int]
+        :param max_depth: Count of selected levels below URL or comment
+        :type max_depth: Union[None, int]
+        :param limit_per_level: Maximum count of inheritors selected for
+                                every comment
+        :type limit_per_level: Union[None, int]
+        :param after: Path of the last already shown first level comment
+        :type after: Union[None, str]
+        :return: Dictionary with comments rows, ID and depth of comment
+                 (None and 0 for URL) and continuation of the first level.
+                 Last element of every row and continuation of the first
+                 level are path of the last selected inheritor, '' if no
+                 inheritors are selected and None if all inheritors are
+                 selected
+        :rtype: Dict
+        """
+        if comment_id:
+            parent = self._select(session, CommentsDB, id=comment_id).one()
+            url_id = parent.url_id
+        else:
+            parent = None
+            url_id = self._select(session, URLsDB, url=url).one().id
+
+        if limit_per_level:
+            rows, more = self._tree_by_levels(session, url_id, parent,
+                                              max_depth, limit_per_level,
+                                              after)
+        else:
+            rows = self._tree_by_range(session, url_id, parent,
+                                       max_depth, after)
+            more = None
+        return {'rows': rows,
+                'comment_id': None if parent is None else parent.id,
+                'depth': 0 if parent is None else parent.depth,
+                'more': more}
+
+    @read_session_decorator
+    def get_updates(
+            self,
+            session: Session,
+            url: Union[None, str] = None,
+            comment_id: Union[None, int] = None,
+            after: Union[None, int] = None,
+            limit: Union[None, int] = None
+    ) -> Dict:
+        """
+        Get comments of URL or inheritors of comment added after comment
+        with specified ID. Comments IDs only grow, so new comments are
+        selected by range over URL and ID index and cost of call depends
+        on count of new comments
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url: URL address, used if comment ID is not specified
+        :type url: Union[None, str]
+        :param comment_id: Comment ID from comments table
+        :type comment_id: Union[None, int]
+        :param after: ID of the last seen comment, if not specified: no
+                      comments are selected and only cursor is returned
+        :type after: Union[None, int]
+        :param limit: Maximum count of comments, all if not specified
+        :type limit: Union[None, int]
+        :return: Dictionary with comments rows ordered by ID with parent ID
+                 as the last element and ID to continue from
+        :rtype: Dict
+        """
+        if comment_id:
+            scope = self._comment_scope(session, comment_id)
+            if scope is None:
+                raise NoResultFound('Comment is not found')
+            url_id, path = scope
+        else:
+            url_id = self._select(session, URLsDB, url=url).one().id
+            path = None
+        if after is None:
+            last_id = session.scalar(select(func.max(CommentsDB.id)))
+            return {'rows': [], 'cursor': last_id or 0}
+
+        query = self._qhelper.get_base_query(session)
+        query = query.add_columns(CommentsDB.parent_id)
+        query = query.filter(CommentsDB.url_id == url_id,
+                             CommentsDB.id > after)
+        if path is not None:
+            query = self._qhelper.child_path(query, path)
+        rows = query.order_by(CommentsDB.id).limit(limit).all()
+        return {'rows': rows, 'cursor': rows[-1].id if rows else after}
+
+    @read_session_decorator
+    def get_new_comments(
+            self,
+            session: Session,
+            after: Union[None, int] = None,
+            limit: int = 1000
+    ) -> Dict:
+        """
+        Get comments of all URLs added after comment with specified ID in
+        the format of listeners rows, they are read by range over primary
+        key. Used to pass comments written by other processes to listeners
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param after: ID of the last read comment, if not specified: no
+                      comments are selected and cursor is ID of the last
+                      comment
+        :type after: Union[None, int]
+        :param limit: Maximum count of comments
+        :type limit: int
+        :return: Dictionary with comments rows ordered by ID and ID to
+                 continue from
+        :rtype: Dict
+        """
+        if after is None:
+            last_id = session.scalar(select(func.max(CommentsDB.id)))
+            return {'rows': [], 'cursor': last_id or 0}
+        query = (select(*CommentsDB.__table__.columns, UserDB.user)
+                 .join(UserDB)
+                 .where(CommentsDB.id > after)
+                 .order_by(CommentsDB.id)
+                 .limit(limit))
+        rows = [dict(row._mapping) for row in session.execute(query)]
+        return {'rows': rows, 'cursor': rows[-1]['id'] if rows else after}
+
+    @read_session_decorator
     def get_url_inheritors(
             self,
             session: Session,
             url: str,
             first_level: bool = True,
+            with_activity: bool = False,
             **kwargs: Any
     ) -> List:
         """
@@ -232,6 +1425,9 @@ class DBClient:
         :type url: str
         :param first_level: Flag to get only first level comments
         :type first_level: bool
+        :param with_activity: Flag to add count of inheritors and date of
+                              the latest of them to every row
+        :type with_activity: bool
         :param kwargs: Additional parameters to filter query
             :start: (float) Start of time interval for filtering data
             :end: (float) End of time interval for filtering data
@@ -240,16 +1436,13 @@ class DBClient:
         :type kwargs: Any
         :return: List of inheritors
         """
-        url_id = self._select(session, URLsDB, url=url).one().id
-        query = self._qhelper.get_base_query(session)
-        query = query.filter(CommentsDB.url_id == url_id)
-        query = self._qhelper.modify_data(query, **kwargs)
-        if first_level:
-            query = self._qhelper.first_level_path(query)
-
+        query = self._url_query(session, url, first_level, **kwargs)
+        if with_activity:
+            query = query.add_columns(CommentsDB.reply_count,
+                                      CommentsDB.last_activity)
         return query.all()
 
-    @session_decorator
+    @read_session_decorator
     def get_user_comments(
             self, session: Session, user: str, **kwargs: Any
     ) -> List:
@@ -267,8 +1460,112 @@ class DBClient:
         :type kwargs: Any
         :return: List of inheritors
         """
-        user_id = self._select(session, UserDB, user=user).one().id
+        query = self._user_query(session, user, **kwargs)
+        return query.all()
+
+    @read_session_decorator
+    def search_comments(
+            self,
+            session: Session,
+            text: str,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            limit: Union[None, int] = None,
+            after: Union[None, int] = None,
+            **kwargs: Any
+    ) -> List:
+        """
+        Find comments containing every word of text by full-text index,
+        the most relevant comments go first
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param text: Searched words separated by spaces
+        :type text: str
+        :param url: Optional, if specified: search only comments of URL
+        :type url: Union[None, str]
+        :param user: Optional, if specified: search only comments of user
+        :type user: Union[None, str]
+        :param limit: Maximum count of comments, all if not specified
+        :type limit: Union[None, int]
+        :param after: ID of the last comment from previous page, next
+                      page starts after its current rank
+        :type after: Union[None, int]
+        :param kwargs: Additional parameters to filter query
+            :start: (float) Start of time interval for filtering data
+            :end: (float) End of time interval for filtering data
+            :last: (bool) Get only last actual comments
+        :type kwargs: Any
+        :return: List of comments rows with their rank as the last element
+        """
         query = self._qhelper.get_base_query(session)
-        query = query.filter(CommentsDB.user_id == user_id)
+        if url:
+            url_id = self._select(session, URLsDB, url=url).one().id
+            query = query.filter(CommentsDB.url_id == url_id)
+        if user:
+            user_id = self._select(session, UserDB, user=user).one().id
+            query = query.filter(CommentsDB.user_id == user_id)
         query = self._qhelper.modify_data(query, **kwargs)
-        return query.all()
+        query = self._qhelper.match_text(query, text, after)
+        return query.limit(limit).all()
+
+    def _report_query(
+            self,
+            session: Session,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            **kwargs: Any
+    ) -> Union[None, Query]:
+        """
+        Create query of user or URL comments history
+        :param session: Manages persistence operations for ORM-mapped objects
+        :type session: sqlalchemy.orm.Session
+        :param url: URL address
+        :type url: Union[None, str]
+        :param user: Username, has priority over URL
+        :type user: Union[None, str]
+        :param kwargs: Additional parameters to filter query
+        :type kwargs: Any
+        :return: Query or None if user or URL are not found
+        :rtype: Union[None, Query]
+        """
+        try:
+            if user:
+                return self._user_query(session, user, **kwargs)
+            if url:
+                return self._url_query(session, url, first_level=False,
+                                       **kwargs)
+        except NoResultFound:
+            pass
+        return None
+
+    def iter_report_rows(
+            self,
+            url: Union[None, str] = None,
+            user: Union[None, str] = None,
+            batch_size: int = 1000,
+            **kwargs: Any
+    ) -> Iterator:
+        """
+        Iterate over user or URL comments history. Rows are fetched from
+        database by batches while iterating, so whole history is never
+        loaded to memory
+        :param url: URL address
+        :type url: Union[None, str]
+        :param user: Username, has priority over URL
+        :type user: Union[None, str]
+        :param batch_size: Count of rows fetched from database at once
+        :type batch_size: int
+        :param kwargs: Additional parameters to filter query
+            :start: (float) Start of time interval for filtering data
+            :end: (float) End of time interval for filtering data
+            :last: (bool) Get only last actual comments
+            :do_sort: (bool) Sort data by time
+        :type kwargs: Any
+        :return: Iterator over comments rows, nothing if user or URL
+                 are not found
+        :rtype: Iterator
+        """
+        with Session(self._read_engine) as session:
+            query = self._report_query(session, url, user, **kwargs)
+            if query is not None:
+                yield from query.yield_per(batch_size)
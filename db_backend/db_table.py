@@ -1,4 +1,5 @@
-from sqlalchemy import BOOLEAN, Column, Float, ForeignKey, Integer, String
+from sqlalchemy import (BOOLEAN, DDL, Column, Float, ForeignKey, Index,
+                        Integer, String, column, event, table)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -9,7 +10,7 @@ class UserDB(Base):
     __tablename__ = 'users'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user = Column(String, index=True)
+    user = Column(String, index=True, unique=True)
 
     def __repr__(self):
         return f"User(id={self.id!r}, path={self.user!r})"
@@ -24,7 +25,7 @@ class URLsDB(Base):
     __tablename__ = 'urls'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    url = Column(String, index=True)
+    url = Column(String, index=True, unique=True)
 
     def __repr__(self):
         return f"User(id={self.id!r}, path={self.url!r})"
@@ -37,24 +38,124 @@ class URLsDB(Base):
 class CommentsDB(Base):
     """Database table to store unique comments"""
     __tablename__ = 'comments'
+    __table_args__ = (Index('ix_comments_url_id_path', 'url_id', 'path'),
+                      Index('ix_comments_url_id_parent_id_path',
+                            'url_id', 'parent_id', 'path'),
+                      Index('ix_comments_url_id_id', 'url_id', 'id'))
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     path = Column(String, index=True)
+    parent_id = Column(Integer, ForeignKey('comments.id'), index=True)
+    depth = Column(Integer, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     url_id = Column(Integer, ForeignKey('urls.id'))
     comment = Column(String)
     date = Column(Float)
     last = Column(BOOLEAN)
+    # Count of all inheritors and date of the latest of them, kept up to
+    # date by DBClient writes
+    reply_count = Column(Integer, nullable=False, default=0,
+                         server_default='0')
+    last_activity = Column(Float)
 
     def __repr__(self):
         return f"Comment(id={self.id!r}, path={self.path!r}," \
+               f" parent_id={self.parent_id!r}, depth={self.depth!r}," \
                f" user_id={self.user_id!r}, url_id={self.url_id!r}," \
                f" comment={self.comment!r}, date={self.date!r}, " \
-               f" last={self.last!r})"
+               f" last={self.last!r}, reply_count={self.reply_count!r}," \
+               f" last_activity={self.last_activity!r})"
 
     def get_dict(self):
         """Helpful method to get table instance representation"""
         return {'id': f'{self.id!r}', 'path': f'{self.path}',
+                'parent_id': f'{self.parent_id!r}',
+                'depth': f'{self.depth!r}',
                 'user_id': f'{self.user_id!r}', 'url_id': f'{self.url_id!r}',
                 'comment': f'{self.comment}', 'date': f'{self.date!r}',
-                'last': f'{self.last!r}'}
+                'last': f'{self.last!r}',
+                'reply_count': f'{self.reply_count!r}',
+                'last_activity': f'{self.last_activity!r}'}
+
+
+# Full-text index of comments text. Index takes text from comments table
+# instead of storing its copy, triggers keep it in sync with comments.
+# Only changes of comment text are indexed again, so updates of last flag
+# and parent do not touch the index
+COMMENTS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE comments_fts USING fts5("
+    "comment, content='comments', content_rowid='id')",
+    "CREATE TRIGGER comments_fts_insert AFTER INSERT ON comments BEGIN "
+    "INSERT INTO comments_fts(rowid, comment) "
+    "VALUES (new.id, new.comment); END",
+    "CREATE TRIGGER comments_fts_delete AFTER DELETE ON comments BEGIN "
+    "INSERT INTO comments_fts(comments_fts, rowid, comment) "
+    "VALUES ('delete', old.id, old.comment); END",
+    "CREATE TRIGGER comments_fts_update AFTER UPDATE OF comment ON comments "
+    "BEGIN "
+    "INSERT INTO comments_fts(comments_fts, rowid, comment) "
+    "VALUES ('delete', old.id, old.comment); "
+    "INSERT INTO comments_fts(rowid, comment) "
+    "VALUES (new.id, new.comment); END",
+)
+for statement in COMMENTS_FTS_DDL:
+    event.listen(CommentsDB.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
+event.listen(CommentsDB.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS comments_fts')
+             .execute_if(dialect='sqlite'))
+
+# Virtual table of full-text index, rank is relevance of matched comment,
+# smaller is better
+comments_fts = table('comments_fts',
+                     column('rowid', Integer),
+                     column('comment', String),
+                     column('rank'))
+
+
+class ChildCountersDB(Base):
+    """
+    Database table to store number of the last child allocated for comments
+    node. First level comments are counted per URL with zero parent_id
+    """
+    __tablename__ = 'child_counters'
+
+    url_id = Column(Integer, ForeignKey('urls.id'), primary_key=True)
+    parent_id = Column(Integer, primary_key=True)
+    last_child = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"ChildCounter(url_id={self.url_id!r}," \
+               f" parent_id={self.parent_id!r}," \
+               f" last_child={self.last_child!r})"
+
+    def get_dict(self):
+        """Helpful method to get table instance representation"""
+        return {'url_id': f'{self.url_id!r}',
+                'parent_id': f'{self.parent_id!r}',
+                'last_child': f'{self.last_child!r}'}
+
+
+class CommentClosureDB(Base):
+    """
+    Database table to store every ancestor of every comment with distance
+    between them, comment is stored as its own ancestor with zero depth.
+    Table is used by DBClient with closure storage
+    """
+    __tablename__ = 'comment_closure'
+    __table_args__ = (Index('ix_comment_closure_descendant_depth',
+                            'descendant', 'depth'),)
+
+    ancestor = Column(Integer, ForeignKey('comments.id'), primary_key=True)
+    descendant = Column(Integer, ForeignKey('comments.id'), primary_key=True)
+    depth = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"CommentClosure(ancestor={self.ancestor!r}," \
+               f" descendant={self.descendant!r}, depth={self.depth!r})"
+
+    def get_dict(self):
+        """Helpful method to get table instance representation"""
+        return {'ancestor': f'{self.ancestor!r}',
+                'descendant': f'{self.descendant!r}',
+                'depth': f'{self.depth!r}'}
@@ -0,0 +1,131 @@
+from typing import Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+DATABASE_URL = 'sqlite:///database/main.db'
+ASYNC_DATABASE_URL = 'sqlite+aiosqlite:///database/main.db'
+
+# Per connection page cache in KiB and size of memory mapped part of file
+_CACHE_SIZE_KIB = 32 * 1024
+_MMAP_SIZE = 256 * 1024 * 1024
+# Seconds to wait for lock held by other connection
+_BUSY_TIMEOUT = 30
+
+
+def _is_file_sqlite(url: URL) -> bool:
+    """Check if URL points to SQLite database file"""
+    return (url.get_backend_name() == 'sqlite'
+            and url.database not in (None, '', ':memory:'))
+
+
+def setup_sqlite(engine: Engine, read_only: bool = False) -> None:
+    """
+    Tune SQLite connections of engine. Write-ahead log lets readers work
+    while data is written, transactions are started by explicit BEGIN,
+    so read transactions see one database state. Transactions of writing
+    engine take write lock at the start, so concurrent writers wait for
+    each other instead of failing on lock upgrade. Read-only connections
+    can not modify database
+    :param engine: Object establishing connection to database
+    :type engine: sqlalchemy.engine.Engine
+    :param read_only: Flag to forbid data modification
+    :type read_only: bool
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    file_database = _is_file_sqlite(engine.url)
+    begin = 'BEGIN' if read_only else 'BEGIN IMMEDIATE'
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Driver starts transactions only before data modification,
+        # they are started in 'begin' handler instead
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if file_database and not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA cache_size=-{_CACHE_SIZE_KIB}')
+        cursor.execute(f'PRAGMA mmap_size={_MMAP_SIZE}')
+        cursor.execute(f'PRAGMA busy_timeout={_BUSY_TIMEOUT * 1000}')
+        if read_only:
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        # Reads of writing engine do not wait for write lock
+        if connection.get_execution_options().get('read_transaction'):
+            connection.exec_driver_sql('BEGIN')
+        else:
+            connection.exec_driver_sql(begin)
+
+
+def reading_engine(engine: Engine) -> Engine:
+    """
+    Get engine sharing connections pool with engine, its transactions are
+    started for reading, so they do not take SQLite write lock
+    :param engine: Object establishing connection to database
+    :type engine: sqlalchemy.engine.Engine
+    :return: Object establishing connection to database
+    :rtype: sqlalchemy.engine.Engine
+    """
+    return engine.execution_options(read_transaction=True)
+
+
+def create_db_engine(
+        url: str = DATABASE_URL,
+        read_only: bool = False,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        **kwargs: Any
+) -> Engine:
+    """
+    Create engine with connections pool shared by threads
+    :param url: Database URL
+    :type url: str
+    :param read_only: Flag to create pool of connections which can not
+                      modify database
+    :type read_only: bool
+    :param pool_size: Count of connections kept in pool
+    :type pool_size: int
+    :param max_overflow: Count of connections opened over pool size
+                         under load
+    :type max_overflow: int
+    :param kwargs: Other create_engine parameters
+    :type kwargs: Any
+    :return: Object establishing connection to database
+    :rtype: sqlalchemy.engine.Engine
+    """
+    if _is_file_sqlite(make_url(url)):
+        kwargs.setdefault('poolclass', QueuePool)
+        if kwargs['poolclass'] is QueuePool:
+            kwargs.update(pool_size=pool_size, max_overflow=max_overflow)
+        kwargs.setdefault('connect_args', {'check_same_thread': False})
+    engine = create_engine(url, **kwargs)
+    setup_sqlite(engine, read_only)
+    return engine
+
+
+def create_async_db_engine(
+        url: str = ASYNC_DATABASE_URL,
+        read_only: bool = False,
+        **kwargs: Any
+) -> AsyncEngine:
+    """
+    Create asynchronous engine with the same connections tuning
+    :param url: Database URL
+    :type url: str
+    :param read_only: Flag to forbid data modification
+    :type read_only: bool
+    :param kwargs: Other create_async_engine parameters
+    :type kwargs: Any
+    :return: Object establishing asynchronous connection to database
+    :rtype: sqlalchemy.ext.asyncio.AsyncEngine
+    """
+    engine = create_async_engine(url, **kwargs)
+    setup_sqlite(engine.sync_engine, read_only)
+    return engine
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Union
+
+from .serializer import dumps
+
+logger = logging.getLogger(__name__)
+
+# Comment sent to keep idle connection open through proxies and seconds
+# between these comments
+KEEPALIVE = ': keepalive\n\n'
+KEEPALIVE_INTERVAL = 15.0
+
+
+def comment_event(comment: Dict) -> Dict:
+    """
+    Create event data of added comment, it has the same keys as comments
+    returned by get_updates command
+    :param comment: Comments table row with username in 'user' key
+    :type comment: Dict
+    :return: Event data
+    :rtype: Dict
+    """
+    return {'path': comment['path'],
+            'comment_id': comment['id'],
+            'user': comment.get('user'),
+            'comment': comment['comment'],
+            'date': comment['date'],
+            'parent_id': comment['parent_id']}
+
+
+def format_event(event: Dict) -> str:
+    """
+    Serialize comment event in server-sent events format. Event ID is
+    comment ID, so reconnected client reports the last received comment
+    :param event: Event data
+    :type event: Dict
+    :return: Event text
+    :rtype: str
+    """
+    return f'id: {event["comment_id"]}\nevent: comment\n' \
+           f'data: {dumps(event)}\n\n'
+
+
+class Subscription:
+    """
+    Events of one URL waiting to be sent to one client. Subscription is
+    only a queue with wake-up flag, so idle subscribers cost nothing
+    until comment is added to their URL
+    """
+    def __init__(self, url_id: int, maxlen: int):
+        """
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param maxlen: Count of kept events not taken by client, older
+                       events are dropped
+        :type maxlen: int
+        """
+        self.url_id = url_id
+        self.closed = False
+        self._events = deque(maxlen=maxlen)
+        self._ready = threading.Event()
+
+    def push(self, event: Dict) -> None:
+        """
+        Add event and wake up waiting client, may be called from any thread
+        :param event: Event data
+        :type event: Dict
+        """
+        self._events.append(event)
+        self._wake()
+
+    def close(self) -> None:
+        """Mark subscription as finished and wake up waiting client"""
+        self.closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        """Wake up waiting client"""
+        self._ready.set()
+
+    def _drain(self) -> List[Dict]:
+        """
+        Take all kept events
+        :return: Events in order they were published
+        :rtype: List[Dict]
+        """
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+    def get(self, timeout: float) -> List[Dict]:
+        """
+        Wait for events in current thread
+        :param timeout: Maximum seconds of waiting
+        :type timeout: float
+        :return: Events, empty list if nothing was published in time
+        :rtype: List[Dict]
+        """
+        self._ready.wait(timeout)
+        self._ready.clear()
+        return self._drain()
+
+
+class AsyncSubscription(Subscription):
+    """Subscription waited for by coroutine of event loop it was made in"""
+    def __init__(self, url_id: int, maxlen: int):
+        """
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param maxlen: Count of kept events not taken by client, older
+                       events are dropped
+        :type maxlen: int
+        """
+        super().__init__(url_id, maxlen)
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def _wake(self) -> None:
+        """Wake up waiting coroutine from any thread"""
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self, timeout: float) -> List[Dict]:
+        """
+        Wait for events without blocking event loop
+        :param timeout: Maximum seconds of waiting
+        :type timeout: float
+        :return: Events, empty list if nothing was published in time
+        :rtype: List[Dict]
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+        return self._drain()
+
+
+class EventHub:
+    """
+    In-process publish/subscribe hub of added comments. Comments written
+    by this process are published by DBClient listener, comments written
+    by other processes are read from database by follow or follow_async
+    """
+    def __init__(self, maxlen: int = 1000, published_size: int = 10000):
+        """
+        :param maxlen: Count of events kept for every subscriber
+        :type maxlen: int
+        :param published_size: Count of the latest sent comments IDs
+                               remembered, so comments both published and
+                               read from database are not sent twice
+        :type published_size: int
+        """
+        self._maxlen = maxlen
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._sent = OrderedDict()
+        self._published_size = published_size
+
+    def subscribe(self, url_id: int) -> Subscription:
+        """
+        Start receiving comments of URL in current thread
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :return: Subscription to wait for events with
+        :rtype: Subscription
+        """
+        return self._add(Subscription(url_id, self._maxlen))
+
+    def subscribe_async(self, url_id: int) -> AsyncSubscription:
+        """
+        Start receiving comments of URL in running event loop
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :return: Subscription to wait for events with
+        :rtype: AsyncSubscription
+        """
+        return self._add(AsyncSubscription(url_id, self._maxlen))
+
+    def _add(
+            self, subscription: Subscription
+    ) -> Union[Subscription, AsyncSubscription]:
+        """
+        Register subscription
+        :param subscription: New subscription
+        :type subscription: Subscription
+        :return: The same subscription
+        :rtype: Union[Subscription, AsyncSubscription]
+        """
+        with self._lock:
+            self._subscribers.setdefault(subscription.url_id,
+                                         set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Stop sending events to subscription and close it
+        :param subscription: Subscription returned by subscribe
+        :type subscription: Subscription
+        """
+        subscription.close()
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.url_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.url_id]
+
+    def subscribers_count(self) -> int:
+        """Count of current subscriptions"""
+        with self._lock:
+            return sum(map(len, self._subscribers.values()))
+
+    def publish(self, comments: Iterable[Dict]) -> None:
+        """
+        Send comments to subscribers of their URLs, method is DBClient
+        listener. Comments already relayed are skipped
+        :param comments: Committed comments table rows
+        :type comments: Iterable[Dict]
+        """
+        self._send(comments)
+
+    def relay(self, comments: Iterable[Dict]) -> None:
+        """
+        Send comments read from database, comments already published by
+        this process are skipped
+        :param comments: Comments table rows
+        :type comments: Iterable[Dict]
+        """
+        self._send(comments)
+
+    def _send(self, comments: Iterable[Dict]) -> None:
+        """
+        Push comments events to subscribers of their URLs. Comment written
+        by this process is published after commit, so it may be read from
+        database first, it is sent only by the first of them
+        :param comments: Comments table rows
+        :type comments: Iterable[Dict]
+        """
+        deliveries = []
+        with self._lock:
+            for comment in comments:
+                if comment['id'] in self._sent:
+                    continue
+                self._sent[comment['id']] = None
+                if len(self._sent) > self._published_size:
+                    self._sent.popitem(last=False)
+                # Comments of URLs without subscribers are not serialized
+                subscribers = self._subscribers.get(comment['url_id'])
+                if subscribers:
+                    deliveries.append((comment_event(comment),
+                                       list(subscribers)))
+        for event, subscribers in deliveries:
+            for subscription in subscribers:
+                subscription.push(event)
+
+    def follow(
+            self,
+            fetch: Callable[..., Dict],
+            interval: float = 1.0,
+            after: Union[None, int] = None,
+            stop: Union[None, threading.Event] = None
+    ) -> threading.Thread:
+        """
+        Start thread relaying comments written by other processes sharing
+        database. Database is read only while there are subscribers, failed
+        reads are logged and repeated after interval
+        :param fetch: DBClient.get_new_comments
+        :type fetch: Callable[..., Dict]
+        :param interval: Seconds between database reads
+        :type interval: float
+        :param after: Optional, if specified: ID of comment to relay
+                      comments after, otherwise comments added after thread
+                      start are relayed
+        :type after: Union[None, int]
+        :param stop: Optional, if specified: thread finishes when event
+                     is set
+        :type stop: Union[None, threading.Event]
+        :return: Started daemon thread
+        :rtype: threading.Thread
+        """
+        stop = stop or threading.Event()
+
+        def run():
+            cursor = after
+            while True:
+                try:
+                    if self._has_readers(cursor):
+                        cursor = self._relay_page(fetch(after=cursor), cursor)
+                    else:
+                        cursor = fetch()['cursor']
+                except Exception:
+                    logger.exception('Reading of new comments failed')
+                if stop.wait(interval):
+                    return
+
+        thread = threading.Thread(target=run, name='event-hub-follow',
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    async def follow_async(
+            self,
+            fetch: Callable[..., Awaitable[Dict]],
+            interval: float = 1.0,
+            after: Union[None, int] = None
+    ) -> None:
+        """
+        Relay comments written by other processes sharing database until
+        task is cancelled. Database is read only while there are
+        subscribers, failed reads are logged and repeated after interval
+        :param fetch: AsyncDBClient.get_new_comments
+        :type fetch: Callable[..., Awaitable[Dict]]
+        :param interval: Seconds between database reads
+        :type interval: float
+        :param after: Optional, if specified: ID of comment to relay
+                      comments after, otherwise comments added after task
+                      start are relayed
+        :type after: Union[None, int]
+        """
+        cursor = after
+        while True:
+            try:
+                if self._has_readers(cursor):
+                    cursor = self._relay_page(await fetch(after=cursor),
+                                              cursor)
+                else:
+                    cursor = (await fetch())['cursor']
+            except Exception:
+                logger.exception('Reading of new comments failed')
+            await asyncio.sleep(interval)
+
+    def _has_readers(self, cursor: Union[None, int]) -> bool:
+        """
+        Check if new comments have to be read from database. Without
+        subscribers only cursor is moved to the last comment
+        :param cursor: ID of the last comment read before, None if it is
+                       not known yet
+        :type cursor: Union[None, int]
+        :return: Flag to read comments after cursor
+        :rtype: bool
+        """
+        return cursor is not None and self.subscribers_count() > 0
+
+    def _relay_page(self, page: Dict, cursor: int) -> int:
+        """
+        Relay comments read from database
+        :param page: Result of get_new_comments
+        :type page: Dict
+        :param cursor: ID of the last comment read before
+        :type cursor: int
+        :return: ID to continue reading from
+        :rtype: int
+        """
+        if 'rows' not in page:
+            return cursor
+        self.relay(page['rows'])
+        return page['cursor']
@@ -0,0 +1,242 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                    0.5, 1.0, 2.5, 5.0, 10.0)
+_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 1000, 10000, 100000)
+_SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class RequestStats:
+    """Statistics of one API command collected while it is processed"""
+    __slots__ = ('command', 'statements', 'sql_time', 'rows',
+                 'response_size')
+
+    def __init__(self, command: str):
+        """
+        :param command: API command name
+        :type command: str
+        """
+        self.command = command
+        self.statements = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.response_size = 0
+
+
+# Statistics of API command processed in current thread or task, None if
+# metrics are disabled
+_request_stats = ContextVar('request_stats', default=None)
+# Name of API command processed in current thread or task
+_current_command = ContextVar('current_command', default=None)
+
+
+def current_command() -> Union[None, str]:
+    """
+    Get API command processed in current thread or task
+    :return: Command name or None outside of command processing
+    :rtype: Union[None, str]
+    """
+    return _current_command.get()
+
+
+@contextmanager
+def command_scope(command: str) -> Iterator[None]:
+    """
+    Mark code of this block in current thread or task as processing of
+    API command
+    :param command: API command name
+    :type command: str
+    """
+    token = _current_command.set(command)
+    try:
+        yield
+    finally:
+        _current_command.reset(token)
+
+
+def record_rows(result: Any) -> None:
+    """
+    Add count of rows returned by DBClient method to statistics of current
+    command
+    :param result: DBClient method result, list of rows or dictionary
+                   with them in 'rows' key
+    :type result: Any
+    """
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    if isinstance(result, dict):
+        result = result.get('rows')
+    if isinstance(result, list):
+        stats.rows += len(result)
+
+
+class Histogram:
+    """Histogram of values observed per API command"""
+    def __init__(self, name: str, description: str, buckets: Sequence):
+        """
+        :param name: Metric name
+        :type name: str
+        :param description: Metric help text
+        :type description: str
+        :param buckets: Upper bounds of buckets in ascending order
+        :type buckets: Sequence
+        """
+        self.name = name
+        self.description = description
+        self._buckets = tuple(buckets)
+        # Per command: counts of values in every bucket, sum and count
+        self._values = {}
+
+    def observe(self, command: str, value: float) -> None:
+        """
+        Add value to histogram, method is called under Metrics lock
+        :param command: API command name
+        :type command: str
+        :param value: Observed value
+        :type value: float
+        """
+        values = self._values.get(command)
+        if values is None:
+            values = self._values[command] = [[0] * len(self._buckets),
+                                              0, 0]
+        counts = values[0]
+        for index, bound in enumerate(self._buckets):
+            if value <= bound:
+                counts[index] += 1
+        values[1] += value
+        values[2] += 1
+
+    def render(self) -> List[str]:
+        """
+        Create histogram lines in Prometheus text format
+        :return: Lines of metric
+        :rtype: List[str]
+        """
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        for command in sorted(self._values):
+            counts, total, count = self._values[command]
+            label = f'command="{command}"'
+            for bound, bucket_count in zip(self._buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} '
+                             f'{bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class Metrics:
+    """
+    Per command latency, SQL statements count and time, fetched rows and
+    response size. Nothing is collected for clients created without it
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {
+            'latency': Histogram('comments_request_duration_seconds',
+                                 'Time of API command processing',
+                                 _LATENCY_BUCKETS),
+            'sql_time': Histogram('comments_sql_duration_seconds',
+                                  'Time of SQL statements of API command',
+                                  _LATENCY_BUCKETS),
+            'statements': Histogram('comments_sql_statements',
+                                    'Count of SQL statements of API command',
+                                    _COUNT_BUCKETS),
+            'rows': Histogram('comments_rows_fetched',
+                              'Count of rows fetched by API command',
+                              _COUNT_BUCKETS),
+            'response_size': Histogram('comments_response_bytes',
+                                       'Size of serialized response',
+                                       _SIZE_BUCKETS),
+        }
+        self._engines = set()
+
+    def instrument(self, engine: Engine) -> None:
+        """
+        Count SQL statements and their time for commands using engine
+        :param engine: Object establishing connection to database
+        :type engine: sqlalchemy.engine.Engine
+        """
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_execute(connection, cursor, statement, parameters,
+                           context, executemany):
+            context.metrics_start = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_execute(connection, cursor, statement, parameters,
+                          context, executemany):
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.statements += 1
+                stats.sql_time += time.perf_counter() - context.metrics_start
+
+    @contextmanager
+    def track(self, command: str) -> Iterator[RequestStats]:
+        """
+        Collect statistics of API command processed in this block in current
+        thread or task
+        :param command: API command name
+        :type command: str
+        :return: Statistics of command, response size is set by caller
+        :rtype: Iterator[RequestStats]
+        """
+        stats = RequestStats(command)
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            duration = time.perf_counter() - start
+            _request_stats.reset(token)
+            self._observe(stats, duration)
+
+    def _observe(self, stats: RequestStats, duration: float) -> None:
+        """
+        Add command statistics to histograms
+        :param stats: Statistics of processed command
+        :type stats: RequestStats
+        :param duration: Seconds of command processing
+        :type duration: float
+        """
+        values = {'latency': duration, 'sql_time': stats.sql_time,
+                  'statements': stats.statements, 'rows': stats.rows,
+                  'response_size': stats.response_size}
+        with self._lock:
+            for name, value in values.items():
+                self._histograms[name].observe(stats.command, value)
+
+    def summary(self) -> Dict[str, Dict[str, Tuple]]:
+        """
+        Get sum and count of every histogram per command
+        :return: Dictionary with (sum, count) by histogram and command names
+        :rtype: Dict[str, Dict[str, Tuple]]
+        """
+        with self._lock:
+            return {name: {command: (values[1], values[2])
+                           for command, values in histogram._values.items()}
+                    for name, histogram in self._histograms.items()}
+
+    def render(self) -> str:
+        """
+        Create metrics page in Prometheus text format
+        :return: Metrics text
+        :rtype: str
+        """
+        with self._lock:
+            lines = []
+            for histogram in self._histograms.values():
+                lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
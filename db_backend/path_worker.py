@@ -1,4 +1,12 @@
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, Union
+
+# Digits of the path node encoding, listed in ascending ASCII order so that
+# encoded nodes compare as strings in the same way as the numbers they hold
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+_SEPARATOR = '.'
+# Character following the separator in ASCII table, every inheritor path
+# of node lies in [node + _SEPARATOR, node + _RANGE_END) interval
+_RANGE_END = chr(ord(_SEPARATOR) + 1)
 
 
 def result_decorator(func: Callable) -> Callable:
@@ -22,18 +30,107 @@ def result_decorator(func: Callable) -> Callable:
 class PathWorker:
     """Service class to perform operations with materialized paths"""
     def __init__(self):
-        self.filters = {'inherits_one_level': r'\..*\.',
-                        'first_level': r'(.*\..*)'}
+        self.filters = {'separator': _SEPARATOR,
+                        'range_end': _RANGE_END}
+
+    @staticmethod
+    def depth(path: str) -> int:
+        """
+        Get comment depth in the tree, first level comments have depth 1
+        :param path: Materialized path
+        :type path: str
+        :return: Path depth
+        :rtype: int
+        """
+        return path.count(_SEPARATOR) + 1
+
+    @staticmethod
+    def ancestor_paths(path: str) -> List[str]:
+        """
+        Get paths of all comment ancestors starting from first level one
+        :param path: Materialized path
+        :type path: str
+        :return: Ancestors paths
+        :rtype: List[str]
+        """
+        result = []
+        index = path.find(_SEPARATOR)
+        while index != -1:
+            result.append(path[:index])
+            index = path.find(_SEPARATOR, index + 1)
+        return result
 
     @staticmethod
-    def decode(path: str):
-        """Method to decode path node"""
-        pass
+    def encode_node(node: Union[int, str]) -> str:
+        """
+        Encode path node number to sortable string. Number is written in
+        base-36 and prefixed with the count of its digits (10 -> 1a,
+        36 -> 210), so longer numbers always sort after shorter ones
+        :param node: Path node number
+        :type node: Union[int, str]
+        :return: Encoded path node
+        :rtype: str
+        """
+        number = int(node)
+        if number < 1:
+            raise ValueError(f'Path node must be positive, got {number}')
+        digits = ''
+        while number:
+            number, rest = divmod(number, len(_DIGITS))
+            digits = _DIGITS[rest] + digits
+        return _DIGITS[len(digits)] + digits
 
     @staticmethod
-    def encode(path: str):
-        """Method to encode path node"""
-        pass
+    def decode_node(node: str) -> int:
+        """
+        Decode path node encoded by encode_node method
+        :param node: Encoded path node
+        :type node: str
+        :return: Path node number
+        :rtype: int
+        """
+        return int(node[1:], len(_DIGITS))
+
+    @staticmethod
+    def encode(path: str) -> str:
+        """
+        Encode readable path (1.10.2) to sortable materialized path
+        :param path: Readable path with dot separated numbers
+        :type path: str
+        :return: Encoded path
+        :rtype: str
+        """
+        nodes = path.split(_SEPARATOR)
+        return _SEPARATOR.join(PathWorker.encode_node(node) for node in nodes)
+
+    @staticmethod
+    def decode(path: str) -> str:
+        """
+        Decode materialized path to readable form (1.10.2)
+        :param path: Encoded path
+        :type path: str
+        :return: Readable path with dot separated numbers
+        :rtype: str
+        """
+        nodes = path.split(_SEPARATOR)
+        return _SEPARATOR.join(str(PathWorker.decode_node(node))
+                               for node in nodes)
+
+    @staticmethod
+    def make_path(number: int, parent_path: Union[None, str] = None) -> str:
+        """
+        Create path of comment with specified number among its siblings
+        :param number: Comment number on its level, starting from 1
+        :type number: int
+        :param parent_path: Parent path, None for first level comments
+        :type parent_path: Union[None, str]
+        :return: Generated path
+        :rtype: str
+        """
+        node = PathWorker.encode_node(number)
+        if parent_path is None:
+            return node
+        return parent_path + _SEPARATOR + node
 
     @staticmethod
     def next_child_path(path: str, first: bool = True) -> str:
@@ -47,32 +144,39 @@ class PathWorker:
         :rtype: str
         """
         if first:
-            return path + '.1'
+            return path + _SEPARATOR + PathWorker.encode_node(1)
         else:
-            dot_index = path.rfind('.')
-            previous_number = path[dot_index+1:]
-            return path[:dot_index+1] + f'{(int(previous_number) + 1)}'
+            dot_index = path.rfind(_SEPARATOR)
+            previous_number = PathWorker.decode_node(path[dot_index+1:])
+            return (path[:dot_index+1]
+                    + PathWorker.encode_node(previous_number + 1))
 
     @staticmethod
-    def next_path(path: str = '1', first: bool = True) -> str:
+    def next_path(path: Union[None, str] = None, first: bool = True) -> str:
         """
         Create next first level path
         :param path: Precious first level path if it is exists
-        :type path: str
+        :type path: Union[None, str]
         :param first: Flag if this comment is first in the comments table
         :type first: bool
         :return: Next generated path
         :rtype: str
         """
-        return path if first else str(int(path) + 1)
+        if first:
+            return PathWorker.encode_node(1)
+        return PathWorker.encode_node(PathWorker.decode_node(path) + 1)
 
     @staticmethod
     @result_decorator
-    def cut_paths(comments: List) -> List:
+    def cut_paths(comments: List, depth: int = 1) -> List:
         """
-        Remove first level path from comments path (1.1.2 -> 1.2)
+        Remove first levels from comments path (1.1.2 -> 1.2), so
+        inheritors of comment become first level comments
         :param comments: List of comments data
         :type comments: List
+        :param depth: Count of removed levels, it is depth of the comment
+                      whose inheritors are processed
+        :type depth: int
         :return: List of comments with modified paths
         :rtype: List
         """
@@ -80,8 +184,10 @@ class PathWorker:
         result = []
         for i, comment in enumerate(comments):
             path = comment[0]
-            path = path[path.find('.')+1:]
-            result.append([path, *comments[i][1:]])
+            start = 0
+            for _ in range(depth):
+                start = path.find(_SEPARATOR, start) + 1
+            result.append([path[start:], *comments[i][1:]])
 
         return result
 
@@ -90,7 +196,7 @@ class PathWorker:
     def create_sorted_dict(comments: List, keys: List) -> Dict:
         """
         Create nested dictionary with hierarchical comments data
-        :param comments: List of comments data
+        :param comments: List of comments data sorted by materialized path
         :type comments: List
         :param keys: List of keys for creating dictionary. Corresponds to
                      one comment elements after zero index
@@ -99,32 +205,29 @@ class PathWorker:
         :rtype: Dict
         """
         result = dict()
-        # Sort comments by its path length and path order
-        # Zero index is related to materialized path
-        sorted_comments = sorted(comments,
-                                 key=lambda x: (len(x[0].split('.')), x[0]))
-        # Create dictionary for fixing comments order in final dictionary
-        swap_dict = {}
-        for ind, comment in enumerate(sorted_comments, start=1):
-            if len(comment[0].split('.')) == 1:
-                swap_dict.update({comment[0]: str(ind)})
-            else:
-                break
-        # Place comments in dictionary in hierarchical order
+        # Comments are expected in materialized path order, so every parent
+        # comes before its inheritors and siblings come in their own order.
+        # Every path is parsed once and comment is attached to its parent
+        # found in the map of already placed nodes
         # 1: comment_1
         #      1: comment_1.1
         #          1: comment_1.1.1
         #      2: comment_1.2
-        for comment in sorted_comments:
-            info = {key: value for key, value in zip(keys, comment[1:])}
-            paths = comment[0].split('.')
-            if len(paths) == 1:
-                result[swap_dict[paths[0]]] = {**info, 'comments': dict()}
+        # Zero index is related to materialized path
+        nodes = {}
+        for comment in comments:
+            path = comment[0]
+            node = dict(zip(keys, comment[1:]))
+            node['comments'] = dict()
+            dot_index = path.rfind(_SEPARATOR)
+            if dot_index == -1:
+                # First level comments are numbered in their order
+                result[str(len(result) + 1)] = node
             else:
-                tmp_dict = result[swap_dict[paths[0]]]['comments']
-                for path in paths[1:-1]:
-                    tmp_dict = tmp_dict[path]['comments']
-                tmp_dict.update({paths[-1]: {**info, 'comments': dict()}})
+                parent = nodes[path[:dot_index]]
+                number = PathWorker.decode_node(path[dot_index+1:])
+                parent[str(number)] = node
+            nodes[path] = node['comments']
 
         return result
 
@@ -1,18 +1,18 @@
 import datetime
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Tuple, Union
 
-from sqlalchemy import and_, not_
+from sqlalchemy import Select, Subquery, and_, func, or_, select, union_all
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Query, Session
 
-from .db_table import CommentsDB, UserDB
+from .db_table import CommentClosureDB, CommentsDB, UserDB, comments_fts
 
 
 class QueryHelper:
     """Service class to handle basic operations with database query"""
     def __init__(self, filters: Dict):
         """
-        :param filters: Filters to find materialized path patterns
+        :param filters: Characters bounding materialized path ranges
         :type filters: Dict
         """
         self._path_filters = filters
@@ -88,8 +88,7 @@ class QueryHelper:
             return
         return result
 
-    @staticmethod
-    def child_path(query: Query, path: str) -> Query:
+    def child_path(self, query: Query, path: str) -> Query:
         """
         Get nested comments from specified parent path
         :param query: Query to database
@@ -99,10 +98,75 @@ class QueryHelper:
         :return: Query
         :rtype: sqlalchemy.orm.Query
         """
-        path_filter = path + '.'
-        query = query.filter(CommentsDB.path.startswith(path_filter))
+        # Range over path index instead of LIKE, which SQLite can't use
+        # with index for case-sensitive strings
+        lower_bound = path + self._path_filters['separator']
+        upper_bound = path + self._path_filters['range_end']
+        query = query.filter(and_(CommentsDB.path >= lower_bound,
+                                  CommentsDB.path < upper_bound))
         return query
 
+    @staticmethod
+    def descendants(
+            query: Query,
+            comment_id: int,
+            max_depth: Union[None, int] = None
+    ) -> Query:
+        """
+        Get nested comments of specified comment from closure table
+        :param query: Query to database
+        :type query: sqlalchemy.orm.Query
+        :param comment_id: Parent ID in comments table
+        :type comment_id: int
+        :param max_depth: Optional, if specified: count of selected levels
+                          below parent
+        :type max_depth: Union[None, int]
+        :return: Query
+        :rtype: sqlalchemy.orm.Query
+        """
+        query = query.join(CommentClosureDB,
+                           CommentClosureDB.descendant == CommentsDB.id)
+        query = query.filter(CommentClosureDB.ancestor == comment_id,
+                             CommentClosureDB.depth > 0)
+        if max_depth:
+            query = query.filter(CommentClosureDB.depth <= max_depth)
+        return query
+
+    @staticmethod
+    def ancestors(query: Query, comment_id: int) -> Query:
+        """
+        Get comment with chain of its ancestors from closure table
+        :param query: Query to database
+        :type query: sqlalchemy.orm.Query
+        :param comment_id: Comment ID in comments table
+        :type comment_id: int
+        :return: Query
+        :rtype: sqlalchemy.orm.Query
+        """
+        query = query.join(CommentClosureDB,
+                           CommentClosureDB.ancestor == CommentsDB.id)
+        return query.filter(CommentClosureDB.descendant == comment_id)
+
+    @staticmethod
+    def ancestors_activity(comment_ids: List[int]) -> Subquery:
+        """
+        Count inheritors among comments for every their ancestor from
+        closure table with date of the latest of them
+        :param comment_ids: Comments IDs in comments table
+        :type comment_ids: List[int]
+        :return: Subquery with 'ancestor', 'count' and 'date' columns
+        :rtype: sqlalchemy.Subquery
+        """
+        return (select(CommentClosureDB.ancestor,
+                       func.count().label('count'),
+                       func.max(CommentsDB.date).label('date'))
+                .join(CommentsDB,
+                      CommentsDB.id == CommentClosureDB.descendant)
+                .where(CommentClosureDB.descendant.in_(comment_ids),
+                       CommentClosureDB.depth > 0)
+                .group_by(CommentClosureDB.ancestor)
+                .subquery())
+
     def one_level_child_path(self, query: Query, path: str) -> Query:
         """
         Get only one level depth comments form specified parent path
@@ -113,11 +177,133 @@ class QueryHelper:
         :return: Query
         :rtype: sqlalchemy.orm.Query
         """
-        path_filter = path + self._path_filters['inherits_one_level']
+        depth = path.count(self._path_filters['separator']) + 2
         query = self.child_path(query, path)
-        query = query.filter(not_(CommentsDB.path.regexp_match(path_filter)))
+        query = query.filter(CommentsDB.depth == depth)
         return query
 
+    @staticmethod
+    def first_children(
+            url_id: int,
+            parent_ids: List[Union[None, int]],
+            limit: int,
+            after: Union[None, str] = None
+    ) -> Select:
+        """
+        Get first direct inheritors of every specified comment in tree
+        order. Every part is read by range over parent index up to limit,
+        so cost depends on count of selected comments instead of count of
+        all inheritors, all parts are selected by one statement
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param parent_ids: Parents IDs, None for first level comments
+        :type parent_ids: List[Union[None, int]]
+        :param limit: Maximum count of comments per parent
+        :type limit: int
+        :param after: Optional, if specified: get only inheritors placed
+                      after comment with this path
+        :type after: Union[None, str]
+        :return: Statement with columns of base query and parent ID, rows
+                 of every parent go in path order
+        :rtype: sqlalchemy.Select
+        """
+        parts = []
+        for parent_id in parent_ids:
+            part = (select(CommentsDB.path, CommentsDB.id, UserDB.user,
+                           CommentsDB.comment, CommentsDB.date,
+                           CommentsDB.parent_id)
+                    .join(UserDB)
+                    .where(CommentsDB.url_id == url_id,
+                           CommentsDB.parent_id.is_(parent_id)
+                           if parent_id is None
+                           else CommentsDB.parent_id == parent_id))
+            if after:
+                part = part.where(CommentsDB.path > after)
+            part = part.order_by(CommentsDB.path).limit(limit)
+            # SQLite allows ORDER BY and LIMIT only in subqueries of
+            # compound statement
+            parts.append(select(part.subquery()))
+        return union_all(*parts)
+
+    @staticmethod
+    def siblings(
+            url_id: int,
+            nodes: List[Tuple[Union[None, int], str]],
+            limit: int
+    ) -> Select:
+        """
+        Get comments going just before and just after specified comments
+        among their siblings, every part is read by range over parent
+        index, all parts are selected by one statement
+        :param url_id: URL ID from urls table
+        :type url_id: int
+        :param nodes: Parent ID, None for first level, and path of comments
+        :type nodes: List[Tuple[Union[None, int], str]]
+        :param limit: Count of siblings on every side of comment
+        :type limit: int
+        :return: Statement with the same columns as base query
+        :rtype: sqlalchemy.Select
+        """
+        parts = []
+        for parent_id, path in nodes:
+            level = (select(CommentsDB.path, CommentsDB.id, UserDB.user,
+                            CommentsDB.comment, CommentsDB.date)
+                     .join(UserDB)
+                     .where(CommentsDB.url_id == url_id,
+                            CommentsDB.parent_id.is_(parent_id)
+                            if parent_id is None
+                            else CommentsDB.parent_id == parent_id))
+            before = (level.where(CommentsDB.path < path)
+                      .order_by(CommentsDB.path.desc()).limit(limit))
+            after = (level.where(CommentsDB.path > path)
+                     .order_by(CommentsDB.path).limit(limit))
+            # SQLite allows ORDER BY and LIMIT only in subqueries of
+            # compound statement
+            parts.extend(select(part.subquery()) for part in (before, after))
+        return union_all(*parts)
+
+    @staticmethod
+    def match_text(
+            query: Query,
+            text: str,
+            after: Union[None, int] = None
+    ) -> Query:
+        """
+        Get comments containing every word of text by full-text index,
+        ordered by relevance. Query rows get rank of comment
+        :param query: Query to database
+        :type query: sqlalchemy.orm.Query
+        :param text: Searched words separated by spaces
+        :type text: str
+        :param after: Optional, if specified: ID of the last comment from
+                      previous page
+        :type after: Union[None, int]
+        :return: Query
+        :rtype: sqlalchemy.orm.Query
+        """
+        words = text.split()
+        if not words:
+            raise ValueError('Search text is empty')
+        # Every word is quoted, so FTS5 query syntax characters are
+        # searched as they are
+        expression = ' '.join('"' + word.replace('"', '""') + '"'
+                              for word in words)
+        query = query.add_columns(comments_fts.c.rank)
+        query = query.join(comments_fts,
+                           comments_fts.c.rowid == CommentsDB.id)
+        query = query.filter(comments_fts.c.comment.match(expression))
+        if after is not None:
+            # Rank depends on statistics of the whole index and changes
+            # with every write, so rank of the last comment is taken now
+            previous = comments_fts.alias('previous')
+            rank = select(previous.c.rank).where(
+                previous.c.rowid == after,
+                previous.c.comment.match(expression)).scalar_subquery()
+            query = query.filter(or_(comments_fts.c.rank > rank,
+                                     and_(comments_fts.c.rank == rank,
+                                          CommentsDB.id > after)))
+        return query.order_by(comments_fts.c.rank, CommentsDB.id)
+
     def first_level_path(self, query: Query) -> Query:
         """
         Get only first level comment from comments table
@@ -126,8 +312,7 @@ class QueryHelper:
         :return: Query
         :rtype: sqlalchemy.orm.Query
         """
-        path_filter = self._path_filters['first_level']
-        query = query.filter(not_(CommentsDB.path.regexp_match(path_filter)))
+        query = query.filter(CommentsDB.depth == 1)
 
         return query
 
@@ -0,0 +1,205 @@
+import logging
+import time
+from collections import deque
+from typing import Any, List, NamedTuple, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Query, Session
+
+from .metrics import current_command
+
+logger = logging.getLogger(__name__)
+
+# Statements which have query plan
+_EXPLAINED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+class SlowQuery(NamedTuple):
+    """Statement executed longer than threshold"""
+    duration: float
+    command: Union[None, str]
+    statement: str
+    parameters: Any
+    plan: List[str]
+
+
+def _explain(dbapi_connection: Any, statement: str,
+             parameters: Any) -> List[str]:
+    """
+    Get SQLite query plan of statement with driver connection, so
+    statement events are not emitted again
+    :param dbapi_connection: Database driver connection
+    :type dbapi_connection: Any
+    :param statement: SQL statement
+    :type statement: str
+    :param parameters: Statement parameters
+    :type parameters: Any
+    :return: Query plan lines
+    :rtype: List[str]
+    """
+    if not statement.lstrip().upper().startswith(_EXPLAINED):
+        return []
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        # Last column of plan row is its description
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _first_parameters(parameters: Any) -> Any:
+    """
+    Get parameters of statement execution to explain. Statement executed
+    for many parameters sets, including insert with RETURNING which is not
+    reported as executemany, has the same plan for every set
+    :param parameters: Statement parameters or list of their sets
+    :type parameters: Any
+    :return: Parameters of one execution
+    :rtype: Any
+    """
+    if (isinstance(parameters, (list, tuple)) and parameters
+            and isinstance(parameters[0], (list, tuple, dict))):
+        return parameters[0]
+    return parameters
+
+
+def _short(parameters: Any, limit: int = 1000) -> str:
+    """
+    Get parameters representation cut to limit
+    :param parameters: Statement parameters
+    :type parameters: Any
+    :param limit: Maximum length of representation
+    :type limit: int
+    :return: Parameters representation
+    :rtype: str
+    """
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def query_plan(session: Session, query: Union[Query, Any]) -> List[str]:
+    """
+    Get SQLite query plan of ORM query
+    :param session: Manages persistence operations for ORM-mapped objects
+    :type session: sqlalchemy.orm.Session
+    :param query: ORM query or SQL statement
+    :type query: Union[sqlalchemy.orm.Query, Any]
+    :return: Query plan lines
+    :rtype: List[str]
+    """
+    statement = query.statement if isinstance(query, Query) else query
+    connection = session.connection()
+    compiled = statement.compile(dialect=connection.dialect,
+                                 compile_kwargs={'render_postcompile': True})
+    parameters = tuple(compiled.params[name]
+                       for name in compiled.positiontup or [])
+    return _explain(connection.connection.dbapi_connection, str(compiled),
+                    parameters)
+
+
+def assert_uses_index(
+        session: Session,
+        query: Union[Query, Any],
+        index: Union[None, str] = None
+) -> List[str]:
+    """
+    Check that every table of query is searched by index instead of
+    scanning whole table. Rows of subqueries and co-routines of compound
+    statements are not tables, their scans are allowed
+    :param session: Manages persistence operations for ORM-mapped objects
+    :type session: sqlalchemy.orm.Session
+    :param query: ORM query or SQL statement
+    :type query: Union[sqlalchemy.orm.Query, Any]
+    :param index: Optional, if specified: name of index query has to use
+    :type index: Union[None, str]
+    :return: Query plan lines
+    :rtype: List[str]
+    """
+    plan = query_plan(session, query)
+    coroutines = {f'SCAN {line.split()[-1]}' for line in plan
+                  if line.startswith('CO-ROUTINE')}
+    scans = [line for line in plan if line.startswith('SCAN')
+             and 'SUBQUERY' not in line and 'CONSTANT ROW' not in line
+             and line not in coroutines]
+    assert not scans, 'Query scans whole table:\n' + '\n'.join(plan)
+    if index is not None:
+        assert any(f'INDEX {index} ' in f'{line} ' for line in plan), \
+            f'Query does not use {index}:\n' + '\n'.join(plan)
+    return plan
+
+
+class SlowQueryLog:
+    """
+    Log of statements executed longer than threshold with their parameters,
+    query plan and API command they were executed for
+    """
+    def __init__(self, threshold: float, maxlen: int = 100):
+        """
+        :param threshold: Minimum statement duration in seconds
+        :type threshold: float
+        :param maxlen: Count of the latest slow statements kept in memory
+        :type maxlen: int
+        """
+        self.threshold = threshold
+        self.entries = deque(maxlen=maxlen)
+        self._engines = set()
+
+    def instrument(self, engine: Engine) -> None:
+        """
+        Measure statements executed by engine
+        :param engine: Object establishing connection to database
+        :type engine: sqlalchemy.engine.Engine
+        """
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_execute(connection, cursor, statement, parameters,
+                           context, executemany):
+            context.slow_query_start = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_execute(connection, cursor, statement, parameters,
+                          context, executemany):
+            duration = time.perf_counter() - context.slow_query_start
+            if duration >= self.threshold:
+                self._add(connection, duration, statement, parameters)
+
+    def _add(
+            self,
+            connection: Connection,
+            duration: float,
+            statement: str,
+            parameters: Any
+    ) -> None:
+        """
+        Explain slow statement and write it to log
+        :param connection: Connection statement was executed with
+        :type connection: sqlalchemy.engine.Connection
+        :param duration: Statement duration in seconds
+        :type duration: float
+        :param statement: SQL statement
+        :type statement: str
+        :param parameters: Statement parameters, list of them for
+                           executemany
+        :type parameters: Any
+        """
+        plan = []
+        if connection.dialect.name == 'sqlite':
+            # Diagnostic must not fail statement which already succeeded
+            try:
+                plan = _explain(connection.connection.dbapi_connection,
+                                statement, _first_parameters(parameters))
+            except Exception:
+                logger.exception('Query plan of slow statement is not '
+                                 'available: %s', statement)
+        entry = SlowQuery(duration, current_command(), statement,
+                          parameters, plan)
+        self.entries.append(entry)
+        logger.warning('Slow query %.4fs, command %s: %s\n'
+                       'parameters: %s\nplan:\n%s',
+                       duration, entry.command, statement,
+                       _short(parameters), '\n'.join(plan))
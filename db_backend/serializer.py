@@ -0,0 +1,21 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data: Any) -> str:
+    """
+    Serialize data to JSON string, orjson is used if it is installed as it
+    is several times faster than json module
+    :param data: Data to serialize
+    :type data: Any
+    :return: JSON string
+    :rtype: str
+    """
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data)
@@ -1,15 +1,19 @@
+import shutil
+
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import Session
 
-from db_backend.db_table import Base, CommentsDB, URLsDB, UserDB
+from db_backend.db_table import (Base, ChildCountersDB, CommentsDB, URLsDB,
+                                 UserDB)
+from db_backend.path_worker import PathWorker
 
 
-@pytest.fixture
-def database():
-    """Create fake database for tests"""
-    engine = create_engine('sqlite+pysqlite:///:memory:')
+def fill_database(engine):
+    """Create tables and fill them with test data"""
     Base.metadata.create_all(engine)
+    encode = PathWorker.encode
 
     user_first = UserDB(user='user_1')
     user_second = UserDB(user='user_2')
@@ -17,40 +21,88 @@ def database():
     url_first = URLsDB(url='url_1')
     url_second = URLsDB(url='url_2')
 
-    comment_1 = CommentsDB(path='1', user_id=1, url_id=1,
+    comment_1 = CommentsDB(path=encode('1'), parent_id=None, depth=1,
+                           user_id=1, url_id=1,
                            comment='first comment',
                            date=10.0,
-                           last=False)
+                           last=False,
+                           reply_count=3,
+                           last_activity=25.0)
 
-    comment_2 = CommentsDB(path='1.1', user_id=1, url_id=1,
+    comment_2 = CommentsDB(path=encode('1.1'), parent_id=1, depth=2,
+                           user_id=1, url_id=1,
                            comment='1.1 comment',
                            date=15.0,
-                           last=False)
+                           last=False,
+                           reply_count=1,
+                           last_activity=25.0)
 
-    comment_3 = CommentsDB(path='1.2', user_id=2, url_id=1,
+    comment_3 = CommentsDB(path=encode('1.2'), parent_id=1, depth=2,
+                           user_id=2, url_id=1,
                            comment='1.2 comment',
                            date=20.0,
                            last=True)
 
-    comment_4 = CommentsDB(path='2', user_id=2, url_id=2,
+    comment_4 = CommentsDB(path=encode('2'), parent_id=None, depth=1,
+                           user_id=2, url_id=2,
                            comment='first comment',
                            date=5.0,
                            last=False)
 
-    comment_5 = CommentsDB(path='1.1.1', user_id=2, url_id=1,
+    comment_5 = CommentsDB(path=encode('1.1.1'), parent_id=2, depth=3,
+                           user_id=2, url_id=1,
                            comment='1.1.1 comment',
                            date=25.0,
                            last=True)
 
-    comment_6 = CommentsDB(path='3', user_id=2, url_id=1,
+    comment_6 = CommentsDB(path=encode('3'), parent_id=None, depth=1,
+                           user_id=2, url_id=1,
                            comment='first comment',
                            date=20.0,
                            last=True)
 
+    counters = [ChildCountersDB(url_id=1, parent_id=0, last_child=3),
+                ChildCountersDB(url_id=2, parent_id=0, last_child=2),
+                ChildCountersDB(url_id=1, parent_id=1, last_child=2),
+                ChildCountersDB(url_id=1, parent_id=2, last_child=1)]
+
     with Session(engine) as session:
         session.add_all([user_first, user_second, url_first, url_second,
                          comment_1, comment_2, comment_3, comment_4,
-                         comment_5, comment_6])
+                         comment_5, comment_6, *counters])
         session.commit()
 
+
+@pytest.fixture
+def database():
+    """Create fake database for tests"""
+    engine = create_engine('sqlite+pysqlite:///:memory:')
+    fill_database(engine)
+    return engine
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    """Create fake database file, it can be opened by several connections"""
+    engine = create_engine(f'sqlite+pysqlite:///{tmp_path / "test.db"}')
+    fill_database(engine)
     return engine
+
+
+@pytest.fixture
+def async_database(database_file):
+    """Create asynchronous engine connected to fake database file"""
+    database_file.dispose()
+    return create_async_engine(
+        database_file.url.set(drivername='sqlite+aiosqlite'))
+
+
+@pytest.fixture
+def replicas(database_file, tmp_path):
+    """Create two copies of fake database file used as its replicas"""
+    engines = []
+    for number in range(2):
+        path = tmp_path / f'replica_{number}.db'
+        shutil.copy(database_file.url.database, path)
+        engines.append(create_engine(f'sqlite+pysqlite:///{path}'))
+    return engines
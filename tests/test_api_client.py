@@ -1,6 +1,12 @@
+import csv
+import gzip
 import json
+from contextlib import contextmanager
+
+import pytest
 
 from db_backend.api_client import APIClient, RequestData
+from db_backend.engine import create_db_engine
 
 
 class FakeDBClient:
@@ -11,6 +17,10 @@ class FakeDBClient:
     def add_comment(self, *args, **kwargs):
         pass
 
+    @contextmanager
+    def primary_reads(self):
+        yield
+
     def get_url_inheritors(self, *args, **kwargs):
         return {'a': 'b'}
 
@@ -21,7 +31,13 @@ class FakeDBClient:
         return {'a': 'b'}
 
     def get_table_data(self, *args, **kwargs):
-        return {'a': 'b'}
+        return [{'id': 3}, {'id': 4}]
+
+    def get_url_id(self, *args, **kwargs):
+        return 1
+
+    def get_comment_scope(self, *args, **kwargs):
+        return 1, '11'
 
 
 class FakePathWorker:
@@ -41,7 +57,10 @@ def test_parse_request():
     test_command = '{"command": "get_comment_tree", "url": "url_1"}'
     api_client = APIClient('fake_engine')
     correct_result = RequestData('get_comment_tree', {"url": "url_1",
-                                                      "comment_id": None})
+                                                      "comment_id": None,
+                                                      "max_depth": None,
+                                                      "limit_per_level": None,
+                                                      "cursor": None})
 
     test_result = api_client._parse_request(test_command)
 
@@ -56,8 +75,396 @@ def test_process_request():
     api_client._db_client = FakeDBClient('Fake_engine')
     api_client._pworker = FakePathWorker()
 
-    correct_result = json.dumps({'a': 'b'})
+    correct_result = {'a': 'b'}
 
     test_result = api_client.process_request(test_command)
 
+    assert json.loads(test_result) == correct_result
+
+
+def test_process_request_uses_cache():
+    """Testing comment tree response is cached until comment is added"""
+    test_command = '{"command": "get_comment_tree", "url": "url_1"}'
+    api_client = APIClient('fake_engine')
+    db_client = FakeDBClient('Fake_engine')
+    api_client._db_client = db_client
+    api_client._pworker = FakePathWorker()
+
+    first_result = api_client.process_request(test_command)
+    db_client.get_url_inheritors = lambda *args, **kwargs: {'c': 'd'}
+    cached_result = api_client.process_request(test_command)
+    api_client._cache.invalidate([{'url_id': 1, 'path': '11.11'}])
+    new_result = api_client.process_request(test_command)
+
+    assert first_result == cached_result
+    assert json.loads(first_result) == {'a': 'b'}
+    assert json.loads(new_result) == {'c': 'd'}
+    assert api_client.cache_info()['hits'] == 1
+
+
+@pytest.mark.usefixtures("database_file", "replicas")
+def test_cached_responses_are_read_from_primary(database_file, replicas):
+    """Testing lagging replica result is not cached as the current one"""
+    test_command = '{"command": "get_comment_tree", "url": "url_2"}'
+    api_client = APIClient(database_file, read_engines=replicas)
+    writer = APIClient(database_file)
+    writer._db_client.subscribe(api_client._cache.invalidate)
+
+    api_client.process_request(test_command)
+    writer.process_request('{"command": "add_comment", "parent_id": 4, '
+                           '"url": "url_2", "user": "user_1", '
+                           '"comment": "new"}')
+    test_result = json.loads(api_client.process_request(test_command))
+
+    assert test_result['1']['comments']['1']['comment'] == 'new'
+
+
+@pytest.mark.usefixtures("database_file", "replicas")
+def test_cached_batch_responses_are_read_from_primary(database_file,
+                                                      replicas):
+    """Testing lagging replica result of batch is not cached as the
+    current one"""
+    test_command = '{"command": "get_comment_tree", "url": "url_2"}'
+    api_client = APIClient(database_file, read_engines=replicas)
+    writer = APIClient(database_file)
+    writer._db_client.subscribe(api_client._cache.invalidate)
+
+    api_client.process_request(test_command)
+    writer.process_request('{"command": "add_comment", "parent_id": 4, '
+                           '"url": "url_2", "user": "user_1", '
+                           '"comment": "new"}')
+    batch_result = json.loads(api_client.process_request(f'[{test_command}]'))
+    test_result = json.loads(api_client.process_request(test_command))
+
+    assert batch_result[0]['1']['comments']['1']['comment'] == 'new'
+    assert test_result == batch_result[0]
+
+
+@pytest.mark.usefixtures("database_file")
+def test_batch_response_is_not_cached_under_later_version(database_file):
+    """Testing write committed while batch snapshot is read does not
+    make batch result cached as the current one"""
+    test_command = '{"command": "get_comment_tree", "url": "url_2"}'
+    engine = create_db_engine(str(database_file.url))
+    api_client = APIClient(engine)
+    writer = APIClient(engine)
+    writer._db_client.subscribe(api_client._cache.invalidate)
+    get_url_id = api_client._db_client.get_url_id
+    writes = []
+
+    def write_after(*args, **kwargs):
+        result = get_url_id(*args, **kwargs)
+        if not writes:
+            writes.append(writer.process_request(
+                '{"command": "add_comment", "parent_id": 4, '
+                '"url": "url_2", "user": "user_1", "comment": "new"}'))
+        return result
+
+    api_client._db_client.get_url_id = write_after
+    api_client.process_request(f'[{test_command}]')
+    test_result = json.loads(api_client.process_request(test_command))
+
+    assert test_result['1']['comments']['1']['comment'] == 'new'
+
+
+@pytest.mark.parametrize('comments', [{'url': 'url_1'}, ['a'],
+                                      [{'user': 'user_1', 'comment': 'a'}]])
+def test_bulk_add_comments_when_comments_are_wrong(comments):
+    """Testing bulk_add_comments command checks every comment first"""
+    api_client = APIClient('fake_engine')
+    request = {'command': 'bulk_add_comments', 'comments': comments}
+
+    test_result = api_client.process_request(json.dumps(request))
+
+    assert json.loads(test_result) == {'Response': 'Wrong command!'}
+
+
+@pytest.mark.usefixtures("database")
+def test_process_request_batch(database):
+    """Testing array of commands is processed in order with one result
+    per command and identical reads are run once"""
+    requests = [{'command': 'ger_url_first_level_comments', 'url': 'url_1'},
+                {'command': 'get_comment_tree', 'url': 'url_1',
+                 'comment_id': 1},
+                {'command': 'get_user_history', 'user': 'user_2'},
+                {'command': 'get_user_history', 'user': 'user_2'},
+                {'command': 'add_comment', 'parent_id': 1, 'url': 'url_1',
+                 'user': 'user_1', 'comment': 'new'},
+                {'command': 'get_comment_tree', 'url': 'url_1',
+                 'comment_id': 1},
+                {'command': 'unknown'}]
+    api_client = APIClient(database)
+    calls = []
+    get_user_comments = api_client._db_client.get_user_comments
+    api_client._db_client.get_user_comments = (
+        lambda *args, **kwargs: calls.append(args)
+        or get_user_comments(*args, **kwargs))
+
+    test_result = json.loads(
+        api_client.process_request(json.dumps(requests)))
+
+    assert len(test_result) == len(requests)
+    assert test_result[2] == test_result[3]
+    assert len(calls) == 1
+    assert test_result[4] == 7
+    assert len(test_result[5]) == len(test_result[1]) + 1
+    assert test_result[6] == {'Response': 'Wrong command!'}
+
+
+@pytest.mark.usefixtures("database")
+def test_get_comment_tree_paged(database):
+    """Testing get_comment_tree method returns cursors of collapsed
+    comments and loads them by cursor"""
+    api_client = APIClient(database)
+
+    first_page = api_client.get_comment_tree('url_1', max_depth=2,
+                                             limit_per_level=1)
+    next_roots = api_client.get_comment_tree('url_1', max_depth=2,
+                                             limit_per_level=1,
+                                             cursor=first_page['cursor'])
+    first_comment = first_page['comments']['1']
+    reply = first_comment['comments']['1']
+    next_replies = api_client.get_comment_tree(
+        'url_1', max_depth=2, cursor=first_comment['cursor'])
+    reply_replies = api_client.get_comment_tree('url_1',
+                                                cursor=reply['cursor'])
+
+    assert first_comment['comment_id'] == 1
+    assert reply['comment_id'] == 2
+    assert list(reply['comments']) == []
+    assert next_roots['comments']['1']['comment_id'] == 6
+    assert next_roots['cursor'] is None
+    assert next_replies['comments']['1']['comment_id'] == 3
+    assert reply_replies['comments']['1']['comment_id'] == 5
+
+
+@pytest.mark.usefixtures("database")
+def test_get_comment_tree_of_nested_comment(database):
+    """Testing get_comment_tree method returns inheritors of comment
+    from any level"""
+    api_client = APIClient(database)
+
+    test_result = api_client.get_comment_tree('url_1', comment_id=2)
+
+    assert list(test_result) == ['1']
+    assert test_result['1']['comment_id'] == 5
+
+
+def test_get_comment_tree_when_cursor_is_wrong():
+    """Testing get_comment_tree method with broken cursor"""
+    api_client = APIClient('fake_engine')
+
+    test_result = api_client.get_comment_tree('url_1', cursor='abc')
+
+    assert test_result == {'Response': 'Wrong command!'}
+
+
+@pytest.mark.usefixtures("database")
+def test_get_url_comments_with_activity(database):
+    """Testing first level comments go with count and date of their
+    inheritors, which are updated by added reply"""
+    api_client = APIClient(database)
+
+    api_client.process_request('{"command": "add_comment", "parent_id": 5, '
+                               '"url": "url_1", "user": "user_1", '
+                               '"comment": "reply"}')
+    test_result = json.loads(api_client.process_request(
+        '{"command": "ger_url_first_level_comments", "url": "url_1"}'))
+
+    assert test_result['1']['reply_count'] == 4
+    assert test_result['1']['last_activity'] > 25.0
+    assert test_result['2']['reply_count'] == 0
+    assert test_result['2']['last_activity'] is None
+
+
+@pytest.mark.usefixtures("database")
+def test_get_comment_context(database):
+    """Testing get_comment_context method returns chain of ancestors with
+    their siblings"""
+    api_client = APIClient(database)
+
+    chain = api_client.get_comment_context(5)
+    context = api_client.get_comment_context(5, siblings=1)
+
+    assert list(chain) == ['1']
+    assert list(chain['1']['comments']) == ['1']
+    assert chain['1']['comments']['1']['comments']['1']['comment_id'] == 5
+    assert [comment['comment_id'] for comment in context.values()] == [1, 6]
+    assert [comment['comment_id'] for comment
+            in context['1']['comments'].values()] == [2, 3]
+    assert api_client.get_comment_context(100) == {'Response': 'No results'}
+
+
+@pytest.mark.parametrize('comment_id, siblings',
+                         [(None, None), ('abc', None), (1, -1)])
+def test_get_comment_context_when_parameters_are_wrong(comment_id, siblings):
+    """Testing get_comment_context method with wrong parameters"""
+    api_client = APIClient('fake_engine')
+
+    test_result = api_client.get_comment_context(comment_id, siblings)
+
+    assert test_result == {'Response': 'Wrong command!'}
+
+
+@pytest.mark.usefixtures("database")
+def test_get_updates(database):
+    """Testing get_updates method returns comments added after cursor"""
+    api_client = APIClient(database)
+
+    start = api_client.get_updates('url_1')
+    api_client.process_request('{"command": "add_comment", "parent_id": 2, '
+                               '"url": "url_1", "user": "user_1", '
+                               '"comment": "new reply"}')
+    api_client.process_request('{"command": "add_comment", "url": "url_2", '
+                               '"user": "user_1", "comment": "other url"}')
+    updates = api_client.get_updates('url_1', cursor=start['cursor'])
+    subtree_updates = api_client.get_updates(comment_id=3, cursor=3)
+    no_updates = api_client.get_updates('url_1', cursor=updates['cursor'])
+
+    assert start == {'comments': [], 'cursor': 6, 'more': False}
+    assert [comment['comment_id'] for comment
+            in updates['comments']] == [7]
+    assert updates['comments'][0]['parent_id'] == 2
+    assert updates['comments'][0]['path'] == '11.11.12'
+    assert updates['cursor'] == 7
+    assert subtree_updates['comments'] == []
+    assert no_updates == {'comments': [], 'cursor': 7, 'more': False}
+
+
+def test_get_updates_when_parameters_are_wrong():
+    """Testing get_updates method with broken cursor"""
+    api_client = APIClient('fake_engine')
+
+    test_result = api_client.get_updates('url_1', cursor='abc')
+
+    assert test_result == {'Response': 'Wrong command!'}
+
+
+@pytest.mark.usefixtures("database")
+def test_search_comments(database):
+    """Testing search_comments method pages found comments by cursor"""
+    api_client = APIClient(database)
+
+    first_page = api_client.search_comments('comment', url='url_1',
+                                            limit=3)
+    second_page = api_client.search_comments('comment', url='url_1',
+                                             limit=3,
+                                             cursor=first_page['cursor'])
+    user_result = api_client.search_comments('FIRST', user='user_2',
+                                             start=15)
+
+    # Comments with the same text are equally relevant and go by ID,
+    # longer comments are less relevant
+    assert [comment['comment_id'] for comment
+            in first_page['comments'].values()] == [1, 6, 2]
+    assert [comment['comment_id'] for comment
+            in second_page['comments'].values()] == [3, 5]
+    assert second_page['cursor'] is None
+    assert [comment['comment_id'] for comment
+            in user_result['comments'].values()] == [6]
+
+
+@pytest.mark.usefixtures("database")
+def test_search_comments_after_writes(database):
+    """Testing next page starts after the last comment of previous page
+    when comments added between pages change relevance"""
+    api_client = APIClient(database)
+
+    first_page = api_client.search_comments('first', limit=2)
+    api_client._db_client.add_comments_bulk(
+        [{'url': 'url_2', 'user': 'user_1', 'comment': f'first reply {number}'}
+         for number in range(6)])
+    second_page = api_client.search_comments('first', limit=2,
+                                             cursor=first_page['cursor'])
+
+    assert [comment['comment_id'] for comment
+            in first_page['comments'].values()] == [1, 4]
+    assert first_page['cursor'] == '4'
+    assert [comment['comment_id'] for comment
+            in second_page['comments'].values()] == [6, 7]
+
+
+@pytest.mark.parametrize('text, limit, cursor',
+                         [('  ', None, None), ('a', 0, None),
+                          ('a', None, 'abc')])
+def test_search_comments_when_parameters_are_wrong(text, limit, cursor):
+    """Testing search_comments method with wrong parameters"""
+    api_client = APIClient('fake_engine')
+
+    test_result = api_client.search_comments(text, limit=limit,
+                                             cursor=cursor)
+
+    assert test_result == {'Response': 'Wrong command!'}
+
+
+def test_get_table_data():
+    """Testing get_table_data method returns rows and next page cursor"""
+    api_client = APIClient('fake_engine')
+    api_client._db_client = FakeDBClient('Fake_engine')
+    correct_result = {'rows': [{'id': 3}, {'id': 4}], 'next': 4}
+
+    test_result = api_client.get_table_data('comments', limit=2, after=2)
+
+    assert test_result == correct_result
+
+
+@pytest.mark.parametrize('table, limit', [('child_counters', None),
+                                          ('comments', 0),
+                                          ('comments', -1),
+                                          ('comments', 'abc')])
+def test_get_table_data_when_parameters_are_wrong(table, limit):
+    """Testing get_table_data method with unknown table or wrong limit"""
+    api_client = APIClient('fake_engine')
+    api_client._db_client = FakeDBClient('Fake_engine')
+    correct_result = {'Response': 'Wrong command!'}
+
+    test_result = api_client.get_table_data(table, limit=limit)
+
+    assert test_result == correct_result
+
+
+@pytest.mark.usefixtures("database")
+def test_get_report_csv(database, tmp_path):
+    """Testing get_report method writes url comments to .csv file"""
+    api_client = APIClient(database)
+    api_client._report_dir = str(tmp_path)
+    correct_ids = ['1', '2', '5', '3', '6']
+
+    report_path = api_client.get_report(url='url_1')
+
+    with open(report_path, newline='') as fi:
+        rows = list(csv.reader(fi))
+    assert report_path.endswith('.csv')
+    assert rows[0] == ['comment_id', 'user', 'comment', 'date']
+    assert [row[0] for row in rows[1:]] == correct_ids
+
+
+@pytest.mark.usefixtures("database")
+def test_get_report_ndjson_compressed(database, tmp_path):
+    """Testing get_report method writes user comments to gzipped .ndjson"""
+    api_client = APIClient(database)
+    api_client._report_dir = str(tmp_path)
+    correct_ids = [1, 2]
+
+    report_path = api_client.get_report(user='user_1',
+                                        report_format='ndjson',
+                                        compress=True)
+    other_path = api_client.get_report(user='user_1',
+                                       report_format='ndjson',
+                                       compress=True)
+
+    with gzip.open(report_path, 'rt') as fi:
+        rows = [json.loads(line) for line in fi]
+    assert report_path != other_path
+    assert report_path.endswith('.ndjson.gz')
+    assert [row['comment_id'] for row in rows] == correct_ids
+
+
+def test_get_report_when_format_is_wrong():
+    """Testing get_report method with unknown report format"""
+    api_client = APIClient('fake_engine')
+    correct_result = {'Response': 'Wrong command!'}
+
+    test_result = api_client.get_report(url='url_1', report_format='xml')
+
     assert test_result == correct_result
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from flask import Flask
+
+from app import App, register_routes
+from db_backend.metrics import Metrics
+
+
+@pytest.fixture
+def client(database):
+    """Create Flask test client working with fake database"""
+    flask_app = Flask(__name__)
+    register_routes(flask_app, App(database))
+    return flask_app.test_client()
+
+
+@pytest.mark.usefixtures("client")
+def test_api_command(client):
+    """Testing command result is returned as JSON"""
+    request = {'command': 'add_comment', 'parent_id': 1, 'url': 'url_1',
+               'user': 'user_1', 'comment': 'new'}
+
+    response = client.post('/api/command', data=json.dumps(request))
+
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == 7
+
+
+@pytest.mark.usefixtures("client")
+def test_api_url_tree(client):
+    """Testing URL tree route returns requested comments"""
+    tree = client.get('/api/url/url_1/tree').get_json()
+    subtree = client.get('/api/url/url_1/tree?comment_id=1').get_json()
+    first_level = client.get('/api/url/url_1/tree?first_level=1').get_json()
+
+    assert tree['1']['comments'] == subtree
+    assert list(first_level) == ['1', '2']
+    assert first_level['1']['comments'] == {}
+
+
+@pytest.mark.usefixtures("client")
+def test_debug_view_is_optional(client):
+    """Testing HTML page is not served by default"""
+    assert client.get('/').status_code == 404
+
+
+@pytest.mark.usefixtures("database")
+def test_metrics_page(database):
+    """Testing metrics route is served only when metrics are enabled"""
+    flask_app = Flask(__name__)
+    register_routes(flask_app, App(database, metrics=Metrics()))
+    client = flask_app.test_client()
+    other_app = Flask(__name__)
+    register_routes(other_app, App(database))
+
+    client.get('/api/url/url_1/tree')
+    response = client.get('/metrics')
+
+    assert response.mimetype == 'text/plain'
+    assert ('comments_request_duration_seconds_count'
+            '{command="get_comment_tree"} 1') in response.get_data(True)
+    assert other_app.test_client().get('/metrics').status_code == 404
+
+
+@pytest.mark.usefixtures("client")
+def test_api_url_events(client):
+    """Testing events route streams missed and added comments"""
+    request = {'command': 'add_comment', 'parent_id': 1, 'url': 'url_1',
+               'user': 'user_1', 'comment': 'new'}
+
+    response = client.get('/api/url/url_1/events',
+                          headers={'Last-Event-ID': '5'})
+    stream = iter(response.response)
+    missed = next(stream)
+    client.post('/api/command', data=json.dumps(request))
+    added = next(stream)
+    response.close()
+
+    assert response.mimetype == 'text/event-stream'
+    assert missed.startswith(b'id: 6\nevent: comment\n')
+    assert added.startswith(b'id: 7\nevent: comment\n')
+    assert client.get('/api/url/url_5/events').status_code == 404
+
+
+@pytest.mark.usefixtures("database")
+def test_api_url_events_replay_is_not_repeated(database):
+    """Testing comment added while missed comments are replayed is sent
+    once and replay is sent page after page"""
+    flask_app = Flask(__name__)
+    application = App(database)
+    application.api_client._max_page_size = 1
+    register_routes(flask_app, application)
+    client = flask_app.test_client()
+    request = {'command': 'add_comment', 'parent_id': 1, 'url': 'url_1',
+               'user': 'user_1', 'comment': 'new'}
+
+    response = client.get('/api/url/url_1/events',
+                          headers={'Last-Event-ID': '3'})
+    stream = iter(response.response)
+    client.post('/api/command', data=json.dumps(request))
+    missed = [next(stream) for _ in range(3)]
+    client.post('/api/command', data=json.dumps(request))
+    added = next(stream)
+    response.close()
+
+    assert [chunk.split(b'\n')[0] for chunk in missed] == [
+        b'id: 5', b'id: 6', b'id: 7']
+    assert added.startswith(b'id: 8\nevent: comment\n')
+    assert added.count(b'id: ') == 1
+    assert application.api_client.events.subscribers_count() == 0
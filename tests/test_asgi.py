@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from asgi import ASGIApp
+from db_backend.cache import SQLiteCacheBackend
+from db_backend.serializer import dumps
+
+
+def call(application, method, path, body=b'', query_string=b''):
+    """Process one HTTP request by ASGI application"""
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'query_string': query_string, 'headers': []}
+    messages = [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return (sent[0]['status'],
+            b''.join(message.get('body', b'') for message in sent[1:]))
+
+
+@pytest.mark.usefixtures("async_database")
+def test_responses_are_serialized_like_api_client(async_database):
+    """Testing responses are serialized by the same serializer as
+    responses of API client"""
+    application = ASGIApp(async_database)
+
+    status, body = call(application, 'GET', '/tables/comments',
+                        query_string=b'limit=2')
+    wrong_status, wrong_body = call(application, 'GET', '/tables/comments',
+                                    query_string=b'limit=a')
+
+    assert status == 200
+    assert body.decode() == dumps(json.loads(body))
+    assert json.loads(body)['next'] == 2
+    assert wrong_status == 400
+    assert wrong_body.decode() == dumps({'Response': 'Wrong command!'})
+
+
+@pytest.mark.usefixtures("async_database")
+def test_client_options_are_used(async_database, tmp_path):
+    """Testing cache backend, slow query log and storage are passed to
+    API client"""
+    cache_backend = SQLiteCacheBackend(str(tmp_path / 'cache.db'))
+    application = ASGIApp(async_database, cache_backend,
+                          slow_query_threshold=0, storage='closure')
+    request = {'command': 'get_comment_tree', 'url': 'url_1'}
+
+    status, body = call(application, 'POST', '/',
+                        body=json.dumps(request).encode())
+
+    assert status == 200
+    assert json.loads(body)
+    assert application.api_client.cache_info()['size'] == 1
+    assert application.api_client._db_client.slow_query_log is not None
+    assert application.api_client._db_client._db_client._storage == 'closure'
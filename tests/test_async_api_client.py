@@ -0,0 +1,183 @@
+import asyncio
+import csv
+import json
+import threading
+
+import pytest
+
+from db_backend import async_api_client
+from db_backend.api_client import APIClient
+from db_backend.async_api_client import AsyncAPIClient
+from db_backend.cache import SQLiteCacheBackend
+from db_backend.metrics import Metrics
+
+
+@pytest.mark.usefixtures("async_database", "database")
+def test_process_request(async_database, database):
+    """Testing process_request coroutine responds like APIClient"""
+    requests = ['{"command": "get_comment_tree", "url": "url_1"}',
+                '{"command": "get_comment_tree", "url": "url_1", '
+                '"comment_id": 1}',
+                '{"command": "ger_url_first_level_comments", "url": "url_1"}',
+                '{"command": "get_user_history", "user": "user_2"}',
+                '{"command": "get_comment_context", "comment_id": 5, '
+                '"siblings": 1}',
+                '{"command": "get_updates", "url": "url_1", "cursor": 2, '
+                '"limit": 2}',
+                '{"command": "search_comments", "text": "comment", '
+                '"url": "url_1", "limit": 2}',
+                '{"command": "get_table_data"}']
+    api_client = AsyncAPIClient(async_database)
+    sync_api_client = APIClient(database)
+
+    async def process():
+        return await asyncio.gather(*(api_client.process_request(request)
+                                      for request in requests))
+
+    test_result = asyncio.run(process())
+
+    assert test_result == [sync_api_client.process_request(request)
+                           for request in requests]
+
+
+@pytest.mark.usefixtures("async_database")
+def test_process_request_invalidates_cache(async_database):
+    """Testing comment added by coroutine is seen in cached tree"""
+    request = '{"command": "get_comment_tree", "url": "url_2"}'
+    add_request = ('{"command": "add_comment", "parent_id": 4, '
+                   '"url": "url_2", "user": "user_1", "comment": "new"}')
+    api_client = AsyncAPIClient(async_database)
+
+    async def process():
+        first_result = await api_client.process_request(request)
+        await api_client.process_request(add_request)
+        return first_result, await api_client.process_request(request)
+
+    first_result, second_result = asyncio.run(process())
+
+    assert json.loads(first_result)['1']['comments'] == {}
+    assert json.loads(second_result)['1']['comments']['1']['comment'] == 'new'
+
+
+@pytest.mark.usefixtures("async_database")
+def test_process_request_sqlite_cache(async_database, tmp_path):
+    """Testing blocking cache backend is called out of event loop thread
+    and comment added by coroutine is seen in cached tree"""
+    request = '{"command": "get_comment_tree", "url": "url_2"}'
+    add_request = ('{"command": "add_comment", "parent_id": 4, '
+                   '"url": "url_2", "user": "user_1", "comment": "new"}')
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.db'))
+    threads = []
+    for name in ('get', 'set', 'get_versions', 'incr_versions'):
+        method = getattr(backend, name)
+
+        def record(*args, method=method):
+            threads.append(threading.current_thread())
+            return method(*args)
+
+        setattr(backend, name, record)
+    api_client = AsyncAPIClient(async_database, backend)
+
+    async def process():
+        first_result = await api_client.process_request(request)
+        await api_client.process_request(add_request)
+        return first_result, await api_client.process_request(request)
+
+    first_result, second_result = asyncio.run(process())
+
+    assert json.loads(first_result)['1']['comments'] == {}
+    assert json.loads(second_result)['1']['comments']['1']['comment'] == 'new'
+    assert threading.main_thread() not in threads
+    assert len(threads) == 7
+
+
+@pytest.mark.usefixtures("async_database", "database")
+def test_process_request_large_response(async_database, database,
+                                        monkeypatch):
+    """Testing response built from many rows is built out of event loop
+    thread"""
+    request = '{"command": "get_comment_tree", "url": "url_1"}'
+    monkeypatch.setattr(async_api_client, '_OFFLOAD_ROWS', 0)
+    api_client = AsyncAPIClient(async_database)
+    create_sorted_dict = api_client._pworker.create_sorted_dict
+    threads = []
+
+    def record(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return create_sorted_dict(*args, **kwargs)
+
+    api_client._pworker.create_sorted_dict = record
+
+    test_result = asyncio.run(api_client.process_request(request))
+
+    assert test_result == APIClient(database).process_request(request)
+    assert threads and threading.main_thread() not in threads
+
+
+@pytest.mark.usefixtures("async_database")
+def test_get_report(async_database, tmp_path):
+    """Testing get_report coroutine writes url comments to .csv file"""
+    api_client = AsyncAPIClient(async_database)
+    api_client._report_dir = str(tmp_path)
+    correct_ids = ['1', '2', '5', '3', '6']
+
+    report_path = asyncio.run(api_client.get_report(url='url_1'))
+
+    with open(report_path, newline='') as fi:
+        rows = list(csv.reader(fi))
+    assert rows[0] == ['comment_id', 'user', 'comment', 'date']
+    assert [row[0] for row in rows[1:]] == correct_ids
+
+
+@pytest.mark.usefixtures("async_database")
+def test_process_request_batch(async_database):
+    """Testing array of commands is processed in order"""
+    requests = [{'command': 'get_comment_tree', 'url': 'url_1'},
+                {'command': 'get_comment_tree', 'url': 'url_1'},
+                {'command': 'add_comment', 'parent_id': None, 'url': 'url_1',
+                 'user': 'user_1', 'comment': 'new'},
+                {'command': 'ger_url_first_level_comments', 'url': 'url_1'}]
+    api_client = AsyncAPIClient(async_database)
+
+    test_result = json.loads(asyncio.run(
+        api_client.process_request(json.dumps(requests))))
+
+    assert test_result[0] == test_result[1]
+    assert test_result[2] == 7
+    assert len(test_result[3]) == 3
+
+
+@pytest.mark.usefixtures("async_database")
+def test_process_request_metrics(async_database):
+    """Testing metrics of concurrent commands are collected separately"""
+    metrics = Metrics()
+    api_client = AsyncAPIClient(async_database, metrics=metrics)
+    requests = ['{"command": "get_comment_tree", "url": "url_1"}',
+                '{"command": "get_user_history", "user": "user_2"}']
+
+    async def process():
+        return await asyncio.gather(*(api_client.process_request(request)
+                                      for request in requests))
+
+    asyncio.run(process())
+    summary = metrics.summary()
+
+    assert summary['rows'] == {'get_comment_tree': (5, 1),
+                               'get_user_history': (4, 1)}
+    assert summary['statements']['get_comment_tree'][0] > 0
+    assert summary['statements']['get_user_history'][0] > 0
+
+
+@pytest.mark.usefixtures("async_database")
+def test_get_table_data_when_limit_is_wrong(async_database):
+    """Testing get_table_data coroutine rejects not positive limit"""
+    api_client = AsyncAPIClient(async_database)
+
+    async def get_pages():
+        return [await api_client.get_table_data('comments', limit=limit)
+                for limit in (-1, 0, 2)]
+
+    negative, zero, page = asyncio.run(get_pages())
+
+    assert negative == zero == {'Response': 'Wrong command!'}
+    assert len(page['rows']) == 2 and page['next'] == 2
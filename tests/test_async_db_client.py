@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db_backend.async_db_client import AsyncDBClient
+
+
+def run(coroutine):
+    """Run coroutine in new event loop"""
+    return asyncio.run(coroutine)
+
+
+@pytest.mark.usefixtures("async_database")
+def test_get_url_inheritors(async_database):
+    """Testing get_url_inheritors coroutine works like DBClient method"""
+    db_client = AsyncDBClient(async_database)
+    correct_result = [1, 2, 5, 3, 6]
+
+    test_result = run(db_client.get_url_inheritors('url_1', False))
+
+    assert [comment[1] for comment in test_result] == correct_result
+
+
+@pytest.mark.usefixtures("async_database")
+def test_get_comment_inheritors_when_comment_is_not_exists(async_database):
+    """Testing coroutines return message when there are no results"""
+    db_client = AsyncDBClient(async_database)
+    correct_result = {'Response': 'No results'}
+
+    test_result = run(db_client.get_comment_inheritors(100))
+
+    assert test_result == correct_result
+
+
+@pytest.mark.usefixtures("async_database")
+def test_add_comment(async_database):
+    """Testing add_comment coroutine commits comment and notifies"""
+    db_client = AsyncDBClient(async_database)
+    written = []
+    db_client.subscribe(written.extend)
+
+    async def add_and_read():
+        comment_id = await db_client.add_comment(1, 'url_1', 'user_3',
+                                                 'dummy_comment')
+        tree = await db_client.get_comment_inheritors(1)
+        return comment_id, tree
+
+    comment_id, tree = run(add_and_read())
+
+    assert comment_id == 7
+    assert [comment[1] for comment in tree] == [2, 5, 3, 7]
+    assert [comment['id'] for comment in written] == [7]
+
+
+@pytest.mark.usefixtures("async_database")
+def test_iter_report_rows(async_database):
+    """Testing iter_report_rows streams user comments"""
+    db_client = AsyncDBClient(async_database)
+
+    async def collect(user):
+        return [row[1] async for row in
+                db_client.iter_report_rows(user=user, batch_size=1)]
+
+    assert sorted(run(collect('user_1'))) == [1, 2]
+    assert run(collect('user_5')) == []
+
+
+@pytest.mark.usefixtures("async_database", "replicas")
+def test_read_your_writes(async_database, replicas):
+    """Testing task reads replicas until it writes data, then its reads
+    are sent to writing engine"""
+    read_engines = [create_async_engine(
+        replica.url.set(drivername='sqlite+aiosqlite'))
+        for replica in replicas]
+    db_client = AsyncDBClient(async_database, read_engines=read_engines,
+                              read_your_writes=60)
+
+    async def write_and_read():
+        before = await db_client.get_url_inheritors('url_1', True)
+        await db_client.add_comment(None, 'url_1', 'user_1', 'new')
+        after = await db_client.get_url_inheritors('url_1', True)
+        return before, after
+
+    before, after = run(write_and_read())
+
+    assert len(before) == 2
+    assert len(after) == 3
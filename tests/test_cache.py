@@ -0,0 +1,140 @@
+import pytest
+
+from db_backend.cache import (CacheBackend, LRUCache, MemoryCacheBackend,
+                              ResultCache, SQLiteCacheBackend)
+
+
+def test_lru_cache_get_and_set():
+    """Testing LRUCache returns stored values and counts hits and misses"""
+    cache = LRUCache(maxsize=2)
+    correct_info = {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2}
+
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.info() == correct_info
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Testing LRUCache evicts least recently used item when it is full"""
+    cache = LRUCache(maxsize=2)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_pop():
+    """Testing LRUCache removes items"""
+    cache = LRUCache()
+
+    cache.set('a', 1)
+
+    assert cache.pop('a') == 1
+    assert cache.pop('a') is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_ttl():
+    """Testing LRUCache drops expired items and reports them evicted"""
+    evicted = []
+    cache = LRUCache(ttl=-1, on_evict=evicted.append)
+
+    cache.set('a', 1)
+
+    assert cache.get('a') is None
+    assert evicted == ['a']
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    """Cache backends to test"""
+    if request.param == 'memory':
+        return MemoryCacheBackend(maxsize=2)
+    return SQLiteCacheBackend(str(tmp_path / 'cache.db'), maxsize=2)
+
+
+def test_cache_backend(backend):
+    """Testing cache backends store responses and versions"""
+    backend.set('a', 'response_a')
+    backend.set('b', 'response_b')
+    backend.set('c', 'response_c')
+    versions = backend.get_versions(['x', 'y', 'z'])
+    backend.incr_versions(['x', 'y'])
+    backend.incr_versions(['x'])
+    new_versions = backend.get_versions(['x', 'y', 'z'])
+
+    assert backend.get('a') is None
+    assert backend.get('c') == 'response_c'
+    assert len(set(versions + new_versions)) == 5
+    assert new_versions[0] > new_versions[1] > versions[0]
+    assert new_versions[2] == versions[2]
+    assert backend.info()['size'] == 2
+
+
+def test_cache_backend_evicts_versions(backend):
+    """Testing cache backends keep limited count of versions and evicted
+    version never gets value it had before"""
+    versions = backend.get_versions(['x', 'y'])
+    backend.incr_versions([f'name_{number}' for number in range(10)])
+    new_versions = backend.get_versions(['x', 'y'])
+
+    assert not set(versions) & set(new_versions)
+    assert backend.info()['versions'] == 8
+
+
+def test_cache_backend_is_abstract():
+    """Testing cache backend interface can not be used as backend"""
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_sqlite_cache_backend_is_shared(tmp_path):
+    """Testing SQLite backend data is seen by other backend instances"""
+    path = str(tmp_path / 'cache.db')
+    first_backend = SQLiteCacheBackend(path)
+    second_backend = SQLiteCacheBackend(path)
+
+    first_backend.set('a', 'response_a')
+    first_backend.incr_versions(['x'])
+
+    assert second_backend.get('a') == 'response_a'
+    assert second_backend.get_versions(['x']) == first_backend.get_versions(
+        ['x'])
+
+
+def test_result_cache_invalidate(backend):
+    """Testing ResultCache changes keys only of changed tree parts"""
+    cache = ResultCache(backend)
+    scopes = [{'url_id': 1},
+              {'url_id': 1, 'first_level': True},
+              {'url_id': 1, 'path': '11'},
+              {'url_id': 1, 'path': '12'},
+              {'url_id': 2}]
+    keys = [cache.versioned_key('key', **scope) for scope in scopes]
+
+    cache.invalidate([{'url_id': 1, 'path': '11.11'}])
+    new_keys = [cache.versioned_key('key', **scope) for scope in scopes]
+
+    assert [key == new_key for key, new_key in zip(keys, new_keys)] == [
+        False, False, False, True, True]
+
+
+def test_result_cache_get_and_set(backend):
+    """Testing ResultCache does not return response built before write"""
+    cache = ResultCache(backend)
+    key = cache.versioned_key('key', url_id=1, first_level=True)
+
+    cache.set(key, 'roots')
+    cached_response = cache.get(key)
+    cache.invalidate([{'url_id': 1, 'path': '13'}])
+
+    assert cached_response == 'roots'
+    assert cache.get(cache.versioned_key('key', url_id=1,
+                                         first_level=True)) is None
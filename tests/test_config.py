@@ -0,0 +1,48 @@
+import pytest
+
+from db_backend.cache import SQLiteCacheBackend
+from db_backend.config import client_options
+from db_backend.metrics import Metrics
+
+
+def fake_engine(url=None, read_only=False):
+    """Create description of engine instead of engine"""
+    return url, read_only
+
+
+def test_client_options(monkeypatch, tmp_path):
+    """Testing API client parameters are read from environment"""
+    monkeypatch.setenv('REPLICA_URLS', 'sqlite:///a.db,sqlite:///b.db')
+    monkeypatch.setenv('READ_YOUR_WRITES', '2')
+    monkeypatch.setenv('METRICS', '1')
+    monkeypatch.setenv('SLOW_QUERY_MS', '50')
+    monkeypatch.setenv('CACHE_PATH', str(tmp_path / 'cache.db'))
+    monkeypatch.setenv('COMMENTS_STORAGE', 'closure')
+
+    test_result = client_options(fake_engine)
+
+    assert test_result['engine'] == (None, False)
+    assert test_result['read_engines'] == [('sqlite:///a.db', True),
+                                           ('sqlite:///b.db', True)]
+    assert test_result['read_your_writes'] == 2.0
+    assert isinstance(test_result['metrics'], Metrics)
+    assert test_result['slow_query_threshold'] == pytest.approx(0.05)
+    assert isinstance(test_result['cache_backend'], SQLiteCacheBackend)
+    assert test_result['storage'] == 'closure'
+
+
+def test_client_options_defaults(monkeypatch):
+    """Testing reads go to read-only pool of main database by default"""
+    for name in ('REPLICA_URLS', 'READ_YOUR_WRITES', 'METRICS',
+                 'SLOW_QUERY_MS', 'CACHE_PATH', 'COMMENTS_STORAGE'):
+        monkeypatch.delenv(name, raising=False)
+
+    test_result = client_options(fake_engine)
+
+    assert test_result == {'engine': (None, False),
+                           'cache_backend': None,
+                           'read_engines': [(None, True)],
+                           'read_your_writes': 5.0,
+                           'metrics': None,
+                           'slow_query_threshold': None,
+                           'storage': 'path'}
@@ -1,8 +1,11 @@
+import contextvars
+
 import pytest
 from sqlalchemy.orm import Session
 
 from db_backend.db_client import DBClient
-from db_backend.db_table import CommentsDB, UserDB
+from db_backend.db_table import CommentClosureDB, CommentsDB, UserDB
+from db_backend.path_worker import PathWorker
 
 
 @pytest.mark.usefixtures("database")
@@ -33,15 +36,32 @@ def test_get_id_when_id_is_not_exists(database):
     assert test_id == correct_id
 
 
+@pytest.mark.usefixtures("database")
+def test_get_id_uses_cache(database):
+    """Testing get_id method takes IDs of existing elements from cache"""
+    request_data = {'user': 'user_2'}
+    table = UserDB
+    db_client = DBClient(database)
+    correct_info = {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 10000}
+
+    with Session(database) as session:
+        first_id = db_client._get_id(session, table, **request_data)
+        second_id = db_client._get_id(session, table, **request_data)
+
+    assert first_id == second_id == 2
+    assert db_client.id_cache_info() == correct_info
+
+
 @pytest.mark.usefixtures("database")
 def test_create_child_path_when_it_is_first_child(database):
     """Testing child path creation when new comment is first inheritor"""
-    parent_path = '1.2'
+    parent_id = 3
     db_client = DBClient(database)
-    correct_path = '1.2.1'
+    correct_path = PathWorker.encode('1.2.1')
 
     with Session(database) as session:
-        test_path = db_client._create_child_path(session, parent_path)
+        parent = db_client._select(session, CommentsDB, id=parent_id).one()
+        test_path = db_client._create_child_path(session, parent)
 
     assert test_path == correct_path
 
@@ -49,29 +69,29 @@ def test_create_child_path_when_it_is_first_child(database):
 @pytest.mark.usefixtures("database")
 def test_create_child_path(database):
     """Testing child path creation when inheritors are already exists"""
-    parent_path = '1.1'
+    parent_id = 2
     db_client = DBClient(database)
-    correct_path = '1.1.2'
+    correct_path = PathWorker.encode('1.1.2')
 
     with Session(database) as session:
-        test_path = db_client._create_child_path(session, parent_path)
+        parent = db_client._select(session, CommentsDB, id=parent_id).one()
+        test_path = db_client._create_child_path(session, parent)
+        previous_comment = db_client._select(session, CommentsDB,
+                                             id=5).one()
 
     assert test_path == correct_path
+    assert not previous_comment.last
 
 
 @pytest.mark.usefixtures("database")
 def test_create_first_level_path_when_comment_is_first(database):
-    """Testing first level path creation when it is first comment"""
-
-    def fake_check_query(*args):
-        return
-
+    """Testing first level path creation when it is first URL comment"""
+    url_id = 3
     db_client = DBClient(database)
-    db_client._qhelper.check_query = fake_check_query
-    correct_path = '1'
+    correct_path = PathWorker.encode('1')
 
     with Session(database) as session:
-        test_path = db_client._create_first_level_path(session)
+        test_path = db_client._create_first_level_path(session, url_id)
 
     assert test_path == correct_path
 
@@ -79,28 +99,56 @@ def test_create_first_level_path_when_comment_is_first(database):
 @pytest.mark.usefixtures("database")
 def test_create_first_level_path_when_comments_are_exist(database):
     """Testing first level path creation when comments are already exist"""
+    url_id = 1
     db_client = DBClient(database)
-    correct_path = '4'
+    correct_path = PathWorker.encode('4')
 
     with Session(database) as session:
-        test_path = db_client._create_first_level_path(session)
+        test_path = db_client._create_first_level_path(session, url_id)
 
     assert test_path == correct_path
 
 
+@pytest.mark.usefixtures("database")
+def test_next_child_number_is_incremented(database):
+    """Testing child numbers are allocated one after another"""
+    db_client = DBClient(database)
+    correct_numbers = [3, 4, 3, 1]
+
+    with Session(database) as session:
+        test_numbers = [db_client._next_child_number(session, 2),
+                        db_client._next_child_number(session, 2),
+                        db_client._next_child_number(session, 1, 1),
+                        db_client._next_child_number(session, 1, 4)]
+
+    assert test_numbers == correct_numbers
+
+
 @pytest.mark.usefixtures("database")
 def test_get_table_data(database):
     """Testing get_table_data method works correctly"""
     table = 'urls'
     db_client = DBClient(database)
-    correct_result = [{'id': '1', 'url': 'url_1'},
-                      {'id': '2', 'url': 'url_2'}]
+    correct_result = [{'id': 1, 'url': 'url_1'},
+                      {'id': 2, 'url': 'url_2'}]
 
     test_result = db_client.get_table_data(table)
 
     assert test_result == correct_result
 
 
+@pytest.mark.usefixtures("database")
+def test_get_table_data_page(database):
+    """Testing get_table_data method returns page after specified row"""
+    table = 'comments'
+    db_client = DBClient(database)
+    correct_ids = [3, 4]
+
+    test_result = db_client.get_table_data(table, limit=2, after=2)
+
+    assert [row['id'] for row in test_result] == correct_ids
+
+
 @pytest.mark.usefixtures("database")
 def test_add_comment(database):
     """Testing add_comment method works correctly"""
@@ -118,3 +166,392 @@ def test_add_comment(database):
 
     assert test_result == correct_result
     assert not previous_comment.last
+
+
+@pytest.mark.usefixtures("database")
+def test_subscribe(database):
+    """Testing listeners get comments written to database"""
+    comments = [{'url': 'url_3', 'user': 'user_3', 'comment': 'a',
+                 'key': 'first'},
+                {'parent_key': 'first', 'user': 'user_1', 'comment': 'b'}]
+    db_client = DBClient(database)
+    written = []
+    db_client.subscribe(written.extend)
+
+    db_client.add_comment(1, 'url_1', 'user_3', 'dummy_comment')
+    db_client.add_comments_bulk(comments)
+
+    assert [comment['id'] for comment in written] == [7, 8, 9]
+    assert [comment['url_id'] for comment in written] == [1, 3, 3]
+    assert written[2]['parent_id'] == 8
+
+
+@pytest.mark.usefixtures("database_file")
+def test_snapshot(database_file):
+    """Testing methods called in snapshot do not see later writes"""
+    # Readers do not block writers only in write-ahead log mode
+    with database_file.connect() as connection:
+        connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+    db_client = DBClient(database_file)
+    other_client = DBClient(database_file)
+
+    with db_client.snapshot():
+        before = db_client.get_url_inheritors('url_1')
+        other_client.add_comment(None, 'url_1', 'user_1', 'new comment')
+        after = db_client.get_url_inheritors('url_1')
+    fresh = db_client.get_url_inheritors('url_1')
+
+    assert before == after
+    assert len(fresh) == len(before) + 1
+
+
+@pytest.mark.usefixtures("database_file", "replicas")
+def test_read_engines(database_file, replicas):
+    """Testing reads are sent to replicas in turn and writes are sent
+    to writing engine"""
+    db_client = DBClient(database_file, read_engines=replicas)
+    engines = []
+
+    for _ in range(3):
+        with db_client.snapshot() as session:
+            engines.append(session.get_bind())
+    db_client.add_comment(None, 'url_1', 'user_1', 'new')
+    test_result = db_client.get_url_inheritors('url_1', first_level=True)
+
+    assert engines == [replicas[0], replicas[1], replicas[0]]
+    assert len(test_result) == 2
+    with Session(database_file) as session:
+        assert session.query(CommentsDB).count() == 7
+
+
+@pytest.mark.usefixtures("database_file", "replicas")
+def test_read_your_writes(database_file, replicas):
+    """Testing reads following write in the same context are sent to
+    writing engine, other contexts still read replicas"""
+    db_client = DBClient(database_file, read_engines=replicas,
+                         read_your_writes=60)
+
+    def read():
+        return db_client.get_url_inheritors('url_1', first_level=True)
+
+    def write_and_read():
+        db_client.add_comment(None, 'url_1', 'user_1', 'new')
+        return read()
+
+    test_result = contextvars.copy_context().run(write_and_read)
+    other_result = contextvars.copy_context().run(read)
+
+    assert len(test_result) == 3
+    assert len(other_result) == 2
+
+
+@pytest.mark.usefixtures("database")
+def test_get_tree_page_by_depth(database):
+    """Testing get_tree_page method limits tree depth"""
+    db_client = DBClient(database)
+
+    test_result = db_client.get_tree_page('url_1', max_depth=1)
+
+    assert [(row[1], row[-1]) for row in test_result['rows']] == [(1, ''),
+                                                                  (6, None)]
+    assert test_result['more'] is None
+
+
+@pytest.mark.usefixtures("database")
+def test_get_tree_page_by_levels(database):
+    """Testing get_tree_page method limits count of comments per parent"""
+    db_client = DBClient(database)
+    encode = PathWorker.encode
+
+    test_result = db_client.get_tree_page('url_1', limit_per_level=1)
+    next_result = db_client.get_tree_page(comment_id=1, limit_per_level=1,
+                                          after=encode('1.1'))
+
+    assert [(row[1], row[-1]) for row in test_result['rows']] == [
+        (1, encode('1.1')), (2, None), (5, None)]
+    assert test_result['more'] == encode('1')
+    assert [row[1] for row in next_result['rows']] == [3]
+    assert next_result['depth'] == 1 and next_result['more'] is None
+
+
+@pytest.mark.usefixtures("database")
+def test_get_tree_page_by_levels_in_parts(database, monkeypatch):
+    """Testing parents of level are split between several statements"""
+    db_client = DBClient(database)
+    db_client.add_comments_bulk(
+        [{'parent_id': parent_id, 'url': 'url_1', 'user': 'user_1',
+          'comment': str(number)}
+         for parent_id in (1, 3, 6) for number in range(3)])
+    correct_result = db_client.get_tree_page('url_1', limit_per_level=2)
+
+    monkeypatch.setattr('db_backend.db_client._PAGE_PARENTS', 1)
+    test_result = db_client.get_tree_page('url_1', limit_per_level=2)
+
+    assert test_result == correct_result
+    assert [row[1] for row in test_result['rows']
+            if row[-1] is not None] == [1, 3, 6]
+
+
+@pytest.mark.usefixtures("database")
+def test_get_comment_scope(database):
+    """Testing get_url_id and get_comment_scope methods work correctly"""
+    db_client = DBClient(database)
+
+    assert db_client.get_url_id('url_2') == 2
+    assert db_client.get_url_id('url_5') is None
+    assert db_client.get_comment_scope(2) == (1, PathWorker.encode('1.1'))
+    assert db_client.get_comment_scope(100) is None
+
+
+@pytest.mark.usefixtures("database")
+def test_add_comments_bulk(database):
+    """Testing add_comments_bulk method works correctly"""
+    comments = [{'url': 'url_3', 'user': 'user_3', 'comment': 'a',
+                 'key': 'first'},
+                {'parent_key': 'first', 'user': 'user_1', 'comment': 'b',
+                 'key': 'second'},
+                {'parent_key': 'second', 'user': 'user_3', 'comment': 'c'},
+                {'parent_id': 2, 'user': 'user_2', 'comment': 'd'},
+                {'parent_key': 'first', 'user': 'user_1', 'comment': 'e'}]
+    db_client = DBClient(database)
+    correct_ids = [7, 8, 9, 10, 11]
+    correct_paths = ['1', '1.1', '1.1.1', '1.1.2', '1.2']
+    correct_last = [True, False, True, True, True]
+
+    test_ids = db_client.add_comments_bulk(comments, chunk_size=2)
+
+    with Session(database) as session:
+        rows = [db_client._select(session, CommentsDB, id=comment_id).one()
+                for comment_id in test_ids]
+        previous_comment = db_client._select(session, CommentsDB,
+                                             id=5).one()
+
+    assert test_ids == correct_ids
+    assert [PathWorker.decode(row.path) for row in rows] == correct_paths
+    assert [row.last for row in rows] == correct_last
+    assert rows[3].parent_id == 2 and rows[3].depth == 3
+    assert not previous_comment.last
+
+
+@pytest.mark.usefixtures("database")
+def test_add_comments_bulk_when_parent_is_not_exists(database):
+    """Testing add_comments_bulk method when parent comment is unknown"""
+    comments = [{'parent_id': 100, 'user': 'user_1', 'comment': 'a'}]
+    db_client = DBClient(database)
+    correct_result = {'Response': 'Parent comment is not found',
+                      'comment_ids': []}
+
+    test_result = db_client.add_comments_bulk(comments)
+
+    assert test_result == correct_result
+
+
+@pytest.mark.usefixtures("database")
+def test_add_comments_bulk_reports_committed_chunks(database):
+    """Testing failed chunk does not hide comments of committed chunks"""
+    comments = [{'url': 'url_1', 'user': 'user_1', 'comment': 'a'},
+                {'url': 'url_1', 'user': 'user_1', 'comment': 'b'},
+                {'parent_id': 100, 'user': 'user_1', 'comment': 'c'}]
+    db_client = DBClient(database)
+
+    test_result = db_client.add_comments_bulk(comments, chunk_size=2)
+
+    assert test_result == {'Response': 'Parent comment is not found',
+                           'comment_ids': [7, 8]}
+    assert db_client.get_new_comments(after=8)['rows'] == []
+
+
+@pytest.mark.parametrize('comment, message',
+                         [('text', 'Comment 1 is not an object'),
+                          ({'user': 'user_1', 'comment': 'b'},
+                           'Comment 1 has no url'),
+                          ({'url': 'url_1', 'comment': 'b'},
+                           'Comment 1 has no user'),
+                          ({'parent_key': 'b', 'user': 'user_1',
+                            'comment': 'b'},
+                           'Parent of comment 1 does not go before it')])
+def test_check_bulk_comments(comment, message):
+    """Testing wrong comments data is found before it is written"""
+    comments = [{'url': 'url_1', 'user': 'user_1', 'comment': 'a',
+                 'key': 'a'}, comment]
+
+    with pytest.raises(ValueError, match=message):
+        DBClient.check_bulk_comments(comments)
+
+
+@pytest.mark.usefixtures("database")
+def test_closure_storage(database):
+    """Testing closure storage is maintained and gives the same trees"""
+    path_client = DBClient(database)
+    closure_client = DBClient(database, storage='closure')
+
+    assert closure_client.rebuild_closure() == 10
+    reply_id = closure_client.add_comment(5, None, 'user_1', 'reply')
+    bulk_ids = closure_client.add_comments_bulk(
+        [{'parent_id': reply_id, 'user': 'user_2', 'comment': 'a',
+          'key': 'a'},
+         {'parent_key': 'a', 'user': 'user_1', 'comment': 'b'}],
+        chunk_size=1)
+    with Session(database) as session:
+        ancestors = {comment_id: dict(
+            session.query(CommentClosureDB.ancestor, CommentClosureDB.depth)
+            .filter(CommentClosureDB.descendant == comment_id).all())
+            for comment_id in [reply_id, *bulk_ids]}
+
+    assert ancestors == {7: {7: 0, 5: 1, 2: 2, 1: 3},
+                         8: {8: 0, 7: 1, 5: 2, 2: 3, 1: 4},
+                         9: {9: 0, 8: 1, 7: 2, 5: 3, 2: 4, 1: 5}}
+    for comment_id in [1, 2, 7, 9]:
+        assert (closure_client.get_comment_inheritors(comment_id)
+                == path_client.get_comment_inheritors(comment_id))
+    for kwargs in [{}, {'max_depth': 2},
+                   {'after': PathWorker.encode('1.1')}]:
+        assert (closure_client.get_tree_page(comment_id=1, **kwargs)
+                == path_client.get_tree_page(comment_id=1, **kwargs))
+    for comment_id in [1, 5, 9]:
+        for siblings in [0, 1]:
+            assert (closure_client.get_comment_context(comment_id, siblings)
+                    == path_client.get_comment_context(comment_id, siblings))
+
+
+@pytest.mark.usefixtures("database")
+def test_closure_storage_reply_counters(database):
+    """Testing closure storage counts inheritors of every ancestor"""
+    closure_client = DBClient(database, storage='closure')
+
+    closure_client.rebuild_closure()
+    reply_id = closure_client.add_comment(5, None, 'user_1', 'reply')
+    closure_client.add_comments_bulk(
+        [{'parent_id': reply_id, 'user': 'user_2', 'comment': 'a',
+          'key': 'a', 'date': 500.0},
+         {'parent_key': 'a', 'user': 'user_1', 'comment': 'b',
+          'date': 400.0},
+         {'parent_id': 2, 'user': 'user_1', 'comment': 'c', 'date': 300.0}])
+    with Session(database) as session:
+        counters = dict(session.query(CommentsDB.id, CommentsDB.reply_count)
+                        .filter(CommentsDB.url_id == 1))
+        activity = session.get(CommentsDB, 7).last_activity
+
+    assert counters == {1: 7, 2: 5, 3: 0, 5: 3, 6: 0, 7: 2, 8: 1, 9: 0,
+                        10: 0}
+    assert activity == 500.0
+
+
+@pytest.mark.usefixtures("database")
+def test_path_storage_maintains_filled_closure(database):
+    """Testing path storage writes comments to closure table only when
+    it is filled, so closure storage sharing database is not stale"""
+    path_client = DBClient(database)
+    closure_client = DBClient(database, storage='closure')
+
+    path_client.add_comment(5, None, 'user_1', 'before')
+    with Session(database) as session:
+        closure_rows = session.query(CommentClosureDB).count()
+    closure_client.rebuild_closure()
+    reply_id = path_client.add_comment(5, None, 'user_1', 'reply')
+    path_client.add_comments_bulk(
+        [{'parent_id': reply_id, 'user': 'user_2', 'comment': 'a'}])
+
+    assert closure_rows == 0
+    assert (closure_client.get_comment_inheritors(1)
+            == path_client.get_comment_inheritors(1))
+    assert (closure_client.get_comment_context(reply_id + 1)
+            == path_client.get_comment_context(reply_id + 1))
+
+
+def test_unknown_storage(database):
+    """Testing DBClient rejects unknown storage"""
+    with pytest.raises(ValueError):
+        DBClient(database, storage='nested_sets')
+
+
+@pytest.mark.usefixtures("database")
+def test_search_comments_index_is_synced(database):
+    """Testing full-text index follows added and changed comments"""
+    db_client = DBClient(database)
+    comment_id = db_client.add_comment(None, 'url_2', 'user_1', 'new text')
+    db_client.add_comments_bulk([{'parent_id': comment_id, 'user': 'user_2',
+                                  'comment': 'next text'}])
+    with Session(database) as session:
+        session.query(CommentsDB).filter_by(id=1).update(
+            {'comment': 'changed text'})
+        session.commit()
+
+    test_result = db_client.search_comments('text')
+
+    assert [row[1] for row in test_result] == [1, 7, 8]
+    assert db_client.search_comments('"text') == test_result
+    assert [row[1] for row in db_client.search_comments('first')] == [4, 6]
+
+
+@pytest.mark.usefixtures("database")
+def test_reply_activity(database):
+    """Testing counts and dates of inheritors are updated for every
+    ancestor of added comments"""
+    db_client = DBClient(database)
+    comments = [{'parent_id': 2, 'user': 'user_1', 'comment': 'a',
+                 'key': 'a', 'date': 30.0},
+                {'parent_key': 'a', 'user': 'user_2', 'comment': 'b',
+                 'key': 'b', 'date': 40.0},
+                {'parent_key': 'b', 'user': 'user_1', 'comment': 'c',
+                 'date': 35.0},
+                {'parent_id': 4, 'user': 'user_1', 'comment': 'd',
+                 'date': 1.0}]
+
+    first_ids = db_client.add_comments_bulk(comments[:3], chunk_size=2)
+    second_ids = db_client.add_comments_bulk(comments[3:])
+    with Session(database) as session:
+        activity = {row.id: (row.reply_count, row.last_activity)
+                    for row in session.query(CommentsDB)}
+    roots = db_client.get_url_inheritors('url_1', with_activity=True)
+
+    assert [activity[comment_id] for comment_id
+            in [1, 2, 3, 4, 5, *first_ids, *second_ids]] == [
+        (6, 40.0), (4, 40.0), (0, None), (1, 1.0), (0, None),
+        (2, 40.0), (1, 35.0), (0, None), (0, None)]
+    assert [row[-2:] for row in roots] == [(6, 40.0), (0, None)]
+
+
+@pytest.mark.usefixtures("database")
+def test_get_comment_context(database):
+    """Testing get_comment_context method selects siblings of every level
+    by one statement"""
+    db_client = DBClient(database)
+    comments = [{'parent_id': 2, 'user': 'user_1', 'comment': str(number)}
+                for number in range(4)]
+    comment_ids = db_client.add_comments_bulk(comments)
+
+    test_result = db_client.get_comment_context(comment_ids[2], siblings=1)
+
+    assert [row[1] for row in test_result] == [
+        1, 2, comment_ids[1], comment_ids[2], comment_ids[3], 3, 6]
+
+
+@pytest.mark.usefixtures("database")
+def test_get_updates(database):
+    """Testing get_updates method pages new comments by ID"""
+    db_client = DBClient(database)
+
+    first_page = db_client.get_updates('url_1', after=1, limit=2)
+    second_page = db_client.get_updates('url_1', after=first_page['cursor'],
+                                        limit=2)
+
+    assert [row[1] for row in first_page['rows']] == [2, 3]
+    assert [row[1] for row in second_page['rows']] == [5, 6]
+    assert second_page['cursor'] == 6
+    assert db_client.get_updates('url_5', after=0) == {
+        'Response': 'No results'}
+
+
+@pytest.mark.usefixtures("database")
+def test_get_new_comments(database):
+    """Testing get_new_comments method reads comments of every URL by ID"""
+    db_client = DBClient(database)
+
+    page = db_client.get_new_comments(after=3, limit=2)
+
+    assert db_client.get_new_comments() == {'rows': [], 'cursor': 6}
+    assert [(row['id'], row['url_id'], row['user'])
+            for row in page['rows']] == [(4, 2, 'user_2'), (5, 1, 'user_2')]
+    assert page['cursor'] == 5
+    assert db_client.get_new_comments(after=6)['rows'] == []
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from db_backend import engine as engine_module
+from db_backend.api_client import APIClient
+from db_backend.engine import create_db_engine
+
+
+@pytest.fixture
+def database_url(database_file):
+    """Get URL of fake database file"""
+    return str(database_file.url)
+
+
+def test_create_db_engine_sets_pragmas(database_url):
+    """Testing engine connections use write-ahead log and tuned cache"""
+    engine = create_db_engine(database_url)
+
+    with engine.connect() as connection:
+        journal_mode = connection.exec_driver_sql(
+            'PRAGMA journal_mode').scalar()
+        synchronous = connection.exec_driver_sql(
+            'PRAGMA synchronous').scalar()
+        cache_size = connection.exec_driver_sql('PRAGMA cache_size').scalar()
+
+    assert journal_mode == 'wal'
+    # NORMAL
+    assert synchronous == 1
+    assert cache_size < 0
+    assert engine.pool.size() == 5
+
+
+def test_create_db_engine_read_only(database_url):
+    """Testing read-only engine connections can not modify database"""
+    engine = create_db_engine(database_url, read_only=True)
+
+    with engine.connect() as connection:
+        count = connection.execute(
+            text('SELECT count(*) FROM comments')).scalar()
+        with pytest.raises(OperationalError):
+            connection.execute(text('DELETE FROM comments'))
+
+    assert count == 6
+
+
+def test_api_client_with_read_engine(database_url):
+    """Testing reads are served by read engine while writes go to
+    writing engine and are visible to following reads"""
+    engine = create_db_engine(database_url)
+    read_engine = create_db_engine(database_url, read_only=True)
+    api_client = APIClient(engine, read_engines=[read_engine])
+
+    with api_client._db_client.snapshot() as session:
+        first_result = api_client.get_url_comments('url_1')
+        snapshot_engine = session.get_bind()
+    api_client._db_client.add_comment(None, 'url_1', 'user_1', 'new')
+    second_result = api_client.get_url_comments('url_1')
+
+    assert snapshot_engine is read_engine
+    assert len(second_result) == len(first_result) + 1
+
+
+def test_reads_of_writing_engine_do_not_wait_for_writes(database_url,
+                                                        monkeypatch):
+    """Testing reads sent to writing engine do not take write lock"""
+    monkeypatch.setattr(engine_module, '_BUSY_TIMEOUT', 0)
+    engine = create_db_engine(database_url)
+    api_client = APIClient(engine)
+
+    with engine.begin() as connection:
+        connection.execute(text('UPDATE comments SET comment = comment'))
+        tree = api_client.get_comment_tree('url_1')
+        with api_client._db_client.primary_reads():
+            primary_tree = api_client.get_comment_tree('url_1')
+
+    assert tree == primary_tree
+    assert len(tree) == 2
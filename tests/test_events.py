@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+
+import pytest
+
+from db_backend.api_client import APIClient
+from db_backend.async_api_client import AsyncAPIClient
+from db_backend.db_client import DBClient
+from db_backend.events import EventHub, format_event
+
+
+def comment_row(comment_id, url_id):
+    """Create comments table row as it is passed to listeners"""
+    return {'id': comment_id, 'path': str(comment_id), 'parent_id': None,
+            'url_id': url_id, 'user': 'user_1', 'comment': 'new',
+            'date': 30.0}
+
+
+def test_publish_to_url_subscribers():
+    """Testing comments are delivered only to subscribers of their URL"""
+    hub = EventHub()
+    first = hub.subscribe(1)
+    second = hub.subscribe(1)
+    other = hub.subscribe(2)
+
+    hub.publish([comment_row(7, 1), comment_row(8, 1)])
+
+    assert [event['comment_id'] for event in first.get(0)] == [7, 8]
+    assert [event['comment_id'] for event in second.get(0)] == [7, 8]
+    assert other.get(0) == []
+
+
+def test_unsubscribe():
+    """Testing closed subscription is removed and receives nothing"""
+    hub = EventHub()
+    subscription = hub.subscribe(1)
+
+    hub.unsubscribe(subscription)
+    hub.publish([comment_row(7, 1)])
+
+    assert subscription.closed
+    assert subscription.get(0) == []
+    assert hub.subscribers_count() == 0
+
+
+def test_relay_skips_published():
+    """Testing comments read from database are not sent twice"""
+    hub = EventHub()
+    subscription = hub.subscribe(1)
+
+    hub.publish([comment_row(7, 1)])
+    hub.relay([comment_row(7, 1), comment_row(8, 1)])
+
+    assert [event['comment_id']
+            for event in subscription.get(0)] == [7, 8]
+
+
+def test_publish_skips_relayed():
+    """Testing comment read from database before it is published is
+    not sent twice"""
+    hub = EventHub()
+    subscription = hub.subscribe(1)
+
+    hub.relay([comment_row(7, 1)])
+    hub.publish([comment_row(7, 1), comment_row(8, 1)])
+
+    assert [event['comment_id']
+            for event in subscription.get(0)] == [7, 8]
+
+
+def test_format_event():
+    """Testing event is serialized in server-sent events format"""
+    event = {'path': '7', 'comment_id': 7, 'user': 'user_1',
+             'comment': 'new', 'date': 30.0, 'parent_id': None}
+
+    assert format_event(event) == (
+        'id: 7\nevent: comment\ndata: {"path":"7","comment_id":7,'
+        '"user":"user_1","comment":"new","date":30.0,"parent_id":null}'
+        '\n\n')
+
+
+@pytest.mark.usefixtures("database")
+def test_added_comment_is_published(database):
+    """Testing comment added with APIClient reaches URL subscribers"""
+    api_client = APIClient(database)
+    subscription = api_client.events.subscribe(api_client.get_url_id('url_1'))
+    request = '{"command": "add_comment", "parent_id": 1, "url": "url_1", ' \
+              '"user": "user_2", "comment": "new"}'
+
+    api_client.process_request(request)
+    events = subscription.get(0)
+
+    assert events == [{'path': api_client._pworker.encode('1.3'),
+                       'comment_id': 7, 'user': 'user_2', 'comment': 'new',
+                       'date': events[0]['date'], 'parent_id': 1}]
+    assert list(api_client.missed_events('url_1', 6)) == [events]
+
+
+@pytest.mark.usefixtures("database_file")
+def test_follow_other_process(database_file):
+    """Testing comments written by other client are relayed"""
+    hub = EventHub()
+    other_client = DBClient(database_file)
+    subscription = hub.subscribe(1)
+    stop = threading.Event()
+
+    thread = hub.follow(DBClient(database_file).get_new_comments,
+                        interval=0.01, after=6, stop=stop)
+    other_client.add_comment(1, 'url_1', 'user_1', 'relayed')
+    events = subscription.get(5)
+    stop.set()
+    thread.join(5)
+
+    assert [event['comment'] for event in events] == ['relayed']
+    assert not thread.is_alive()
+
+
+@pytest.mark.usefixtures("database_file")
+def test_follow_after_failed_read(database_file, caplog):
+    """Testing failed read is logged and repeated from the same cursor"""
+    hub = EventHub()
+    subscription = hub.subscribe(1)
+    db_client = DBClient(database_file)
+    stop = threading.Event()
+    reads = []
+
+    def fetch(**kwargs):
+        reads.append(kwargs)
+        if len(reads) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return db_client.get_new_comments(**kwargs)
+
+    with caplog.at_level(logging.ERROR, logger='db_backend.events'):
+        thread = hub.follow(fetch, interval=0.01, after=4, stop=stop)
+        events = subscription.get(5)
+        stop.set()
+        thread.join(5)
+
+    assert [event['comment_id'] for event in events] == [5, 6]
+    assert reads[:2] == [{'after': 4}, {'after': 4}]
+    assert 'database is locked' in caplog.text
+
+
+@pytest.mark.usefixtures("async_database")
+def test_async_subscription(async_database):
+    """Testing coroutine is woken up by comment added in other thread"""
+    api_client = AsyncAPIClient(async_database)
+    request = '{"command": "add_comment", "url": "url_2", ' \
+              '"user": "user_1", "comment": "new"}'
+
+    async def process():
+        url_id = await api_client.get_url_id('url_2')
+        subscription = api_client.events.subscribe_async(url_id)
+        waiting = asyncio.ensure_future(subscription.get(5))
+        await api_client.process_request(request)
+        return await waiting
+
+    events = asyncio.run(process())
+
+    assert [(event['comment_id'], event['user']) for event in events] == [
+        (7, 'user_1')]
+
+
+@pytest.mark.usefixtures("async_database")
+def test_follow_async_after_failed_read(async_database):
+    """Testing relaying task survives failed read"""
+    api_client = AsyncAPIClient(async_database)
+    hub = api_client.events
+    reads = []
+
+    async def fetch(**kwargs):
+        reads.append(kwargs)
+        if len(reads) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return await api_client._db_client.get_new_comments(**kwargs)
+
+    async def follow():
+        subscription = hub.subscribe_async(1)
+        task = asyncio.ensure_future(hub.follow_async(fetch, 0.01, after=5))
+        events = await subscription.get(5)
+        task.cancel()
+        return events
+
+    events = asyncio.run(follow())
+
+    assert [event['comment_id'] for event in events] == [6]
@@ -0,0 +1,29 @@
+from benchmarks.generator import generate_comments, zipf_weights
+
+
+def test_zipf_weights():
+    """Testing cumulative weights decrease with rank"""
+    test_result = zipf_weights(3, 1)
+
+    assert test_result == [1, 1.5, 1.5 + 1 / 3]
+
+
+def test_generate_comments():
+    """Testing generated forest is repeated by seed and every comment
+    answers comment going before it"""
+    comments = list(generate_comments(2000, seed=1, urls=10))
+    other_comments = list(generate_comments(2000, seed=1, urls=10))
+    depths = {}
+    for comment in comments:
+        parent = comment.get('parent_key')
+        if parent is None:
+            depths[comment['key']] = 1
+        else:
+            depths[comment['key']] = depths[parent] + 1
+
+    assert comments == other_comments
+    assert len(comments) == 2000
+    assert all(('url' in comment) != ('parent_key' in comment)
+               for comment in comments)
+    assert max(depths.values()) > 10
+    assert list(generate_comments(100, seed=2)) != comments[:100]
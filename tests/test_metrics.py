@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from db_backend.api_client import APIClient
+from db_backend.metrics import (Histogram, Metrics, command_scope,
+                                current_command)
+
+
+def test_histogram_render():
+    """Testing histogram buckets are cumulative in Prometheus format"""
+    histogram = Histogram('test_seconds', 'Test histogram', [0.1, 1])
+    correct_result = ['# HELP test_seconds Test histogram',
+                      '# TYPE test_seconds histogram',
+                      'test_seconds_bucket{command="a",le="0.1"} 1',
+                      'test_seconds_bucket{command="a",le="1"} 2',
+                      'test_seconds_bucket{command="a",le="+Inf"} 3',
+                      'test_seconds_sum{command="a"} 5.55',
+                      'test_seconds_count{command="a"} 3']
+
+    for value in (0.05, 0.5, 5):
+        histogram.observe('a', value)
+
+    assert histogram.render() == correct_result
+
+
+def test_command_scope():
+    """Testing command is known inside its block only"""
+    with command_scope('get_comment_tree'):
+        command = current_command()
+
+    assert command == 'get_comment_tree'
+    assert current_command() is None
+
+
+def test_track():
+    """Testing statistics of tracked block are added to histograms"""
+    metrics = Metrics()
+
+    with metrics.track('get_comment_tree') as stats:
+        stats.rows = 3
+        stats.response_size = 10
+
+    summary = metrics.summary()
+    assert summary['rows'] == {'get_comment_tree': (3, 1)}
+    assert summary['response_size'] == {'get_comment_tree': (10, 1)}
+
+
+@pytest.mark.usefixtures("database")
+def test_api_client_metrics(database):
+    """Testing statements, rows and response size are counted per
+    command, batch commands are counted separately"""
+    metrics = Metrics()
+    api_client = APIClient(database, metrics=metrics)
+    batch = [{'command': 'get_user_history', 'user': 'user_1'},
+             {'command': 'unknown'}]
+
+    response = api_client.process_request(
+        json.dumps({'command': 'get_comment_tree', 'url': 'url_1'}))
+    api_client.process_request(json.dumps(batch))
+    summary = metrics.summary()
+
+    assert summary['latency'].keys() == {'get_comment_tree',
+                                         'get_user_history', 'wrong'}
+    assert summary['statements']['get_comment_tree'][0] > 0
+    assert summary['rows']['get_comment_tree'] == (5, 1)
+    assert summary['rows']['get_user_history'] == (2, 1)
+    assert summary['response_size']['get_comment_tree'] == (len(response),
+                                                            1)
+    assert summary['statements']['wrong'] == (0, 1)
@@ -18,8 +18,8 @@ def test_child_path_creation_when_child_exists():
     Testing path incrementation when comment is adding
     to existing comment with child comments
     """
-    dummy_path = '1.45.100'
-    correct_path = '1.45.101'
+    dummy_path = PathWorker.encode('1.45.100')
+    correct_path = PathWorker.encode('1.45.101')
 
     test_result = PathWorker.next_child_path(dummy_path, first=False)
 
@@ -31,8 +31,8 @@ def test_child_path_creation_when_child_is_not_exists():
     Testing path incrementation when comment is adding
     to existing comment without child comments
     """
-    dummy_path = '1.45.100'
-    correct_path = '1.45.100.1'
+    dummy_path = PathWorker.encode('1.45.100')
+    correct_path = PathWorker.encode('1.45.100.1')
 
     test_result = PathWorker.next_child_path(dummy_path)
 
@@ -41,7 +41,7 @@ def test_child_path_creation_when_child_is_not_exists():
 
 def test_path_creation_when_there_is_no_comments():
     """Testing path incrementation when comment is first in the table"""
-    correct_path = '1'
+    correct_path = PathWorker.encode('1')
 
     test_result = PathWorker.next_path()
 
@@ -50,14 +50,34 @@ def test_path_creation_when_there_is_no_comments():
 
 def test_path_creation_when_comments_are_exists():
     """Testing path incrementation when comment is first level and not first"""
-    dummy_path = '4'
-    correct_path = '5'
+    dummy_path = PathWorker.encode('4')
+    correct_path = PathWorker.encode('5')
 
     test_result = PathWorker.next_path(dummy_path, first=False)
 
     assert test_result == correct_path
 
 
+def test_encode_node():
+    """Testing path node encoding keeps numbers order"""
+    numbers = [1, 2, 9, 10, 35, 36, 100, 1295, 1296, 10 ** 9]
+
+    encoded = [PathWorker.encode_node(number) for number in numbers]
+
+    assert encoded == sorted(encoded)
+    assert [PathWorker.decode_node(node) for node in encoded] == numbers
+
+
+def test_encode_decode_path():
+    """Testing path encoding is reversible and sorted in tree order"""
+    paths = ['1', '1.1', '1.1.10', '1.2', '1.10', '2', '10', '10.1']
+
+    encoded = [PathWorker.encode(path) for path in paths]
+
+    assert encoded == sorted(encoded)
+    assert [PathWorker.decode(path) for path in encoded] == paths
+
+
 def test_cut_paths():
     """Testing cut_paths method works correctly"""
     test_input = [['1.1', 'a'], ['1.2', 'b'], ['1.1.1', 'c']]
@@ -66,14 +86,18 @@ def test_cut_paths():
     test_output = PathWorker.cut_paths(test_input)
 
     assert test_output == correct_output
+    assert PathWorker.cut_paths([['1.1.2.1', 'd']], depth=2) == [['2.1', 'd']]
 
 
 def test_create_sorted_dict():
     """Testing create_sorted_dict method works correctly"""
-    test_input = [['2', 'a'], ['1', 'b'], ['2.1', 'c']]
+    test_input = [['1', 'b'], ['2', 'a'], ['2.1', 'c'], ['2.10', 'd']]
+    test_input = [[PathWorker.encode(path), *data]
+                  for path, *data in test_input]
     correct_output = {'1': {'letter': 'b', 'comments': {}},
                       '2': {'letter': 'a', 'comments':
-                            {'1': {'letter': 'c', 'comments': {}}}}}
+                            {'1': {'letter': 'c', 'comments': {}},
+                             '10': {'letter': 'd', 'comments': {}}}}}
     keys = ['letter']
 
     test_output = PathWorker.create_sorted_dict(test_input, keys)
@@ -87,6 +111,8 @@ def test_create_sorted_dict_with_long_nested_structure():
     with long nested structures
     """
     test_input = [['1', 'a'], ['1.1', 'b'], ['1.1.1', 'c']]
+    test_input = [[PathWorker.encode(path), *data]
+                  for path, *data in test_input]
     correct_output = {'1': {'letter': 'a', 'comments': {
                         '1': {'letter': 'b', 'comments':
                             {'1': {'letter': 'c', 'comments': {}}}}}}}
@@ -98,11 +124,35 @@ def test_create_sorted_dict_with_long_nested_structure():
     assert test_output == correct_output
 
 
+def test_create_sorted_dict_with_interleaved_branches():
+    """
+    Testing create_sorted_dict method attaches comments to their parents
+    when branches follow each other in path order
+    """
+    test_input = [['1', 'a'], ['1.1', 'b'], ['1.1.1', 'c'], ['1.2', 'd'],
+                  ['1.2.1', 'e'], ['3', 'f'], ['3.1', 'g']]
+    test_input = [[PathWorker.encode(path), *data]
+                  for path, *data in test_input]
+    correct_output = {
+        '1': {'letter': 'a', 'comments': {
+            '1': {'letter': 'b', 'comments': {
+                '1': {'letter': 'c', 'comments': {}}}},
+            '2': {'letter': 'd', 'comments': {
+                '1': {'letter': 'e', 'comments': {}}}}}},
+        '2': {'letter': 'f', 'comments': {
+            '1': {'letter': 'g', 'comments': {}}}}}
+    keys = ['letter']
+
+    test_output = PathWorker.create_sorted_dict(test_input, keys)
+
+    assert test_output == correct_output
+
+
 def test_create_sorted_dict_when_comment_is_one():
     """
     Testing create_sorted_dict method works correctly when comment is only one
     """
-    test_input = [['1', 'a']]
+    test_input = [[PathWorker.encode('1'), 'a']]
     correct_output = {'1': {'letter': 'a', 'comments': {}}}
     keys = ['letter']
 
@@ -122,3 +172,14 @@ def test_create_dict():
     test_output = PathWorker.create_dict(test_input, keys)
 
     assert test_output == correct_output
+
+
+def test_ancestor_paths():
+    """Testing ancestor_paths method works correctly"""
+    path = '11.1a.210'
+    correct_result = ['11', '11.1a']
+
+    test_result = PathWorker.ancestor_paths(path)
+
+    assert test_result == correct_result
+    assert PathWorker.ancestor_paths('11') == []
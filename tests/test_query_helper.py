@@ -37,9 +37,9 @@ def test_filter_by_time_when_start_and_end_defined(database):
 
 @pytest.mark.usefixtures("database")
 def test_child_path(database):
-    path = '1'
-    qhelper = QueryHelper({'filters': ''})
-    correct_result = [2, 3, 5]
+    path = PathWorker.encode('1')
+    qhelper = QueryHelper(PathWorker().filters)
+    correct_result = [2, 5, 3]
 
     with Session(database) as session:
         query = session.query(CommentsDB)
@@ -52,7 +52,7 @@ def test_child_path(database):
 
 @pytest.mark.usefixtures("database")
 def test_one_level_child_path(database):
-    path = '1'
+    path = PathWorker.encode('1')
     phelper = PathWorker()
     qhelper = QueryHelper(phelper.filters)
     correct_result = [2, 3]
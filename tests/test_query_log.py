@@ -0,0 +1,123 @@
+import logging
+import sqlite3
+
+import pytest
+from sqlalchemy.orm import Session
+
+from db_backend import query_log
+from db_backend.db_client import DBClient
+from db_backend.metrics import command_scope
+from db_backend.path_worker import PathWorker
+from db_backend.query_helper import QueryHelper
+from db_backend.query_log import assert_uses_index, query_plan
+
+
+@pytest.mark.usefixtures("database")
+def test_slow_query_log(database, caplog):
+    """Testing slow statements are logged with parameters, plan and
+    command"""
+    db_client = DBClient(database, slow_query_threshold=0)
+
+    with caplog.at_level(logging.WARNING, logger='db_backend.query_log'):
+        with command_scope('get_user_history'):
+            db_client.get_user_comments('user_2')
+    entries = [entry for entry in db_client.slow_query_log.entries
+               if entry.statement.startswith('SELECT')]
+
+    assert entries
+    assert all(entry.command == 'get_user_history' for entry in entries)
+    assert any('user_2' in entry.parameters for entry in entries)
+    assert all(entry.plan for entry in entries)
+    assert 'command get_user_history' in caplog.text
+
+
+@pytest.mark.usefixtures("database")
+def test_slow_query_log_when_disabled(database):
+    """Testing statements are not measured by default"""
+    db_client = DBClient(database)
+
+    assert db_client.slow_query_log is None
+
+
+@pytest.mark.usefixtures("database")
+def test_query_helper_uses_indexes(database):
+    """Testing QueryHelper filters are served by indexes"""
+    pworker = PathWorker()
+    qhelper = QueryHelper(pworker.filters)
+
+    with Session(database) as session:
+        query = qhelper.get_base_query(session)
+        assert_uses_index(session, qhelper.first_children(1, [1, 2], 3),
+                          'ix_comments_url_id_parent_id_path')
+        assert_uses_index(session, qhelper.child_path(query, '11'))
+        assert_uses_index(session, qhelper.one_level_child_path(query, '11'))
+        assert_uses_index(session, qhelper.first_level_path(query))
+        plan = query_plan(session, qhelper.first_children(1, [None, 1], 3))
+        # Every parent is read by range over index with limit
+        assert [line for line in plan if ' comments ' in line] == [
+            'SEARCH comments USING INDEX ix_comments_url_id_parent_id_path '
+            '(url_id=? AND parent_id=?)'] * 2
+
+
+@pytest.mark.usefixtures("database")
+def test_assert_uses_index_when_table_is_scanned(database):
+    """Testing filter without index is reported"""
+    qhelper = QueryHelper(PathWorker().filters)
+
+    with Session(database) as session:
+        query = qhelper._filter_by_time(qhelper.get_base_query(session),
+                                        start=20.)
+        plan = query_plan(session, query)
+        with pytest.raises(AssertionError):
+            assert_uses_index(session, query)
+
+    assert any(line.startswith('SCAN') for line in plan)
+
+
+@pytest.mark.usefixtures("database")
+def test_slow_query_log_bulk_insert(database):
+    """Testing statements with many parameters sets are explained by the
+    first set and logging never fails statement"""
+    db_client = DBClient(database, slow_query_threshold=0)
+    comments = [{'url': 'url_1', 'user': 'user_1', 'comment': str(number)}
+                for number in range(3)]
+
+    comment_ids = db_client.add_comments_bulk(comments)
+    inserts = [entry for entry in db_client.slow_query_log.entries
+               if entry.statement.startswith('INSERT INTO comments')]
+
+    assert len(comment_ids) == 3
+    assert inserts
+
+
+@pytest.mark.usefixtures("database")
+def test_slow_query_log_many_parameters_sets(database):
+    """Testing statement reported with list of parameters sets is
+    explained with the first of them"""
+    db_client = DBClient(database, slow_query_threshold=0)
+    statement = 'SELECT id FROM comments WHERE url_id = ? AND depth = ?'
+
+    with database.connect() as connection:
+        db_client.slow_query_log._add(connection, 1.0, statement,
+                                      [(1, 1), (2, 1)])
+    entry = db_client.slow_query_log.entries[-1]
+
+    assert entry.parameters == [(1, 1), (2, 1)]
+    assert entry.plan
+
+
+@pytest.mark.usefixtures("database")
+def test_slow_query_log_explain_error(database, caplog, monkeypatch):
+    """Testing statement is not failed when its plan is not available"""
+    def explain(*args):
+        raise sqlite3.OperationalError('plan is not available')
+
+    monkeypatch.setattr(query_log, '_explain', explain)
+    db_client = DBClient(database, slow_query_threshold=0)
+
+    with caplog.at_level(logging.ERROR, logger='db_backend.query_log'):
+        test_result = db_client.get_user_comments('user_2')
+
+    assert test_result
+    assert all(entry.plan == [] for entry in db_client.slow_query_log.entries)
+    assert 'plan is not available' in caplog.text